@@ -0,0 +1,321 @@
+##
+##  Daily update of the stored NAV histories from AMFI's bulk NAV file
+##
+##  AMFI (the Association of Mutual Funds in India) publishes every scheme's latest NAV in
+##  one semicolon-delimited text file (https://www.amfiindia.com/spages/NAVAll.txt):
+##
+##      Scheme Code;ISIN Div Payout/ ISIN Growth;ISIN Div Reinvestment;Scheme Name;Net Asset Value;Date
+##
+##      Open Ended Schemes(Debt Scheme - Banking and PSU Fund)
+##
+##      Aditya Birla Sun Life Mutual Fund
+##
+##      119551;INF209KA12Z1;INF209KA13Z9;Aditya Birla Sun Life Banking & PSU Debt Fund - DIRECT - IDCW;105.1830;17-Oct-2026
+##
+##  The file is read in one streaming pass, keeping only the scheme rows. Every scheme that
+##  the NAV cache (and, if given, the NAV store) already holds then gets its new NAV appended,
+##  so that a nightly refresh of the whole universe costs one download instead of one request
+##  per scheme.
+##
+##  A NAV is only appended if no business day is missing between the newest stored NAV and
+##  the new one. Otherwise the scheme is reported as having a gap: its history has to be
+##  backfilled from mfapi.in (with --backfill, or later), and appending the new NAV alone would
+##  hide the gap. The business days are Monday to Friday, less any holidays given.
+##
+##  A cache entry that is brought up to date (or already was) counts as just fetched, so that
+##  plot_mutual_funds.py uses it without asking mfapi.in again until it is older than the
+##  cache's max age.
+##
+##  Usage:
+##
+##      python amfi_update.py [SOURCE] [--cache-dir DIR] [--store STORE_DIR] [--no-cache]
+##          [--holidays FILE] [--gaps-file FILE] [--backfill [--base-url URL]]
+##
+##  SOURCE is the URL or the path of the bulk file; by default it is downloaded from AMFI.
+##
+
+import argparse
+import contextlib
+import datetime
+import logging
+import sys
+import time
+
+import numpy
+import requests
+
+from bulk_ingest import DEFAULT_BASE_URL
+from nav_cache import NavCache, DEFAULT_CACHE_DIR, date_key
+from nav_fetcher import NavFetcher, DEFAULT_TIMEOUT
+from nav_parser import parse_nav_payload, NavParseError
+from nav_store import NavStore
+
+logger = logging.getLogger(__name__)
+
+AMFI_NAV_URL = 'https://www.amfiindia.com/spages/NAVAll.txt'
+AMFI_DATE_FORMAT = '%d-%b-%Y'   # e.g. 17-Oct-2026
+AMFI_FIELDS = 6                 # Scheme code, two ISINs, scheme name, NAV, date
+STORE_LOOKBACK_DAYS = 31        # How far back a stored scheme's newest NAV is looked for
+
+@contextlib.contextmanager
+def open_bulk_file(source, timeout=DEFAULT_TIMEOUT):
+    """Yields the lines of the bulk NAV file at a URL or a local path, as they are read."""
+    if source.startswith(('http://', 'https://')):
+        with requests.get(source, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            response.encoding = response.encoding or 'utf-8'
+            yield response.iter_lines(decode_unicode=True)
+    else:
+        with open(source, 'r', encoding='utf-8', errors='replace') as f:
+            yield f
+
+def parse_bulk_navs(lines):
+    """
+    Parses the scheme rows of AMFI's bulk NAV file; the headings and blank lines are skipped.
+
+    Parameters:
+    lines (iterable of str): The lines of the file.
+
+    Returns:
+    dict: For each scheme code, (datetime64[D] date, NAV as text, scheme name). Rows without a
+    usable NAV (e.g. 'N.A.') or date are left out; if a scheme has several rows, the newest counts.
+    """
+    navs = {}
+    dates = {}        # Parsed dates by their text, as most rows share one or two dates
+    skipped = 0
+    for line in lines:
+        fields = line.strip().split(';')
+        if len(fields) != AMFI_FIELDS or not fields[0].strip().isdigit():
+            continue
+        code, name, nav, date = fields[0].strip(), fields[3].strip(), fields[4].strip(), fields[5].strip()
+        try:
+            if not float(nav) > 0:
+                raise ValueError(nav)
+            if date not in dates:
+                dates[date] = numpy.datetime64(datetime.datetime.strptime(date, AMFI_DATE_FORMAT).date(), 'D')
+        except ValueError:
+            skipped += 1
+            continue
+        if code not in navs or dates[date] > navs[code][0]:
+            navs[code] = (dates[date], nav, name)
+    logger.info(f"Read the NAVs of {len(navs)} schemes, dated {', '.join(sorted(dates))}; " \
+                f"skipped {skipped} row(s) without a usable NAV or date")
+    return navs
+
+def read_holidays(path):
+    """Reads market holidays, one 'yyyy-mm-dd' date per line; '#' starts a comment."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return numpy.array([line.split('#')[0].strip() for line in f if line.split('#')[0].strip()], \
+                           dtype='datetime64[D]')
+
+def has_gap(newest_dates, new_dates, holidays):
+    """Tells whether business days are missing between stored and new NAV dates (arrays)."""
+    return numpy.busday_count(newest_dates + 1, new_dates, holidays=holidays) > 0
+
+class UpdateReport:
+    def __init__(self, target):
+        self.target = target
+        self.appended = 0      # Schemes that got a new NAV
+        self.current = 0       # Schemes that already had the file's NAV
+        self.gaps = []         # Codes of the schemes that need a backfill
+        self.absent = 0        # Stored schemes without a NAV in the file
+        self.unknown = 0       # Schemes in the file that are not stored
+
+    def log(self):
+        logger.info(f"{self.target}: appended {self.appended} NAV(s), {self.current} already " \
+                    f"current, {len(self.gaps)} with a gap, {self.absent} not in the file, " \
+                    f"{self.unknown} in the file but not stored")
+# End class UpdateReport
+
+def update_cache(cache, bulk_navs, holidays=None, codes=None):
+    """
+    Prepends the new NAVs to the histories in the NAV cache.
+
+    Parameters:
+    cache (NavCache): The cache whose entries are updated.
+    bulk_navs (dict): The parsed bulk file (see parse_bulk_navs).
+    holidays (numpy datetime64[D] array): Weekdays without NAVs.
+    codes (list of str): The schemes to update; None means every cached scheme.
+
+    Returns:
+    UpdateReport: What was done.
+    """
+    holidays = numpy.array([], dtype='datetime64[D]') if holidays is None else holidays
+    report = UpdateReport('NAV cache')
+    if codes is None:
+        codes = cache.scheme_codes()
+    report.unknown = len(bulk_navs.keys() - set(codes))
+    for code in codes:
+        if code not in bulk_navs:
+            report.absent += 1
+            continue
+        date, nav, _ = bulk_navs[code]
+        entry = cache.load(code)
+        rows = [] if entry is None else entry.get('data', [])
+        if not rows:
+            report.gaps.append(code)
+            continue
+        # Cached rows are newest first
+        row = {'date': date.item().strftime('%d-%m-%Y'), 'nav': nav}
+        newest = rows[0]['date']
+        if date_key(newest) >= date_key(row['date']):
+            report.current += 1
+        elif has_gap(numpy.datetime64(f"{newest[6:10]}-{newest[3:5]}-{newest[0:2]}"), date, holidays):
+            report.gaps.append(code)
+            continue
+        else:
+            rows.insert(0, row)
+            report.appended += 1
+        # The entry is as new as a fetch would make it, so it stays fresh for the cache's max age
+        entry['fetched_at'] = time.time()
+        cache.store(code, entry)
+    return report
+
+def update_store(store, bulk_navs, holidays=None, lookback_days=STORE_LOOKBACK_DAYS):
+    """
+    Writes the new NAVs into a NAV store (opened with mode 'r+'), extending its dates as needed.
+
+    Parameters:
+    store (NavStore): The store to update.
+    bulk_navs (dict): The parsed bulk file (see parse_bulk_navs).
+    holidays (numpy datetime64[D] array): Weekdays without NAVs.
+    lookback_days (int): A scheme whose newest NAV is older than this, before its new NAV, is
+    reported as having a gap.
+
+    Returns:
+    UpdateReport: What was done.
+    """
+    holidays = numpy.array([], dtype='datetime64[D]') if holidays is None else holidays
+    report = UpdateReport('NAV store')
+    known = [code for code in bulk_navs if code in store.columns]
+    report.unknown = len(bulk_navs) - len(known)
+    report.absent = len(store.scheme_codes) - len(known)
+    if not known:
+        return report
+    columns = numpy.array(store.column_indices(known))
+    new_dates = numpy.array([bulk_navs[code][0] for code in known])
+    new_rows = (new_dates - store.epoch).astype(numpy.int64)
+    store.extend(new_dates.max())
+
+    # Each scheme's newest stored NAV, from the last few weeks of the store
+    first_row = max(int(new_rows.min()) - lookback_days, 0)
+    valid = ~numpy.isnan(store.navs[first_row:, columns])
+    stored = valid.any(axis=0)
+    newest_rows = first_row + len(valid) - 1 - numpy.argmax(valid[::-1], axis=0)
+    current = stored & (newest_rows >= new_rows)
+    gap = ~current & (~stored | has_gap(store.epoch + newest_rows, new_dates, holidays))
+    append = ~current & ~gap
+
+    navs = numpy.array([float(bulk_navs[code][1]) for code in known])
+    store.navs[new_rows[append], columns[append]] = navs[append]
+    store.flush()
+    report.appended = int(numpy.count_nonzero(append))
+    report.current = int(numpy.count_nonzero(current))
+    report.gaps = [known[i] for i in numpy.flatnonzero(gap)]
+    return report
+
+def update(cache, store, bulk_navs, holidays=None, codes=None, log=True):
+    """
+    Updates the NAV cache and the NAV store (either may be None) from the parsed bulk file.
+
+    Returns:
+    list of str: The codes of the schemes that need a backfill, in either of them.
+    """
+    reports = []
+    if cache is not None:
+        reports.append(update_cache(cache, bulk_navs, holidays, codes))
+    if store is not None:
+        reports.append(update_store(store, bulk_navs if codes is None else \
+                                    {code: bulk_navs[code] for code in codes}, holidays))
+    if log:
+        for report in reports:
+            report.log()
+    return sorted(set(code for report in reports for code in report.gaps))
+
+def backfill(codes, cache, store=None, base_url=DEFAULT_BASE_URL):
+    """
+    Fetches the whole histories of the schemes with gaps through the NAV cache, merging them
+    into the cached histories, and rewrites their columns of the NAV store, if given.
+
+    Returns:
+    list of str: The codes of the schemes that could not be fetched.
+    """
+    base_url = base_url.rstrip('/')
+    with NavFetcher() as fetcher:
+        payloads = cache.fetch_all([f"{base_url}/{code}" for code in codes], codes, fetcher)
+    failed = []
+    histories = []
+    for code, payload in zip(codes, payloads):
+        try:
+            if payload is None:
+                raise NavParseError("no data")
+            histories.append((code, *parse_nav_payload(payload)[1:]))
+        except NavParseError as e:
+            logger.warning(f"Cannot backfill scheme {code}: {e}")
+            failed.append(code)
+    if store is not None and histories:
+        store.extend(max(dates.max() for _, dates, _ in histories))
+        for code, dates, navs in histories:
+            if code not in store.columns:
+                continue
+            in_range = dates >= store.epoch
+            store.write_fund(store.columns[code], dates[in_range], navs[in_range])
+        store.flush()
+    logger.info(f"Fetched the histories of {len(codes) - len(failed)} of {len(codes)} scheme(s)")
+    return failed
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    logging.getLogger('nav_fetcher').setLevel(logging.ERROR)
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Append the day's NAVs from AMFI's bulk NAV file " \
+                                     "to the stored NAV histories.")
+    parser.add_argument('source', type=str, nargs='?', default=AMFI_NAV_URL, \
+                        help='URL or path of the bulk NAV file (default: AMFI\'s NAVAll.txt)')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR, \
+                        help='Directory of the on-disk NAV cache')
+    parser.add_argument('--no-cache', action='store_true', \
+                        help='Do not update the NAV cache (e.g. to update only the NAV store)')
+    parser.add_argument('--store', type=str, default=None, \
+                        help='Directory of a NAV store to update as well')
+    parser.add_argument('--holidays', type=str, default=None, \
+                        help="File of market holidays ('yyyy-mm-dd', one per line) for gap detection")
+    parser.add_argument('--gaps-file', type=str, default=None, \
+                        help='Write the codes of the schemes that need a backfill to this file')
+    parser.add_argument('--backfill', action='store_true', \
+                        help='Fetch the whole histories of the schemes with gaps from the web service')
+    parser.add_argument('--base-url', type=str, default=DEFAULT_BASE_URL, \
+                        help='The web service from which --backfill fetches histories')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, \
+                        help='Seconds to wait for the bulk file to start arriving')
+    args = parser.parse_args()
+
+    try:
+        holidays = None if args.holidays is None else read_holidays(args.holidays)
+        with open_bulk_file(args.source, args.timeout) as lines:
+            bulk_navs = parse_bulk_navs(lines)
+        if not bulk_navs:
+            raise ValueError(f"No scheme NAVs found in {args.source}")
+
+        cache = NavCache(args.cache_dir, max_age=0)
+        store = None if args.store is None else NavStore(args.store, mode='r+')
+        gaps = update(None if args.no_cache else cache, store, bulk_navs, holidays)
+        if args.backfill and gaps:
+            backfill(gaps, cache, store, args.base_url)
+            # The backfilled histories may now reach the day before the file's NAVs
+            gaps = update(None if args.no_cache else cache, store, bulk_navs, holidays, codes=gaps, \
+                          log=False)
+        if args.gaps_file is not None:
+            with open(args.gaps_file, 'w', encoding='utf-8') as f:
+                f.writelines(f"{code}\n" for code in gaps)
+            logger.info(f"Wrote the {len(gaps)} scheme(s) that need a backfill to {args.gaps_file}")
+        if gaps:
+            logger.warning(f"{len(gaps)} scheme(s) need a backfill" + \
+                           ("" if args.backfill else "; rerun with --backfill"))
+    except (OSError, KeyError, ValueError, requests.RequestException) as e:
+        logger.critical(e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+##
+##  Headless rendering of many plot configurations at once
+##
+##  Renders the chart of each TOML configuration file (the same files that
+##  plot_mutual_funds.py reads) to a PNG or SVG file, without a window, e.g. for nightly
+##  charts. The NAVs of every fund named in any of the configurations are fetched once,
+##  through the NAV cache, and packed into one memory-mapped NAV store (or an existing store
+##  is used as is). The charts are then rendered in a pool of processes, each of which maps
+##  that same store, so the data is neither fetched nor loaded once per chart.
+##
+##  Usage:
+##
+##      python batch_render.py config.toml config_interesting.toml ... --out-dir charts
+##          [--format svg] [--norm-date dd-mm-yyyy] [--min-date dd-mm-yyyy] [--max-date dd-mm-yyyy]
+##          [--log-scale] [--jobs 4] [--store STORE_DIR | --cache-dir DIR [--offline]]
+##
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from nav_cache import scheme_code_from_url
+from nav_store import NavStore, build_store_from_cache
+from nav_data import read_fund_config, parse_date, add_source_arguments, open_cache, \
+                     fetch_payloads, forward_fill
+from plot_lod import decimate
+from chart import FIGURE_SIZE, normalize_window, plot_nav_lines, add_norm_date_line, format_log_axis, \
+                  label_chart
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS = os.cpu_count() or 1
+DEFAULT_DPI = 100
+
+store = None                   # Each worker process's mapping of the shared NAV store
+
+def prepare_store(configs, args):
+    """
+    Fetches the NAVs of all the funds of all the configurations, once, through the NAV cache,
+    and packs them into a NAV store in `args.store_dir`.
+    """
+    urls = list(dict.fromkeys(url for config_urls, _, _ in configs for url in config_urls))
+    labels = [scheme_code_from_url(url) for url in urls]
+    logger.info(f"Fetching NAV data for {len(urls)} distinct funds")
+    cache = open_cache(args)
+    fetch_payloads(urls, labels, cache, args)
+    return build_store_from_cache(args.store_dir, cache, labels)
+
+def open_worker_store(directory):
+    # Runs once in each worker process; the pages of the mapping are shared between processes
+    global store
+    store = NavStore(directory)
+
+def render_chart(job):
+    """
+    Renders one configuration's chart in a worker process.
+
+    Parameters:
+    job (dict): The configuration's path, funds, output path, dates and rendering options.
+
+    Returns:
+    tuple: (configuration path, output path or None, seconds taken, funds plotted, error or None)
+    """
+    started = time.perf_counter()
+    config_path = job['config']
+    codes = [scheme_code_from_url(url) for url in job['urls']]
+    funds = [(code, label, color) for code, label, color \
+             in zip(codes, job['labels'], job['colors']) if code in store.columns]
+    if not funds:
+        return config_path, None, time.perf_counter() - started, 0, "none of its funds have NAVs"
+
+    dates, navs = store.slice([code for code, _, _ in funds])
+    valid_rows = numpy.flatnonzero(~numpy.isnan(navs).all(axis=1))
+    # Like the interactive plot, start at the first date on which any fund has a NAV
+    first_row, last_row = valid_rows[0], valid_rows[-1]
+    if job['min_date'] is not None:
+        first_row = max(first_row, store.day_offset(job['min_date']))
+    if job['max_date'] is not None:
+        last_row = min(last_row, store.day_offset(job['max_date']))
+    if last_row <= first_row:
+        return config_path, None, time.perf_counter() - started, 0, "the date range is empty"
+    base_row = first_row if job['norm_date'] is None else \
+        min(max(store.day_offset(job['norm_date']), first_row), last_row)
+
+    daily_navs = forward_fill(navs[valid_rows[0]:last_row + 1])
+    normalized = normalize_window(daily_navs, first_row - valid_rows[0], last_row - valid_rows[0], \
+                                  base_row - valid_rows[0])
+    x = mdates.date2num(dates[first_row:last_row + 1].astype('datetime64[ns]'))
+
+    # The same chart as the interactive plot's, without its widgets (see chart.py)
+    fig = Figure(figsize=FIGURE_SIZE, dpi=job['dpi'])
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    plotted_x, plotted_y = decimate(x, normalized, ax.bbox.width)
+    plot_nav_lines(ax, plotted_x, plotted_y, [label for _, label, _ in funds], [color for _, _, color in funds])
+    add_norm_date_line(ax, x[base_row - first_row])
+    ax.xaxis_date()
+    if job['log_scale']:
+        ax.set_yscale('log')
+        format_log_axis(ax)
+    label_chart(ax)
+    fig.savefig(job['output'], format=job['format'])
+    return config_path, job['output'], time.perf_counter() - started, len(funds), None
+
+def render_all(jobs, store_directory, n_processes):
+    """Renders the charts in a pool of processes and logs the time taken by each one."""
+    started = time.perf_counter()
+    n_rendered = 0
+    with ProcessPoolExecutor(max_workers=n_processes, initializer=open_worker_store, \
+                             initargs=(store_directory,)) as executor:
+        for config_path, output, elapsed, n_funds, error in executor.map(render_chart, jobs):
+            if error is None:
+                n_rendered += 1
+                logger.info(f"{config_path}: {n_funds} funds rendered to {output} in {elapsed:.2f} s")
+            else:
+                logger.warning(f"{config_path}: not rendered, because {error}")
+    total = time.perf_counter() - started
+    logger.info(f"Rendered {n_rendered} of {len(jobs)} charts in {total:.2f} s " \
+                f"({n_rendered / total:.2f} charts/s) with {n_processes} process(es)")
+    return n_rendered
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    logging.getLogger('nav_fetcher').setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Render the charts of many configuration files " \
+                                                 "without a window.")
+    parser.add_argument('configs', type=str, nargs='+', help='Paths to TOML configuration files')
+    parser.add_argument('--out-dir', type=str, default='.', help='Directory for the rendered charts')
+    parser.add_argument('--format', type=str, choices=['png', 'svg'], default='png', \
+                        help='The format of the rendered charts')
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI, help='Resolution of PNG charts')
+    parser.add_argument('--norm-date', type=parse_date, default=None, \
+                        help='Date (dd-mm-yyyy) at which all NAVs are normalized to 100')
+    parser.add_argument('--min-date', type=parse_date, default=None, \
+                        help='Earliest date (dd-mm-yyyy) of the charts')
+    parser.add_argument('--max-date', type=parse_date, default=None, \
+                        help='Latest date (dd-mm-yyyy) of the charts')
+    parser.add_argument('--log-scale', action='store_true', help='Use a logarithmic y-axis')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS, \
+                        help='The number of charts rendered at once, each in its own process')
+    add_source_arguments(parser)
+    parser.add_argument('--store-dir', type=str, default=None, \
+                        help='Keep the NAV store built for this run in this directory')
+    args = parser.parse_args()
+
+    try:
+        configs = [read_fund_config(path) for path in args.configs]
+    except (OSError, ValueError) as e:
+        logger.critical(e)
+        sys.exit(1)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    temporary_store = None
+    try:
+        if args.store is not None:
+            store_directory = args.store
+        else:
+            if args.store_dir is None:
+                temporary_store = tempfile.mkdtemp(prefix='nav_store_')
+                args.store_dir = temporary_store
+            try:
+                store_directory = prepare_store(configs, args).directory
+            except ValueError as e:
+                logger.critical(f"Cannot build the NAV store: {e}")
+                sys.exit(1)
+
+        jobs = []
+        for path, (urls, labels, colors) in zip(args.configs, configs):
+            name = os.path.splitext(os.path.basename(path))[0]
+            jobs.append({
+                'config': path,
+                'urls': urls,
+                'labels': labels,
+                'colors': colors,
+                'output': os.path.join(args.out_dir, f"{name}.{args.format}"),
+                'format': args.format,
+                'dpi': args.dpi,
+                'norm_date': args.norm_date,
+                'min_date': args.min_date,
+                'max_date': args.max_date,
+                'log_scale': args.log_scale,
+            })
+        n_rendered = render_all(jobs, store_directory, max(1, min(args.jobs, len(jobs))))
+    finally:
+        if temporary_store is not None:
+            shutil.rmtree(temporary_store, ignore_errors=True)
+    if n_rendered < len(jobs):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+##
+##  Benchmark: the memory and the window reads of compact NAV storage (see compact_navs.py)
+##
+##  Loads a synthetic universe (see synthetic_universe.py) into a FundDataManager three times:
+##  with the calendar-daily matrices of the plot, and with compact float64 and float32 storage.
+##  For each, the bytes held for the NAVs, the time to load and normalize them, and the time to
+##  read a normalized window of a random date range (what each recompute of the plot does) are
+##  printed, with the largest error of the compact windows against the calendar-daily ones, on
+##  a sample of the funds and the date ranges.
+##
+##  Usage:
+##
+##      python benchmarks/bench_compact_navs.py [--funds 5000] [--windows 200]
+##
+
+import argparse
+import os
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import plot_mutual_funds as pmf
+from synthetic_universe import SyntheticUniverse
+
+CHECKED_WINDOWS = 10   # Date ranges whose windows are compared with the calendar-daily ones
+CHECKED_FUNDS = 100    # Funds compared in each of those windows
+
+def load(universe, dtype):
+    """Loads a universe as plot_mutual_funds.py does, compact if a dtype is given."""
+    pmf.FundDataManager._instance = None
+    fdm = pmf.FundDataManager()
+    if dtype is not None:
+        fdm.use_compact_storage(dtype)
+    for i, code in enumerate(universe.scheme_codes):
+        _, rows, navs = universe.fund(i)
+        fdm.add_fund(code, universe.trading_days[rows], navs)
+    fdm.normalize_all_fund_data()
+    return fdm
+
+def read_window(fdm, first, last):
+    base = fdm.day_offset(first)
+    return fdm.normalized_window(base, fdm.day_offset(last), base)
+
+def time_windows(fdm, ranges):
+    """Returns the seconds per normalized window of some date ranges."""
+    started = time.perf_counter()
+    for first, last in ranges:
+        read_window(fdm, first, last)
+    return (time.perf_counter() - started) / len(ranges)
+
+def window_error(fdm, ranges, funds, dense_windows):
+    """Returns the largest relative error of compact windows against calendar-daily ones."""
+    calendar = fdm.compact.calendar
+    error = 0.0
+    for (first, last), dense_window in zip(ranges, dense_windows):
+        # The compact windows have a row per business day; compare them at those days
+        window = read_window(fdm, first, last)[:, funds]
+        first_row = fdm.day_offset(first)
+        days = (calendar[first_row:first_row + len(window)] - numpy.datetime64(first, 'D')).astype(numpy.int64)
+        with numpy.errstate(invalid='ignore'):
+            error = max(error, numpy.nanmax(numpy.abs(window / dense_window[days] - 1.0), initial=0.0))
+    return error
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare calendar-daily and compact NAV storage.')
+    parser.add_argument('--funds', type=int, default=5000, help='Funds in the synthetic universe')
+    parser.add_argument('--windows', type=int, default=200, help='Normalized windows read per storage')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    universe = SyntheticUniverse(args.funds, seed=args.seed)
+    days = universe.trading_days
+    rng = numpy.random.default_rng(args.seed)
+    starts = rng.integers(0, len(days) - 250, args.windows)
+    ranges = [(days[start], days[rng.integers(start + 250, len(days))]) for start in starts]
+    print(f"{args.funds} funds over {len(days)} trading days, {args.windows} windows")
+
+    funds = numpy.sort(rng.choice(args.funds, min(CHECKED_FUNDS, args.funds), replace=False))
+    checked = ranges[:CHECKED_WINDOWS]
+
+    dense_windows = None
+    for dtype in (None, 'float64', 'float32'):
+        started = time.perf_counter()
+        fdm = load(universe, dtype)
+        loaded = time.perf_counter() - started
+        nbytes, _ = fdm.get_storage_nbytes()
+        line = f"{dtype or 'calendar-daily':<15} {nbytes / 1e6:8.1f} MB, load {loaded:6.2f} s, " \
+               f"window {time_windows(fdm, ranges) * 1e3:7.2f} ms"
+        if dense_windows is None:
+            dense_windows = [read_window(fdm, first, last)[:, funds] for first, last in checked]
+            dense_nbytes = nbytes
+        else:
+            line += f", {dense_nbytes / nbytes:5.1f}x smaller, " \
+                    f"max relative error {window_error(fdm, checked, funds, dense_windows):.1e}"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+##
+##  Micro-benchmark: the fast NAV parser against the original pandas parsing path
+##
+##  Builds synthetic mfapi.in-shaped payloads of increasing length and times, for each,
+##
+##    pandas:  response.json(), a DataFrame of string records, pandas.to_datetime and
+##             astype(float), as `main()` used to do, and
+##    fast:    nav_parser.parse_nav_payload on the raw response bytes.
+##
+##  Usage:
+##
+##      python benchmarks/bench_nav_parser.py [--repeat 5]
+##
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy
+import pandas
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nav_parser import parse_nav_payload
+
+def synthetic_payload(n_rows, seed=0):
+    """Returns the bytes of an mfapi.in-style response with `n_rows` NAVs, newest first."""
+    rng = numpy.random.default_rng(seed)
+    navs = 10.0 * numpy.cumprod(1.0 + rng.normal(0.0004, 0.01, n_rows))
+    first_day = date(2024, 6, 14) - timedelta(days=n_rows - 1)
+    rows = [{'date': (first_day + timedelta(days=i)).strftime('%d-%m-%Y'), 'nav': f"{nav:.5f}"} \
+            for i, nav in enumerate(navs)]
+    rows.reverse()
+    payload = {'meta': {'scheme_code': 100000, 'scheme_name': 'Synthetic'}, 'data': rows, \
+               'status': 'SUCCESS'}
+    return json.dumps(payload).encode()
+
+def parse_with_pandas(raw):
+    fund_data = json.loads(raw)
+    df = pandas.DataFrame(fund_data['data'])
+    df['date'] = pandas.to_datetime(df['date'], format='%d-%m-%Y')
+    df.set_index('date', inplace=True)
+    df['nav'] = df['nav'].astype(float)
+    return df
+
+def best_time(function, argument, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the fast NAV parser with the pandas path.")
+    parser.add_argument('--repeat', type=int, default=5, help='Timing runs per case; the best is kept')
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'bytes':>10} {'pandas (ms)':>12} {'fast (ms)':>10} {'speed-up':>9}")
+    for n_rows in [1_000, 10_000, 100_000, 300_000]:
+        raw = synthetic_payload(n_rows)
+        # Both parsers must agree before their times mean anything
+        _, dates, navs = parse_nav_payload(raw)
+        df = parse_with_pandas(raw).sort_index()
+        assert numpy.array_equal(dates.astype('datetime64[ns]'), df.index.values.astype('datetime64[ns]'))
+        assert numpy.array_equal(navs, df['nav'].values)
+
+        pandas_time = best_time(parse_with_pandas, raw, args.repeat)
+        fast_time = best_time(parse_nav_payload, raw, args.repeat)
+        print(f"{n_rows:>8} {len(raw):>10} {pandas_time * 1e3:>12.2f} {fast_time * 1e3:>10.2f} " \
+              f"{pandas_time / fast_time:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
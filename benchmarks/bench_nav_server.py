@@ -0,0 +1,111 @@
+##
+##  Benchmark: the latency of nav_server.py under many concurrent clients
+##
+##  Serves a synthetic universe (see synthetic_universe.py) with a NavServer in this process,
+##  and runs many clients at once, each on its own keep-alive connection, each sending its
+##  requests one after another. Three workloads are timed:
+##
+##    series, cached:    every client asks for one of a few /series responses, which are built
+##                       once and then answered from the response cache;
+##    series, uncached:  every request asks for a different date range of a few funds;
+##    nav:               point lookups of random funds on random dates.
+##
+##  For each, the throughput and the p50, p99 and worst latencies, as seen by the clients, are
+##  printed.
+##
+##  Usage:
+##
+##      python benchmarks/bench_nav_server.py [--funds 100] [--clients 100] [--requests 20]
+##
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nav_server import NavServer, ServedFunds, ResponseCache, DEFAULT_CACHE_MB
+from plot_mutual_funds import FundDataManager
+from synthetic_universe import SyntheticUniverse
+
+def serve_universe(n_funds, seed):
+    """Loads a synthetic universe as nav_server.py loads a configuration's funds."""
+    universe = SyntheticUniverse(n_funds, seed=seed)
+    fdm = FundDataManager()
+    metas = []
+    for i, code in enumerate(universe.scheme_codes):
+        meta, rows, navs = universe.fund(i)
+        fdm.add_fund(code, universe.trading_days[rows], navs)
+        metas.append(dict(meta, label=meta['scheme_name']))
+    raw = fdm.get_all_fund_data()
+    fdm.normalize_all_fund_data()
+    return ServedFunds(fdm, raw, universe.scheme_codes, metas)
+
+async def get(reader, writer, target):
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    head = await reader.readuntil(b'\r\n\r\n')
+    length = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+    await reader.readexactly(length)
+    if not head.startswith(b'HTTP/1.1 200'):
+        status_line = head.split(b'\r\n')[0].decode()
+        raise RuntimeError(f"{target}: {status_line}")
+
+async def client(port, targets, latencies):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for target in targets:
+        started = time.perf_counter()
+        await get(reader, writer, target)
+        latencies.append(time.perf_counter() - started)
+    writer.close()
+    await writer.wait_closed()
+
+async def run(funds, args):
+    server = NavServer(funds, ResponseCache(DEFAULT_CACHE_MB * 1024 * 1024))
+    started = asyncio.get_running_loop().create_future()
+    serving = asyncio.create_task(server.serve('127.0.0.1', 0, started))
+    port = await started
+
+    rng = numpy.random.default_rng(args.seed)
+    dates = funds.date_strings
+    codes = funds.scheme_codes
+    def few_codes():
+        return ','.join(rng.choice(codes, min(5, len(codes)), replace=False))
+    popular = [f"/series?codes={few_codes()}&start={dates[-2000]}" for _ in range(4)]
+    workloads = {
+        'series, cached': lambda: popular[rng.integers(len(popular))],
+        'series, uncached': \
+            lambda: f"/series?codes={few_codes()}&start={dates[rng.integers(len(dates) - 1000)]}",
+        'nav': lambda: f"/nav?code={codes[rng.integers(len(codes))]}&date={dates[rng.integers(len(dates))]}",
+    }
+    print(f"{len(codes)} funds over {len(dates)} days; {args.clients} clients, {args.requests} requests each")
+    for name, target in workloads.items():
+        latencies = []
+        clock = time.perf_counter()
+        await asyncio.gather(*[client(port, [target() for _ in range(args.requests)], latencies) \
+                               for _ in range(args.clients)])
+        elapsed = time.perf_counter() - clock
+        latencies = numpy.array(latencies)
+        print(f"{name:<17} {len(latencies) / elapsed:8.0f} requests/s, " \
+              f"p50 {numpy.percentile(latencies, 50) * 1e3:7.2f} ms, " \
+              f"p99 {numpy.percentile(latencies, 99) * 1e3:7.2f} ms, max {latencies.max() * 1e3:7.2f} ms")
+    serving.cancel()
+    server.log_stats()
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Time nav_server.py under many concurrent clients.')
+    parser.add_argument('--funds', type=int, default=100, help='Funds in the synthetic universe')
+    parser.add_argument('--clients', type=int, default=100, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=20, help='Requests per client and workload')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger('nav_server').setLevel(logging.INFO)
+    asyncio.run(run(serve_universe(args.funds, args.seed), args))
+
+if __name__ == "__main__":
+    main()
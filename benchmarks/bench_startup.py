@@ -0,0 +1,90 @@
+##
+##  Benchmark: the startup time of plot_mutual_funds.py
+##
+##  Every measurement runs in a fresh Python process, so that nothing is imported already:
+##
+##    import:   importing the module, compared with importing everything it used to import
+##              eagerly;
+##    --help:   printing the usage;
+##    startup:  a whole startup with the given arguments, on the non-interactive Agg backend,
+##              broken down by the phases in the program's startup report.
+##
+##  The medians of the runs are printed. The budget of the import, and the absence of
+##  Matplotlib's GUI modules from the import and from --help, are checked by
+##  tests/test_startup.py.
+##
+##  Usage:
+##
+##      python benchmarks/bench_startup.py [--runs 5] [-- -c config_small.toml --offline]
+##
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EAGER_IMPORTS = 'import numpy, pandas, pickle, requests, toml, matplotlib.pyplot, matplotlib.widgets'
+PHASE = re.compile(r"Startup: (\S+(?: \S+)?)\s+([0-9.]+) s, from")
+SHOWN = re.compile(r"Startup: ([0-9.]+) s until the window is shown")
+
+def run_python(code, args=(), env=None):
+    """Runs Python code in a fresh process, in the repository, and returns its output."""
+    result = subprocess.run([sys.executable, '-c', code, *args], cwd=ROOT, env=env, \
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Python failed:\n{result.stderr[-2000:]}")
+    return result.stdout, result.stderr
+
+def time_import(statement):
+    """Returns the seconds an import statement takes."""
+    stdout, _ = run_python(f"import time\nstarted = time.perf_counter()\n{statement}\n" \
+                           f"print(time.perf_counter() - started)")
+    return float(stdout.split('\n')[0])
+
+def time_help():
+    """Returns the seconds plot_mutual_funds.py takes to print its usage, from the start of Python."""
+    started = time.perf_counter()
+    run_python("import sys\nsys.argv[0] = 'plot_mutual_funds.py'\nimport plot_mutual_funds\n" \
+               "try:\n    plot_mutual_funds.main()\nexcept SystemExit:\n    pass", ['--help'])
+    return time.perf_counter() - started
+
+def time_startup(plot_args):
+    """Runs a whole startup on the Agg backend and returns its phases and its total, in seconds."""
+    env = dict(os.environ, MPLBACKEND='Agg')
+    _, stderr = run_python("import sys\nsys.argv[0] = 'plot_mutual_funds.py'\n" \
+                           "import plot_mutual_funds\nplot_mutual_funds.main()", plot_args, env)
+    phases = {}
+    for name, seconds in PHASE.findall(stderr):
+        phases[name] = phases.get(name, 0.0) + float(seconds)
+    shown = SHOWN.search(stderr)
+    if shown is None:
+        raise RuntimeError(f"No startup report in the output:\n{stderr[-2000:]}")
+    return phases, float(shown.group(1))
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup time of plot_mutual_funds.py.')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh processes per measurement')
+    parser.add_argument('plot_args', nargs=argparse.REMAINDER, \
+                        help='Arguments of plot_mutual_funds.py for the startup runs, after --')
+    args = parser.parse_args()
+    plot_args = args.plot_args[1:] if args.plot_args[:1] == ['--'] else args.plot_args
+
+    eager = statistics.median(time_import(EAGER_IMPORTS) for _ in range(args.runs))
+    lazy = statistics.median(time_import('import plot_mutual_funds') for _ in range(args.runs))
+    print(f"import:  {lazy:.3f} s for the module; {eager:.3f} s for its former eager imports " \
+          f"(median of {args.runs})")
+    usage = statistics.median(time_help() for _ in range(args.runs))
+    print(f"--help:  {usage:.3f} s, with the start of Python (median of {args.runs})")
+
+    runs = [time_startup(plot_args) for _ in range(args.runs)]
+    for name in runs[0][0]:
+        print(f"  {name:<12} {statistics.median(phases.get(name, 0.0) for phases, _ in runs):.3f} s")
+    shown = statistics.median(total for _, total in runs)
+    print(f"startup: {shown:.3f} s until the window is shown (median of {args.runs})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+##
+##  Benchmark: valuing thousands of transaction ledgers with the batched XIRR solver
+##
+##  Builds a synthetic NAV matrix and synthetic ledgers (many portfolios of a few holdings,
+##  each holding with a couple of years of monthly purchases and the odd redemption), and
+##  times, for the same ledgers,
+##
+##    batched:  ledger.value_ledgers, which values every holding and portfolio and solves all
+##              their XIRRs together, and
+##    scalar:   one Newton/bisection root search per holding and portfolio, in a Python loop,
+##              on a sample of the sets (the time is scaled up to all of them).
+##
+##  The XIRRs of the two are compared on the sample.
+##
+##  Usage:
+##
+##      python benchmarks/bench_xirr.py [--portfolios 2000] [--holdings 5] [--transactions 24]
+##          [--funds 200] [--sample 500]
+##
+
+import argparse
+import os
+import sys
+import time
+
+import numpy
+import pandas
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ledger import value_ledgers, TOTAL
+from xirr import years_between
+
+def synthetic_navs(n_funds, n_days, seed=0):
+    """Returns calendar-daily dates and random-walk NAVs for `n_funds` funds."""
+    rng = numpy.random.default_rng(seed)
+    dates = numpy.datetime64('2024-06-14') - numpy.arange(n_days)[::-1]
+    log_returns = rng.normal(0.0004, 0.01, (n_days, n_funds))
+    return dates, numpy.asfortranarray(10.0 * numpy.exp(numpy.cumsum(log_returns, axis=0)))
+
+def synthetic_ledger(dates, n_funds, n_portfolios, n_holdings, n_transactions, seed=0):
+    """Returns a ledger of monthly purchases (and one redemption in ten) in random funds."""
+    rng = numpy.random.default_rng(seed)
+    n_rows = n_portfolios * n_holdings * n_transactions
+    portfolios = numpy.repeat(numpy.arange(n_portfolios), n_holdings * n_transactions)
+    funds = numpy.repeat(rng.integers(0, n_funds, n_portfolios * n_holdings), n_transactions)
+    starts = numpy.repeat(rng.integers(0, len(dates) - 31 * n_transactions, \
+                                       n_portfolios * n_holdings), n_transactions)
+    rows = starts + numpy.tile(numpy.arange(n_transactions) * 30, n_portfolios * n_holdings)
+    amounts = rng.choice([5000.0, 10000.0, 25000.0], n_rows)
+    redemptions = (rng.random(n_rows) < 0.1) & (rows > starts)
+    amounts[redemptions] = -0.5 * amounts[redemptions]
+    return pandas.DataFrame({'portfolio': portfolios.astype(str), 'scheme_code': funds.astype(str), \
+                             'date': dates[rows], 'amount': amounts})
+
+def scalar_xirr(amounts, times, tolerance=1e-10):
+    """Solves one set's XIRR with a scalar Newton/bisection hybrid, as a per-ledger loop would."""
+    def f(x):
+        discounted = amounts * numpy.exp(-times * x)
+        return discounted.sum(), -(discounted * times).sum()
+    low, high = -10.0, 10.0
+    f_low = f(low)[0]
+    x = numpy.log1p(0.1)
+    for _ in range(100):
+        value, slope = f(x)
+        if (value < 0) == (f_low < 0):
+            low = x
+        else:
+            high = x
+        newton = x - value / slope
+        next_x = newton if low < newton < high else 0.5 * (low + high)
+        if abs(next_x - x) < tolerance:
+            return numpy.expm1(next_x)
+        x = next_x
+    return numpy.nan
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ledger valuation and the batched XIRR solver.')
+    parser.add_argument('--portfolios', type=int, default=2000)
+    parser.add_argument('--holdings', type=int, default=5, help='Holdings per portfolio')
+    parser.add_argument('--transactions', type=int, default=24, help='Transactions per holding')
+    parser.add_argument('--funds', type=int, default=200)
+    parser.add_argument('--sample', type=int, default=500, help='Sets solved by the scalar loop')
+    args = parser.parse_args()
+
+    dates, navs = synthetic_navs(args.funds, 10 * 365)
+    codes = [str(code) for code in range(args.funds)]
+    ledger = synthetic_ledger(dates, args.funds, args.portfolios, args.holdings, args.transactions)
+    print(f"{len(ledger)} transactions in {args.portfolios} portfolios of {args.holdings} holdings")
+
+    started = time.perf_counter()
+    table = value_ledgers(ledger, dates, navs, codes)
+    batched = time.perf_counter() - started
+    print(f"batched: {batched:.3f} s for {len(table)} XIRRs, " \
+          f"{numpy.count_nonzero(~table['converged'])} not converged")
+
+    # The scalar loop solves a sample of the same sets, from the same flows
+    rng = numpy.random.default_rng(1)
+    sample = rng.choice(len(table), min(args.sample, len(table)), replace=False)
+    as_of = dates[-1]
+    flows = []
+    for (portfolio, code), row in table.iloc[sample].iterrows():
+        transactions = ledger[ledger['portfolio'] == portfolio]
+        if code != TOTAL:
+            transactions = transactions[transactions['scheme_code'] == code]
+        days = transactions['date'].to_numpy().astype('datetime64[D]')
+        amounts = numpy.append(-transactions['amount'].to_numpy(), row['value'])
+        times = years_between(numpy.append(days, as_of), days.min())
+        flows.append((amounts, times, row['xirr']))
+    started = time.perf_counter()
+    rates = [scalar_xirr(amounts, times) for amounts, times, _ in flows]
+    scalar = (time.perf_counter() - started) * len(table) / len(sample)
+    difference = numpy.nanmax(numpy.abs(numpy.array(rates) - [rate for _, _, rate in flows]))
+    print(f"scalar:  {scalar:.3f} s (estimated from {len(sample)} sets), {scalar / batched:.1f}x slower; " \
+          f"largest XIRR difference {difference:.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+##
+##  Benchmark suite: the hot paths of plot_mutual_funds.py over synthetic universes
+##
+##  For each universe size, a deterministic synthetic universe (see synthetic_universe.py) is
+##  generated, and these are timed, in the order in which the program runs them:
+##
+##    json_parse                     nav_parser.parse_nav_payload on every fund's response bytes
+##    concatenate_fund_data          one FundDataManager.concatenate_fund_data per fund, and the
+##                                   alignment of all of them on one date index
+##    interpolate_fund_series_frame  FundDataManager.interpolate_fund_series_frame for every fund
+##    normalize_all_fund_data        FundDataManager.normalize_all_fund_data
+##    PlotManager.update             one recompute of the plot for a new date range (on the Agg
+##                                   backend, without rendering the figure), per call
+##    get_index_and_date_at_cursor   PlotLineManager.get_index_and_date_at_cursor, per call
+##
+##  The plot is only built for universes of up to --plot-max-funds funds. Each benchmark is run
+##  --repeat times; the best and the median times are kept, with the software and the machine
+##  they were measured on, in a JSON file. Given a baseline (an earlier results file), the run
+##  is compared with it and benchmarks slower than the baseline by more than the tolerance are
+##  flagged as regressions; the exit status is then 1.
+##
+##  Usage:
+##
+##      python benchmarks/run_benchmarks.py [--funds 10 100 1000] [--repeat 5] [--output results.json]
+##          [--baseline baseline.json] [--tolerance 0.2]
+##      python benchmarks/run_benchmarks.py --compare baseline.json results.json [--tolerance 0.2]
+##
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy
+import pandas
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import plot_mutual_funds as pmf
+from nav_parser import parse_nav_payload
+from synthetic_universe import SyntheticUniverse
+
+RESULTS_VERSION = 1
+DEFAULT_FUNDS = [10, 100, 1000]
+DEFAULT_PLOT_MAX_FUNDS = 1000
+DEFAULT_TOLERANCE = 0.2      # A benchmark 20% slower than its baseline is a regression
+UPDATE_CALLS = 20            # Plot recomputes per timing run
+CURSOR_CALLS = 2000          # Cursor lookups per timing run
+
+def timed(function, repeat, calls=1):
+    """Returns the seconds per call of `repeat` runs of `calls` calls of a function."""
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for call in range(calls):
+            function(call)
+        runs.append((time.perf_counter() - started) / calls)
+    return runs
+
+def result(benchmark, n_funds, runs, per):
+    return {'benchmark': benchmark, 'funds': n_funds, 'per': per, 'best': min(runs), \
+            'median': statistics.median(runs), 'runs': runs}
+
+def new_fund_data_manager():
+    # The FundDataManager is a singleton; every universe, and every run, starts a new one
+    pmf.FundDataManager._instance = None
+    pmf.fdm = pmf.FundDataManager()
+    return pmf.fdm
+
+def build_plot(fdm, labels):
+    """Builds the plot as `main` does, on the Agg backend, and stops the figure from rendering."""
+    pmf.plt.close('all')
+    pmf.PlotManager._instance = None
+    pmf.PlotLineManager._instance = None
+    del pmf.lines[:]
+    pmf.pm = pmf.PlotManager()
+    pmf.plm = pmf.PlotLineManager()
+    pmf.pm.create_figure_components(fdm.get_start_date(), fdm.get_end_date())
+    pmf.plm.draw_plot_lines(fdm.get_start_date(), fdm.get_end_date(), labels, \
+                            [f"C{i % 10}" for i in range(len(labels))], fdm.get_all_fund_data_normalized())
+    pmf.labels = list(labels)
+    pmf.pm.setup_event_handlers()
+    canvas = pmf.pm.get_fig().canvas
+    canvas.draw()
+    canvas.draw_idle = lambda *args, **kwargs: None
+
+def bench_universe(n_funds, repeat, seed, plot_max_funds):
+    """Runs every benchmark over one synthetic universe and returns their results."""
+    universe = SyntheticUniverse(n_funds, seed=seed)
+    raw = [universe.payload_bytes(i) for i in range(n_funds)]
+    results = []
+
+    parsed = []
+    def parse_all(call):
+        parsed[:] = [parse_nav_payload(payload) for payload in raw]
+    results.append(result('json_parse', n_funds, timed(parse_all, repeat), 'universe'))
+
+    labels = [f"{i + 1:02d}. {meta['scheme_name']}" for i, (meta, _, _) in enumerate(parsed)]
+    frames = [pandas.DataFrame({label: navs}, index=pandas.DatetimeIndex(dates)) \
+              for label, (_, dates, navs) in zip(labels, parsed)]
+    def concatenate(call):
+        fdm = new_fund_data_manager()
+        for frame in frames:
+            fdm.concatenate_fund_data(frame)
+        fdm.align_fund_data()
+    results.append(result('concatenate_fund_data', n_funds, timed(concatenate, repeat), 'universe'))
+    fdm = pmf.fdm
+
+    def interpolate(call):
+        for label in labels:
+            fdm.interpolate_fund_series_frame(label)
+    results.append(result('interpolate_fund_series_frame', n_funds, timed(interpolate, repeat), \
+                          'universe'))
+    results.append(result('normalize_all_fund_data', n_funds, \
+                          timed(lambda call: fdm.normalize_all_fund_data(), repeat), 'universe'))
+
+    if n_funds > plot_max_funds:
+        return results
+    build_plot(fdm, labels)
+    sliders = (pmf.pm.get_norm_date_slider(), pmf.pm.get_min_date_slider(), pmf.pm.get_max_date_slider())
+    low, high = sliders[1].valmin, sliders[1].valmax
+    def update(call):
+        # Date ranges from the whole history down to its last quarter
+        first = low + (high - low) * 0.75 * call / UPDATE_CALLS
+        sliders[0].val, sliders[1].val, sliders[2].val = first, first, high
+        pmf.pm.update(None)
+    results.append(result('PlotManager.update', n_funds, timed(update, repeat, UPDATE_CALLS), 'call'))
+
+    line = pmf.lines[0]
+    positions = numpy.random.default_rng(seed).uniform(low, high, CURSOR_CALLS)
+    results.append(result('get_index_and_date_at_cursor', n_funds, \
+                          timed(lambda call: pmf.plm.get_index_and_date_at_cursor(line, positions[call]), \
+                                repeat, CURSOR_CALLS), 'call'))
+    return results
+
+def environment():
+    """Describes the software and the machine, so that results from different runs can be compared."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, \
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    import matplotlib
+    return {
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'matplotlib': matplotlib.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+    }
+
+def compare(baseline, results, tolerance):
+    """Prints each benchmark's time against its baseline, and returns the regressions."""
+    baseline_times = {(entry['benchmark'], entry['funds']): entry['best'] for entry in baseline['results']}
+    regressions = []
+    print(f"{'benchmark':<30} {'funds':>6} {'baseline':>12} {'now':>12} {'ratio':>7}")
+    for entry in results['results']:
+        key = (entry['benchmark'], entry['funds'])
+        if key not in baseline_times:
+            continue
+        ratio = entry['best'] / baseline_times[key]
+        regressed = ratio > 1 + tolerance
+        if regressed:
+            regressions.append(key)
+        print(f"{entry['benchmark']:<30} {entry['funds']:>6} {baseline_times[key] * 1e3:9.3f} ms " \
+              f"{entry['best'] * 1e3:9.3f} ms {ratio:6.2f}x{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def read_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError(f"{path} is not a benchmark results file of version {RESULTS_VERSION}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the hot paths of the plot over synthetic universes.')
+    parser.add_argument('--funds', type=int, nargs='+', default=DEFAULT_FUNDS, \
+                        help='Universe sizes, each from 1 to 50000')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing runs per benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic universes')
+    parser.add_argument('--plot-max-funds', type=int, default=DEFAULT_PLOT_MAX_FUNDS, \
+                        help='Only time the plot for universes of up to this many funds')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', \
+                        help='Write the results to this JSON file')
+    parser.add_argument('--baseline', type=str, default=None, \
+                        help='Compare the results with those in this JSON file')
+    parser.add_argument('--compare', type=str, nargs=2, default=None, metavar=('BASELINE', 'RESULTS'), \
+                        help='Only compare two results files')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, \
+                        help='The slowdown, as a fraction, beyond which a benchmark is a regression')
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        regressions = compare(read_results(args.compare[0]), read_results(args.compare[1]), args.tolerance)
+        sys.exit(1 if regressions else 0)
+    baseline = None if args.baseline is None else read_results(args.baseline)
+
+    import matplotlib
+    matplotlib.use('Agg')
+    pmf.import_gui()
+    pmf.initialize_loggers(logging.WARNING)
+    for logger in (pmf.logger, pmf.logger_update, pmf.logger_on_mouse_move):
+        logger.setLevel(logging.WARNING)
+
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'settings': {'funds': args.funds, 'repeat': args.repeat, 'seed': args.seed, \
+                     'plot_max_funds': args.plot_max_funds},
+        'results': [],
+    }
+    for n_funds in args.funds:
+        for entry in bench_universe(n_funds, args.repeat, args.seed, args.plot_max_funds):
+            results['results'].append(entry)
+            print(f"{entry['benchmark']:<30} {n_funds:>6} funds: best {entry['best'] * 1e3:9.3f} ms, " \
+                  f"median {entry['median'] * 1e3:9.3f} ms per {entry['per']}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote the results to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+##
+##  A deterministic synthetic universe of mutual fund NAV histories, for benchmarks
+##
+##  Fund number i of a universe is always the same fund, whatever the size of the universe
+##  (from 1 up to 50,000 funds), because its random numbers come from the seed and i alone.
+##  Each fund has
+##
+##    - an inception date: a few funds predate the universe's first date, and the rest start
+##      later, more of them in recent years, as the real universe has grown;
+##    - NAVs only on trading days: weekdays other than the universe's market holidays (about
+##      fifteen a year, the same for every fund);
+##    - gaps: the odd missing day, and in some funds an outage of a few weeks;
+##    - in a few cases, a closing date before the universe's last date;
+##    - a geometric random walk of NAVs with a drift and a volatility typical of its category.
+##
+##  The payloads have the shape of mfapi.in's responses: a `meta` block and `data` rows of
+##  'dd-mm-yyyy' dates and NAVs as text, newest first.
+##
+##  Write a universe into a NAV cache (and, optionally, a NAV store) with
+##
+##      python benchmarks/synthetic_universe.py CACHE_DIR [--funds 1000] [--seed 0] [--store STORE_DIR]
+##
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nav_cache import NavCache
+
+logger = logging.getLogger(__name__)
+
+MAX_FUNDS = 50000
+FIRST_CODE = 100000
+DEFAULT_FIRST_DATE = '2006-04-03'
+DEFAULT_LAST_DATE = '2024-06-14'
+HOLIDAYS_PER_YEAR = 15
+OLD_FUND_SHARE = 0.15        # Funds whose history starts on the universe's first date
+CLOSED_FUND_SHARE = 0.03     # Funds that close before the universe's last date
+MISSING_DAY_RATE = 0.005     # Trading days on which a fund's NAV is missing
+OUTAGE_SHARE = 0.10          # Funds with one outage of 5 to 40 trading days
+MIN_HISTORY_DAYS = 60        # Trading days that every fund has at least
+
+# Category, annual drift, annual volatility
+CATEGORIES = [
+    ('Equity Scheme - Large Cap Fund', 0.12, 0.18),
+    ('Equity Scheme - Mid Cap Fund', 0.15, 0.22),
+    ('Equity Scheme - Small Cap Fund', 0.17, 0.26),
+    ('Equity Scheme - Flexi Cap Fund', 0.13, 0.19),
+    ('Hybrid Scheme - Balanced Advantage', 0.10, 0.10),
+    ('Debt Scheme - Corporate Bond Fund', 0.07, 0.02),
+    ('Debt Scheme - Liquid Fund', 0.06, 0.005),
+    ('Other Scheme - Index Funds', 0.12, 0.17),
+]
+
+class SyntheticUniverse:
+    def __init__(self, n_funds, first_date=DEFAULT_FIRST_DATE, last_date=DEFAULT_LAST_DATE, seed=0):
+        if not 1 <= n_funds <= MAX_FUNDS:
+            raise ValueError(f"A synthetic universe has 1 to {MAX_FUNDS} funds, not {n_funds}.")
+        self.n_funds = n_funds
+        self.seed = seed
+        self.scheme_codes = [str(FIRST_CODE + i) for i in range(n_funds)]
+
+        # The market's calendar: weekdays, less a few holidays a year
+        rng = numpy.random.default_rng([seed, MAX_FUNDS])
+        days = numpy.arange(numpy.datetime64(first_date, 'D'), numpy.datetime64(last_date, 'D') + 1)
+        weekdays = days[numpy.is_busday(days)]
+        n_holidays = int(len(weekdays) / 261 * HOLIDAYS_PER_YEAR)
+        self.holidays = numpy.sort(rng.choice(weekdays, n_holidays, replace=False))
+        self.trading_days = weekdays[~numpy.isin(weekdays, self.holidays)]
+        iso = numpy.datetime_as_string(self.trading_days)
+        self.date_strings = [f"{d[8:10]}-{d[5:7]}-{d[0:4]}" for d in iso]
+
+    def fund(self, i):
+        """
+        Returns fund number `i`.
+
+        Returns:
+        tuple: (meta dict, rows of `trading_days` on which the fund has a NAV, float NAVs)
+        """
+        rng = numpy.random.default_rng([self.seed, i])
+        n_days = len(self.trading_days)
+        category, drift, volatility = CATEGORIES[rng.integers(len(CATEGORIES))]
+
+        if rng.random() < OLD_FUND_SHARE:
+            first_row = 0
+        else:
+            # More funds were launched in recent years than in early ones
+            first_row = int((n_days - MIN_HISTORY_DAYS) * rng.random() ** 0.6)
+        last_row = n_days - 1
+        if rng.random() < CLOSED_FUND_SHARE:
+            last_row = int(rng.integers(first_row + MIN_HISTORY_DAYS - 1, n_days))
+
+        rows = numpy.arange(first_row, last_row + 1)
+        present = rng.random(len(rows)) >= MISSING_DAY_RATE
+        if rng.random() < OUTAGE_SHARE and len(rows) > 2 * MIN_HISTORY_DAYS:
+            outage_start = int(rng.integers(MIN_HISTORY_DAYS, len(rows) - MIN_HISTORY_DAYS))
+            present[outage_start:outage_start + int(rng.integers(5, 41))] = False
+        present[[0, -1]] = True
+        rows = rows[present]
+
+        # A geometric random walk over the trading days, missing or not
+        fund_volatility = volatility * rng.uniform(0.7, 1.3)
+        daily_returns = rng.normal((drift - fund_volatility ** 2 / 2) / 252, \
+                                   fund_volatility / numpy.sqrt(252), last_row - first_row + 1)
+        navs = rng.uniform(10.0, 20.0) * numpy.exp(numpy.cumsum(daily_returns))[rows - first_row]
+
+        plan = 'Direct' if i % 2 else 'Regular'
+        meta = {
+            'fund_house': f"Synthetic Mutual Fund {i % 45:02d}",
+            'scheme_type': 'Open Ended Schemes',
+            'scheme_category': category,
+            'scheme_code': FIRST_CODE + i,
+            'scheme_name': f"Synthetic {category.split(' - ')[1]} {i} - {plan} Plan - Growth",
+        }
+        return meta, rows, navs
+
+    def payload(self, i):
+        """Returns fund number `i` as an mfapi.in-shaped payload (a dict)."""
+        meta, rows, navs = self.fund(i)
+        dates = self.date_strings
+        data = [{'date': dates[row], 'nav': nav} \
+                for row, nav in zip(rows[::-1].tolist(), numpy.char.mod('%.5f', navs[::-1]).tolist())]
+        return {'meta': meta, 'data': data, 'status': 'SUCCESS'}
+
+    def payload_bytes(self, i):
+        return json.dumps(self.payload(i)).encode()
+
+    def write_cache(self, directory):
+        """Writes every fund into a NavCache directory, as freshly fetched entries."""
+        cache = NavCache(directory)
+        for i, code in enumerate(self.scheme_codes):
+            payload = self.payload(i)
+            cache.store(code, {'meta': payload['meta'], 'data': payload['data'], 'etag': None, \
+                               'last_modified': None, 'fetched_at': time.time(), \
+                               'nbytes': len(json.dumps(payload))})
+            if (i + 1) % 1000 == 0:
+                logger.info(f"Wrote {i + 1} of {self.n_funds} funds")
+        return cache
+# End class SyntheticUniverse
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Write a synthetic universe of NAV histories into a ' \
+                                     'NAV cache.')
+    parser.add_argument('cache_dir', type=str, help='Directory of the NAV cache to write')
+    parser.add_argument('--funds', type=int, default=1000, help=f"Funds in the universe (1 to {MAX_FUNDS})")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--first-date', type=str, default=DEFAULT_FIRST_DATE, help='yyyy-mm-dd')
+    parser.add_argument('--last-date', type=str, default=DEFAULT_LAST_DATE, help='yyyy-mm-dd')
+    parser.add_argument('--store', type=str, default=None, help='Also build a NAV store in this directory')
+    args = parser.parse_args()
+
+    try:
+        universe = SyntheticUniverse(args.funds, args.first_date, args.last_date, args.seed)
+        cache = universe.write_cache(args.cache_dir)
+        logger.info(f"Wrote {args.funds} funds over {len(universe.trading_days)} trading days " \
+                    f"to {args.cache_dir}")
+        if args.store is not None:
+            from nav_store import build_store_from_cache
+            build_store_from_cache(args.store, cache, universe.scheme_codes)
+    except (OSError, ValueError) as e:
+        logger.critical(e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+##
+##  Bulk ingestion of every scheme that mfapi.in knows about
+##
+##  Reads the list of all schemes from the web service's scheme-list endpoint
+##  (e.g. "https://api.mfapi.in/mf"), downloads every scheme's NAV history in
+##  parallel batches into the NAV cache, and finally packs the cached histories
+##  into one memory-mapped NAV store.
+##
+##  After each batch the codes of the schemes done so far are saved to a checkpoint
+##  file, so an interrupted run picks up where it stopped when started again.
+##
+##  Usage:
+##
+##      python bulk_ingest.py STORE_DIR [--base-url http://127.0.0.1:8000/mf] [--max-workers 64]
+##
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from nav_fetcher import NavFetcher, DEFAULT_TIMEOUT, DEFAULT_RETRIES
+from nav_cache import NavCache, DEFAULT_CACHE_DIR
+from nav_store import build_store_from_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = 'https://api.mfapi.in/mf'
+DEFAULT_MAX_WORKERS = 64     # Bulk ingestion can afford more parallelism than an interactive run
+DEFAULT_BATCH_SIZE = 500     # Schemes fetched between two checkpoints
+CHECKPOINT_FILE = 'ingest_checkpoint.json'
+
+def read_scheme_list(fetcher, base_url):
+    """Returns the codes and names of all the schemes listed by the web service."""
+    result = fetcher.fetch_one(base_url, 'scheme list')
+    if not result.ok:
+        raise RuntimeError(f"Cannot read the scheme list from {base_url}: {result.error}")
+    return [(str(scheme['schemeCode']), scheme.get('schemeName', '')) for scheme in result.json()]
+
+def load_checkpoint(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return set(), set()
+    return set(checkpoint.get('done', [])), set(checkpoint.get('failed', []))
+
+def save_checkpoint(path, done, failed):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'done': sorted(done), 'failed': sorted(failed)}, f)
+    os.replace(temp_path, path)
+
+def ingest(store_directory, base_url=DEFAULT_BASE_URL, cache_directory=DEFAULT_CACHE_DIR, \
+           max_workers=DEFAULT_MAX_WORKERS, batch_size=DEFAULT_BATCH_SIZE, \
+           timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, limit=None, retry_failed=False):
+    """
+    Downloads every listed scheme and writes them all into one NAV store.
+
+    Parameters:
+    store_directory (str): Directory of the NAV store to build. The checkpoint is kept here too.
+    base_url (str): The scheme-list endpoint; a scheme's history is at "{base_url}/{code}".
+    cache_directory (str): Directory of the NAV cache that holds the downloaded histories.
+    max_workers (int): The maximum number of downloads in flight at once.
+    batch_size (int): The number of schemes downloaded between two checkpoints.
+    limit (int): Only ingest the first `limit` schemes of the list, if given.
+    retry_failed (bool): Retry the schemes that failed in an earlier run.
+
+    Returns:
+    NavStore: The store holding every scheme that could be downloaded.
+    """
+    base_url = base_url.rstrip('/')
+    os.makedirs(store_directory, exist_ok=True)
+    checkpoint_path = os.path.join(store_directory, CHECKPOINT_FILE)
+    done, failed = load_checkpoint(checkpoint_path)
+    if retry_failed:
+        failed = set()
+    # Histories downloaded during this run are always refetched on the next run
+    cache = NavCache(cache_directory, max_age=0)
+
+    with NavFetcher(max_workers=max_workers, timeout=timeout, retries=retries) as fetcher:
+        schemes = read_scheme_list(fetcher, base_url)
+        if limit is not None:
+            schemes = schemes[:limit]
+        names = dict(schemes)
+        todo = [code for code, _ in schemes if code not in done and code not in failed]
+        logger.info(f"{len(schemes)} schemes listed; {len(done)} already ingested, " \
+                    f"{len(failed)} failed earlier, {len(todo)} to fetch")
+
+        started = time.perf_counter()
+        fetched = 0
+        for batch_start in range(0, len(todo), batch_size):
+            batch = todo[batch_start:batch_start + batch_size]
+            payloads = cache.fetch_all([f"{base_url}/{code}" for code in batch], \
+                                       [f"{code} {names[code]}" for code in batch], fetcher)
+            for code, payload in zip(batch, payloads):
+                if payload is not None and payload.get('data'):
+                    done.add(code)
+                else:
+                    failed.add(code)
+            save_checkpoint(checkpoint_path, done, failed)
+
+            fetched += len(batch)
+            elapsed = time.perf_counter() - started
+            rate = fetched / elapsed if elapsed > 0 else 0.0
+            remaining = (len(todo) - fetched) / rate if rate > 0 else 0.0
+            logger.info(f"Progress: {fetched}/{len(todo)} schemes ({len(failed)} failed), " \
+                        f"{rate:.1f} schemes/s, about {remaining:.0f}s left")
+
+    codes = [code for code, _ in schemes if code in done]
+    if failed:
+        logger.warning(f"{len(failed)} schemes could not be ingested; rerun with --retry-failed")
+    logger.info(f"Building the NAV store from {len(codes)} schemes")
+    return build_store_from_cache(store_directory, cache, codes)
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    logging.getLogger('nav_fetcher').setLevel(logging.ERROR)
+    logging.getLogger('nav_cache').setLevel(logging.WARNING)
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Download every mfapi.in scheme into one NAV store.")
+    parser.add_argument('store', type=str, help='Directory of the NAV store to build')
+    parser.add_argument('--base-url', type=str, default=DEFAULT_BASE_URL, \
+                        help='The scheme-list endpoint of the web service')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR, \
+                        help='Directory of the on-disk NAV cache')
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS, \
+                        help='The maximum number of downloads in flight at once')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, \
+                        help='The number of schemes downloaded between two checkpoints')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, \
+                        help='Seconds to wait for each download attempt')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, \
+                        help='How many times to retry a failed download')
+    parser.add_argument('--limit', type=int, default=None, \
+                        help='Only ingest the first LIMIT schemes of the list')
+    parser.add_argument('--retry-failed', action='store_true', \
+                        help='Retry the schemes that failed in an earlier run')
+    args = parser.parse_args()
+
+    try:
+        ingest(args.store, base_url=args.base_url, cache_directory=args.cache_dir, \
+               max_workers=args.max_workers, batch_size=args.batch_size, timeout=args.timeout, \
+               retries=args.retries, limit=args.limit, retry_failed=args.retry_failed)
+    except (RuntimeError, ValueError) as e:
+        logger.critical(e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
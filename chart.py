@@ -0,0 +1,73 @@
+##
+##  The static parts of the normalized-NAV chart
+##
+##  The interactive plot (plot_mutual_funds.py) and the headless batch renderer
+##  (batch_render.py) draw the same chart: the same figure size, normalization, line widths,
+##  normalization-date line, log-scale formatting, title, axis labels and legend. They build
+##  it with these functions, on an Axes of their own, so that the two cannot drift apart. The
+##  interactive plot adds its sliders, text boxes and cursor around it.
+##
+##  Nothing here imports pyplot, so the functions can be used on a Figure without a window.
+##
+
+import numpy
+
+FIGURE_SIZE = (10, 6)          # Inches
+TITLE = 'Normalized Indian Mutual Fund NAVs'
+X_LABEL = 'Date'
+Y_LABEL = 'Normalized NAV'
+LINE_WIDTH = 1.5
+PORTFOLIO_LINE_WIDTH = 2.5     # Model portfolios are drawn thicker than the funds
+NORM_DATE_LINE_STYLE = {'color': 'black', 'linewidth': 0.5}
+
+def normalize_window(daily_navs, first_row, last_row, base_row):
+    """
+    Returns the NAVs of the rows `first_row` to `last_row` (inclusive) of a matrix with one
+    column per fund, normalized to 100 at `base_row`. Funds that have no NAV yet at `base_row`
+    come out as NaN.
+    """
+    return daily_navs[first_row:last_row + 1] * (100.0 / daily_navs[base_row])
+
+def plot_nav_lines(ax, x, y, labels, colors, linewidth=LINE_WIDTH):
+    """
+    Plots one line per fund.
+
+    Parameters:
+    ax (Axes): The axes to plot on.
+    x (array): The dates, or their Matplotlib date numbers.
+    y (2-D array): The normalized NAVs, one column per fund, in the order of `labels`.
+    labels (list of str): The funds' names, for the legend.
+    colors (list of str): The funds' colors.
+    linewidth (float): The width of the lines.
+
+    Returns:
+    list of Line2D: The lines, in the order of `labels`.
+    """
+    return [ax.plot(x, y[:, column], color=color, label=label, linewidth=linewidth)[0] \
+            for column, (label, color) in enumerate(zip(labels, colors))]
+
+def add_norm_date_line(ax, date):
+    """Draws the vertical line that marks the normalization date, and returns it."""
+    return ax.axvline(date, **NORM_DATE_LINE_STYLE)
+
+def format_log_axis(ax):
+    """Formats the ticks of a logarithmic y-axis as plain numbers, with finer ticks than by default."""
+    import matplotlib.ticker as ticker
+
+    formatter = ticker.ScalarFormatter()
+    formatter.set_scientific(False)
+    formatter.set_useOffset(False)
+    ax.yaxis.set_major_formatter(formatter)
+    subs = numpy.concatenate([
+        numpy.arange(1.0, 2.0, 0.2),   # Finer ticks between 1 and 2
+        numpy.arange(2.0, 5.0, 0.5),   # Medium ticks between 2 and 5
+        numpy.arange(5.0, 10.0, 1.0)   # Coarser ticks between 5 and 10
+    ])
+    ax.yaxis.set_major_locator(ticker.LogLocator(base=10, subs=subs, numticks=20))
+
+def label_chart(ax):
+    """Sets the chart's title and axis labels and draws its legend, which it returns."""
+    ax.set_title(TITLE)
+    ax.set_xlabel(X_LABEL)
+    ax.set_ylabel(Y_LABEL)
+    return ax.legend()
@@ -0,0 +1,206 @@
+##
+##  Compact, per-fund storage of NAV histories, forward-filled when they are read
+##
+##  A calendar-daily matrix with one column per fund is mostly padding: every fund has a row
+##  for each weekend and holiday, and a fund launched late in the period has NaN in most of its
+##  column. Here the funds share one business-day calendar instead: the dates on which any of
+##  them has a NAV. Each fund keeps only the rows of that calendar from its first NAV to its
+##  last, in one contiguous buffer of float64 or float32 NAVs shared by all the funds, with its
+##  offset into the buffer and its first and last rows. A trading day on which a fund has no
+##  NAV is NaN in its run, and the offsets of these gaps are kept, sorted, so that a read finds
+##  the gaps in its range without scanning the NAVs.
+##
+##  Nothing is forward-filled when the funds are stored. A read of a range of rows fills the
+##  gaps in the range from the fund's last NAV before them, and a date that is not in the
+##  calendar (a weekend or a holiday) is read as the business day before it, so the values
+##  read are those of the forward-filled daily matrix, at the business days.
+##
+##  plot_mutual_funds.py keeps its funds in a CompactNavs, as float64 or float32, with
+##
+##      python plot_mutual_funds.py -c config.toml --compact [float32]
+##
+
+import numpy
+
+DTYPES = ('float64', 'float32')
+
+def fill_gaps(values, missing):
+    """
+    Fills the NaNs at some positions of a 1-D array, in place, with the value before each. The
+    gaps in NAV histories are a few days long, so this takes a few passes over the positions
+    only, instead of a pass over the whole array.
+    """
+    while len(missing):
+        previous = values[missing - 1]
+        filled = ~numpy.isnan(previous)
+        if not filled.any():
+            break
+        values[missing[filled]] = previous[filled]
+        missing = missing[~filled]
+
+class CompactNavs:
+    def __init__(self, calendar, buffer, starts, first_rows, labels):
+        """
+        Parameters:
+        calendar (datetime64[D] array): The business days shared by the funds, ascending.
+        buffer (1-D float64 or float32 array): The funds' runs of NAVs, one after the other.
+        starts (int64 array): The offset of each fund's run in `buffer`, and the end of the last.
+        first_rows (int64 array): The row of `calendar` of each fund's first NAV.
+        labels (list of str): The names of the funds, in order.
+        """
+        self.calendar = calendar
+        self.buffer = buffer
+        self.starts = starts
+        self.first_rows = first_rows
+        self.last_rows = first_rows + numpy.diff(starts) - 1   # Before the first row if no NAVs
+        self.gaps = numpy.flatnonzero(numpy.isnan(buffer))       # Offsets of the NaNs in `buffer`
+        self.labels = list(labels)
+        self.columns = {label: column for column, label in enumerate(self.labels)}
+
+    @classmethod
+    def from_funds(cls, funds, dtype='float64'):
+        """
+        Parameters:
+        funds (list of tuple): (label, datetime64 dates, NAVs) per fund, the dates in any order.
+        dtype (str): 'float64', or 'float32' to halve the memory of the NAVs.
+        """
+        funds = [(label, numpy.asarray(dates).astype('datetime64[D]'), numpy.asarray(navs)) \
+                 for label, dates, navs in funds]
+        funds = [(label, dates[~numpy.isnan(navs)], navs[~numpy.isnan(navs)]) for label, dates, navs in funds]
+        calendar = numpy.unique(numpy.concatenate([dates for _, dates, _ in funds] + \
+                                                  [numpy.empty(0, dtype='datetime64[D]')]))
+        runs = []
+        first_rows = []
+        for _, dates, navs in funds:
+            rows = numpy.searchsorted(calendar, dates)
+            first_row = int(rows.min()) if len(rows) else 0
+            run = numpy.full(int(rows.max()) - first_row + 1 if len(rows) else 0, numpy.nan, dtype=dtype)
+            run[rows - first_row] = navs
+            runs.append(run)
+            first_rows.append(first_row)
+        return cls.from_runs(calendar, runs, first_rows, [label for label, _, _ in funds], dtype)
+
+    @classmethod
+    def from_store(cls, store, scheme_codes, labels, dtype='float64'):
+        """Reads funds out of a NavStore (see nav_store.py), one column at a time."""
+        columns = store.column_indices(scheme_codes)
+        navs = store.navs
+        has_nav = numpy.zeros(store.n_days, dtype=bool)
+        for column in columns:
+            has_nav |= ~numpy.isnan(navs[:, column])
+        business_rows = numpy.flatnonzero(has_nav)
+        runs = []
+        first_rows = []
+        for column in columns:
+            valid = numpy.flatnonzero(~numpy.isnan(navs[:, column]))
+            if len(valid) == 0:
+                runs.append(numpy.empty(0, dtype=dtype))
+                first_rows.append(0)
+                continue
+            rows = slice(valid[0], valid[-1] + 1)
+            runs.append(navs[rows, column][has_nav[rows]].astype(dtype))
+            first_rows.append(int(numpy.searchsorted(business_rows, valid[0])))
+        return cls.from_runs(store.dates()[business_rows], runs, first_rows, labels, dtype)
+
+    @classmethod
+    def from_runs(cls, calendar, runs, first_rows, labels, dtype):
+        starts = numpy.zeros(len(runs) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(run) for run in runs], out=starts[1:])
+        buffer = numpy.concatenate(runs + [numpy.empty(0, dtype=dtype)]).astype(dtype, copy=False)
+        return cls(calendar, buffer, starts, numpy.array(first_rows, dtype=numpy.int64), labels)
+
+    def add_fund(self, label, values):
+        """Adds a fund given as one value (or NaN) per row of the calendar, e.g. a portfolio's."""
+        valid = numpy.flatnonzero(~numpy.isnan(values))
+        run = values[valid[0]:valid[-1] + 1] if len(valid) else values[:0]
+        self.buffer = numpy.concatenate([self.buffer, run.astype(self.buffer.dtype)])
+        self.starts = numpy.append(self.starts, len(self.buffer))
+        self.first_rows = numpy.append(self.first_rows, valid[0] if len(valid) else 0)
+        self.last_rows = self.first_rows + numpy.diff(self.starts) - 1
+        self.gaps = numpy.flatnonzero(numpy.isnan(self.buffer))
+        self.columns[label] = len(self.labels)
+        self.labels.append(label)
+
+    def funds(self):
+        """Yields (label, datetime64[D] dates, NAVs) for each fund, without its missing days."""
+        for column, label in enumerate(self.labels):
+            run = self.run(column)
+            rows = numpy.flatnonzero(~numpy.isnan(run))
+            yield label, self.calendar[self.first_rows[column] + rows], run[rows].astype(numpy.float64)
+
+    def run(self, column):
+        return self.buffer[self.starts[column]:self.starts[column + 1]]
+
+    def row_of(self, date):
+        """Returns the row of the business day on or before a date, clipped to the calendar."""
+        row = int(numpy.searchsorted(self.calendar, numpy.datetime64(date, 'D'), side='right')) - 1
+        return min(max(row, 0), len(self.calendar) - 1)
+
+    def value(self, column, row):
+        """Returns a fund's NAV at a row, forward-filled: its last NAV on or before the row."""
+        first_row = self.first_rows[column]
+        if row < first_row or self.last_rows[column] < first_row:
+            return numpy.nan
+        run = self.run(column)
+        index = min(row, self.last_rows[column]) - first_row
+        while numpy.isnan(run[index]):   # A run starts with a NAV, so this stops
+            index -= 1
+        return float(run[index])
+
+    def window(self, first_row, last_row, columns=None):
+        """
+        Returns the forward-filled NAVs of the rows `first_row` to `last_row` (inclusive), one
+        float64 column per fund (all of them, or those of `columns`), in column-major order.
+        """
+        columns = numpy.arange(len(self.labels)) if columns is None else numpy.asarray(columns)
+        window = numpy.full((last_row - first_row + 1, len(columns)), numpy.nan, order='F')
+        buffer = self.buffer
+        starts = self.starts[columns]
+        fund_firsts, fund_lasts = self.first_rows[columns], self.last_rows[columns]
+        for i, (column, start, fund_first, fund_last) in \
+                enumerate(zip(columns.tolist(), starts.tolist(), fund_firsts.tolist(), fund_lasts.tolist())):
+            if fund_last < fund_first or fund_first > last_row:
+                continue
+            low, high = max(first_row, fund_first), min(last_row, fund_last)
+            if low <= high:
+                window[low - first_row:high - first_row + 1, i] = \
+                    buffer[start + low - fund_first:start + high - fund_first + 1]
+                if low == first_row and numpy.isnan(window[0, i]):
+                    window[0, i] = self.value(column, low)   # Filled from before the window
+            if last_row > fund_last:
+                # After its last NAV, a fund keeps it, as it would in a forward-filled matrix
+                window[max(fund_last + 1, first_row) - first_row:, i] = buffer[start + fund_last - fund_first]
+        # The gaps of the runs within the window, as offsets into the column-major window
+        lows = numpy.maximum(first_row, fund_firsts)
+        highs = numpy.minimum(last_row, fund_lasts)
+        begins = numpy.searchsorted(self.gaps, starts + lows - fund_firsts)
+        ends = numpy.searchsorted(self.gaps, starts + highs - fund_firsts, side='right')
+        counts = numpy.where(lows <= highs, ends - begins, 0)
+        owners = numpy.repeat(numpy.arange(len(columns)), counts)
+        gaps = self.gaps[numpy.arange(counts.sum()) + \
+                         numpy.repeat(begins - numpy.cumsum(counts) + counts, counts)]
+        rows = gaps - starts[owners] + fund_firsts[owners] - first_row
+        fill_gaps(window.ravel(order='K'), (owners * window.shape[0] + rows)[rows > 0])
+        return window
+
+    def normalized_window(self, first_row, last_row, base_row, columns=None):
+        """Like `window`, but normalized to 100 at `base_row`; NaN for funds without a NAV by then."""
+        window = self.window(first_row, last_row, columns)
+        if first_row <= base_row <= last_row:
+            base = window[base_row - first_row]
+        else:
+            base = self.window(base_row, base_row, columns)[0]
+        window *= 100.0 / base
+        return window
+
+    def nbytes(self):
+        return self.buffer.nbytes + self.calendar.nbytes + self.starts.nbytes + \
+               self.first_rows.nbytes + self.last_rows.nbytes + self.gaps.nbytes
+
+    def daily_nbytes(self):
+        """The bytes that a calendar-daily float64 matrix of the same funds would take."""
+        if len(self.calendar) == 0:
+            return 0
+        n_days = int((self.calendar[-1] - self.calendar[0]).astype(numpy.int64)) + 1
+        return n_days * len(self.labels) * 8
+# End class CompactNavs
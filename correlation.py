@@ -0,0 +1,225 @@
+##
+##  Pairwise return correlations and covariances of large sets of funds
+##
+##  Funds start on different dates, so each pair of funds is compared over the dates on which
+##  both have a return. With R the returns (NaN where a fund has none), M the 0/1 matrix of
+##  where R is present and X the returns with NaN replaced by 0, the sums needed for every
+##  pair of columns a and b over their common dates are matrix products:
+##
+##      n   = M_a' M_b      sx  = X_a' M_b      sy  = M_a' X_b
+##      sxx = (X_a²)' M_b   syy = M_a' (X_b²)   sxy = X_a' X_b
+##
+##  from which cov = (sxy - sx sy / n) / (n - 1) and corr = (n sxy - sx sy) /
+##  sqrt((n sxx - sx²)(n syy - sy²)). The funds are split into blocks of a bounded number of
+##  columns and the matrix is built one pair of blocks at a time, in a pool of threads (NumPy's
+##  matrix products release the GIL), so the working memory does not grow with the square of
+##  the number of funds. The result can be written straight into a memory-mapped float32 .npy
+##  file, and the most correlated peers of one fund can be found without building the matrix.
+##
+##  Usage:
+##
+##      python correlation.py -c config.toml [--weekly] [--covariance] [--output corr.npy]
+##          [--peers LABEL [--top 10]] [--store STORE_DIR | --cache-dir DIR [--offline]]
+##
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import pandas
+
+from nav_data import read_fund_config, add_source_arguments, load_daily_navs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE = 256       # Funds per block; a pair of blocks needs a few 256 x 256 arrays
+DEFAULT_MIN_PERIODS = 20       # Fewer common returns than this give NaN
+DEFAULT_TOP_K = 10
+KINDS = ('correlation', 'covariance')
+
+def period_returns(dates, daily_navs, frequency='daily'):
+    """
+    Computes log returns from a forward-filled, calendar-daily NAV matrix.
+
+    Parameters:
+    dates (datetime64[D] array): The dates of the rows of `daily_navs`.
+    daily_navs (2-D numpy array): NAVs, one row per calendar day, one column per fund.
+    frequency (str): 'daily' for returns between business days, 'weekly' for returns
+    between Fridays. Weekends are dropped, as they would only add zero returns.
+
+    Returns:
+    2-D numpy array: One row per period and one column per fund; NaN before a fund's first NAV.
+    """
+    if frequency == 'daily':
+        rows = numpy.flatnonzero(numpy.is_busday(dates))
+    elif frequency == 'weekly':
+        rows = numpy.flatnonzero(numpy.is_busday(dates, weekmask='Fri'))
+    else:
+        raise ValueError(f"Unknown return frequency: {frequency}")
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return numpy.diff(numpy.log(daily_navs[rows]), axis=0)
+
+class PairwiseSums:
+    """
+    Holds X, X² and M (see above) in column-major order, so that a block of funds is a
+    contiguous slice, and computes the statistics of pairs of blocks.
+    """
+    def __init__(self, returns, min_periods=DEFAULT_MIN_PERIODS):
+        present = ~numpy.isnan(returns)
+        self.mask = numpy.asfortranarray(present, dtype=numpy.float64)
+        self.values = numpy.asfortranarray(numpy.where(present, returns, 0.0))
+        self.squares = self.values * self.values
+        self.min_periods = min_periods
+        self.n_funds = returns.shape[1]
+
+    def block(self, rows, columns, kind='correlation'):
+        """
+        Returns the correlations or covariances of the funds in the slice `rows` with the
+        funds in the slice `columns`, as a 2-D float64 array.
+        """
+        x, x2, mx = self.values[:, rows], self.squares[:, rows], self.mask[:, rows]
+        y, y2, my = self.values[:, columns], self.squares[:, columns], self.mask[:, columns]
+        n = mx.T @ my
+        sx = x.T @ my
+        sy = mx.T @ y
+        sxy = x.T @ y
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            if kind == 'covariance':
+                result = (sxy - sx * sy / n) / (n - 1)
+            else:
+                sxx = x2.T @ my
+                syy = mx.T @ y2
+                result = (n * sxy - sx * sy) / numpy.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+                numpy.clip(result, -1.0, 1.0, out=result)
+        result[n < max(self.min_periods, 2)] = numpy.nan
+        return result
+# End class PairwiseSums
+
+def blocks(n_funds, block_size):
+    return [slice(start, min(start + block_size, n_funds)) for start in range(0, n_funds, block_size)]
+
+def pairwise_matrix(returns, kind='correlation', block_size=DEFAULT_BLOCK_SIZE, max_workers=None, \
+                    min_periods=DEFAULT_MIN_PERIODS, path=None):
+    """
+    Computes the full correlation or covariance matrix of the funds, one pair of blocks of
+    funds at a time.
+
+    Parameters:
+    returns (2-D numpy array): Returns, one column per fund, NaN where a fund has none.
+    kind (str): 'correlation' or 'covariance'.
+    block_size (int): The largest number of funds in a block.
+    max_workers (int): Threads computing blocks at once; None lets the executor choose.
+    min_periods (int): The fewest common returns for which a pair gets a value.
+    path (str): If given, the matrix is written to this .npy file, memory-mapped, instead of
+    being kept in memory.
+
+    Returns:
+    numpy array (or numpy.memmap): The float32 matrix, NaN where a pair has too few returns.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown kind of matrix: {kind}")
+    sums = PairwiseSums(returns, min_periods)
+    shape = (sums.n_funds, sums.n_funds)
+    if path is None:
+        matrix = numpy.empty(shape, dtype=numpy.float32)
+    else:
+        matrix = numpy.lib.format.open_memmap(path, mode='w+', dtype=numpy.float32, shape=shape)
+
+    def fill(pair):
+        # Each pair of blocks writes its own two regions of the matrix, so no locking is needed
+        rows, columns = pair
+        block = sums.block(rows, columns, kind)
+        matrix[rows, columns] = block
+        if rows != columns:
+            matrix[columns, rows] = block.T
+
+    fund_blocks = blocks(sums.n_funds, block_size)
+    pairs = [(rows, columns) for i, rows in enumerate(fund_blocks) for columns in fund_blocks[i:]]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _ in executor.map(fill, pairs):
+            pass
+    if path is not None:
+        matrix.flush()
+    return matrix
+
+def top_k_peers(returns, column, k=DEFAULT_TOP_K, kind='correlation', \
+                block_size=DEFAULT_BLOCK_SIZE, min_periods=DEFAULT_MIN_PERIODS):
+    """
+    Finds the funds most correlated with (or with the largest covariance with) one fund,
+    computing only that fund's row of the matrix, a block at a time.
+
+    Returns:
+    tuple: (indices of the peers, their correlations or covariances), best first. The fund
+    itself and funds with too few common returns are left out.
+    """
+    sums = PairwiseSums(returns, min_periods)
+    row = numpy.concatenate([sums.block(slice(column, column + 1), columns, kind)[0] \
+                             for columns in blocks(sums.n_funds, block_size)])
+    row[column] = numpy.nan
+    candidates = numpy.flatnonzero(~numpy.isnan(row))
+    if len(candidates) > k:
+        candidates = candidates[numpy.argpartition(-row[candidates], k - 1)[:k]]
+    best = candidates[numpy.argsort(-row[candidates], kind='stable')]
+    return best, row[best]
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    logging.getLogger('nav_fetcher').setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Compute the return correlations of a configuration's funds.")
+    parser.add_argument('-c', '--config', type=str, default='config.toml', \
+                        help='Path to the TOML configuration file')
+    parser.add_argument('--weekly', action='store_true', help='Use weekly instead of daily returns')
+    parser.add_argument('--covariance', action='store_true', \
+                        help='Compute covariances instead of correlations')
+    parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE, \
+                        help='The largest number of funds processed as one block')
+    parser.add_argument('--workers', type=int, default=None, \
+                        help='Threads computing blocks at once')
+    parser.add_argument('--min-periods', type=int, default=DEFAULT_MIN_PERIODS, \
+                        help='The fewest common returns for which a pair of funds gets a value')
+    parser.add_argument('--output', type=str, default=None, \
+                        help='Write the matrix to this .npy file, and the fund labels next to it')
+    parser.add_argument('--peers', type=str, default=None, metavar='LABEL', \
+                        help="Only list this fund's most correlated peers")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_K, help='The number of peers to list')
+    add_source_arguments(parser)
+    args = parser.parse_args()
+    kind = 'covariance' if args.covariance else 'correlation'
+
+    try:
+        urls, labels, _ = read_fund_config(args.config)
+        dates, daily_navs, labels = load_daily_navs(urls, labels, args)
+    except (OSError, KeyError, ValueError) as e:
+        logger.critical(e)
+        sys.exit(1)
+    returns = period_returns(dates, daily_navs, 'weekly' if args.weekly else 'daily')
+
+    started = time.perf_counter()
+    if args.peers is not None:
+        if args.peers not in labels:
+            logger.critical(f"No fund is labelled '{args.peers}'")
+            sys.exit(1)
+        peers, values = top_k_peers(returns, labels.index(args.peers), args.top, kind, \
+                                    args.block_size, args.min_periods)
+        for peer, value in zip(peers, values):
+            print(f"{value:8.4f}  {labels[peer]}")
+    else:
+        matrix = pairwise_matrix(returns, kind, args.block_size, args.workers, args.min_periods, \
+                                 args.output)
+        if args.output is not None:
+            with open(f"{os.path.splitext(args.output)[0]}.labels.json", 'w', encoding='utf-8') as f:
+                json.dump(labels, f)
+            logger.info(f"Wrote the {len(labels)} x {len(labels)} {kind} matrix to {args.output}")
+        else:
+            print(pandas.DataFrame(matrix, index=labels, columns=labels).round(4).to_string())
+    logger.info(f"Computed the {kind}s of {len(labels)} funds over {len(returns)} returns " \
+                f"in {time.perf_counter() - started:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+##
+##  Timing spans and latency histograms of the interactive plot
+##
+##  An Instrumentation records
+##
+##    - spans: the start and the duration of each stage of the startup, from the StartupTimer,
+##      and the time from the start of the program until the first frame was drawn;
+##    - per GUI event handler, a histogram of the time the handler itself takes, including any
+##      blit or synchronous draw it does;
+##    - per handler that asks for a redraw, a histogram of the time from the start of the
+##      handler to the end of the next full draw of the figure, which is what the user waits
+##      for; and a histogram of the full draws themselves.
+##
+##  The histograms have fixed, logarithmically spaced buckets (four per doubling, from 10 us to
+##  about 170 s), so recording a latency is a binary search and an increment, and the p50, p90
+##  and p99 latencies are interpolated within their buckets. A disabled Instrumentation hands
+##  back the handlers unwrapped and records nothing, so it costs nothing.
+##
+##  The measurements can be dumped at any time as JSON or, for a file name ending in ".prom" or
+##  ".txt", in Prometheus's text exposition format. plot_mutual_funds.py turns instrumentation
+##  on with
+##
+##      python plot_mutual_funds.py -c config.toml --instrument timings.json
+##
+##  and writes the file when the key 'i' is pressed and when the window is closed.
+##
+
+import json
+import logging
+import math
+import os
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_PER_DOUBLING = 4
+BUCKET_BOUNDS = [1e-5 * 2 ** (k / BUCKETS_PER_DOUBLING) for k in range(97)]   # Upper bounds, in seconds
+QUANTILES = (0.5, 0.9, 0.99)
+PROMETHEUS_SUFFIXES = ('.prom', '.txt')
+
+class Histogram:
+    """A latency histogram with the fixed buckets of BUCKET_BOUNDS, and one for longer latencies."""
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Returns the latency below which a fraction `q` of the observations fall, or None."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = BUCKET_BOUNDS[bucket - 1] if bucket > 0 else 0.0
+                upper = BUCKET_BOUNDS[bucket] if bucket < len(BUCKET_BOUNDS) else self.max
+                estimate = lower + (upper - lower) * (rank - cumulative) / count
+                return min(max(estimate, self.min), self.max)
+            cumulative += count
+        return self.max
+
+    def to_dict(self):
+        summary = {'count': self.count, 'sum': self.sum, \
+                   'mean': self.sum / self.count if self.count else None, \
+                   'min': self.min if self.count else None, 'max': self.max if self.count else None}
+        for q in QUANTILES:
+            summary[f"p{q * 100:g}"] = self.quantile(q)
+        # Only the buckets that were hit, as [upper bound, count]; None is the overflow bucket
+        summary['buckets'] = [[BUCKET_BOUNDS[bucket] if bucket < len(BUCKET_BOUNDS) else None, count] \
+                              for bucket, count in enumerate(self.counts) if count]
+        return summary
+
+    def prometheus_lines(self, metric, labels):
+        """Returns the lines of this histogram in Prometheus's text format."""
+        label_text = ','.join(f'{name}="{value}"' for name, value in labels.items())
+        separator = ',' if label_text else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(BUCKET_BOUNDS, self.counts):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{label_text}{separator}le="{bound:.6g}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{{label_text}{separator}le="+Inf"}} {self.count}')
+        braces = f"{{{label_text}}}" if label_text else ''
+        lines.append(f"{metric}_sum{braces} {self.sum!r}")
+        lines.append(f"{metric}_count{braces} {self.count}")
+        return lines
+# End class Histogram
+
+class Instrumentation:
+    def __init__(self, path=None, enabled=None, started=None):
+        """
+        Parameters:
+        path (str): Where `dump` writes the measurements; Prometheus's text format for a name
+                    ending in ".prom" or ".txt", and JSON otherwise.
+        enabled (bool): Whether to record anything; by default, if there is a `path`.
+        started (float): The `time.perf_counter` value from which the spans' starts are counted;
+                         by default, now.
+        """
+        self.path = path
+        self.enabled = path is not None if enabled is None else enabled
+        self.started = time.perf_counter() if started is None else started
+        self.spans = []             # (name, start, end), as `time.perf_counter` values
+        self.handlers = {}          # Handler name: Histogram of the handler's own time
+        self.frames = {}            # Handler name: Histogram of the time until the next full draw
+        self.draws = Histogram()    # Full draws of the figure
+        self.draw_requests = 0      # Calls of the canvas's `draw_idle`
+        self.waiting = {}           # Handler name: start of its earliest call still waiting for a draw
+
+    def record_span(self, name, start, end):
+        if self.enabled:
+            self.spans.append((name, start, end))
+
+    def wrap(self, name, handler):
+        """Returns `handler`, timed into the histograms of `name` if instrumentation is enabled."""
+        if not self.enabled:
+            return handler
+        histogram = self.handlers.setdefault(name, Histogram())
+        self.frames.setdefault(name, Histogram())
+        perf_counter = time.perf_counter
+
+        def timed_handler(*args, **kwargs):
+            draw_requests = self.draw_requests
+            start = perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - start)
+                if self.draw_requests != draw_requests:
+                    self.waiting.setdefault(name, start)
+        return timed_handler
+
+    def watch_figure(self, figure):
+        """Times the full draws of a figure, and counts the redraws asked of its canvas."""
+        if not self.enabled:
+            return
+        draw, draw_idle = figure.draw, figure.canvas.draw_idle
+        perf_counter = time.perf_counter
+
+        def timed_draw(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return draw(*args, **kwargs)
+            finally:
+                end = perf_counter()
+                self.draws.observe(end - start)
+                for name, handler_start in self.waiting.items():
+                    self.frames[name].observe(end - handler_start)
+                self.waiting.clear()
+
+        def counted_draw_idle(*args, **kwargs):
+            self.draw_requests += 1
+            return draw_idle(*args, **kwargs)
+
+        # Instance attributes take the place of the methods, for the canvas's calls too
+        figure.draw = timed_draw
+        figure.canvas.draw_idle = counted_draw_idle
+
+    def to_dict(self):
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'uptime': time.perf_counter() - self.started,
+            'spans': [{'name': name, 'start': start - self.started, 'seconds': end - start} \
+                      for name, start, end in self.spans],
+            'handlers': {name: histogram.to_dict() for name, histogram in self.handlers.items()},
+            'frames': {name: histogram.to_dict() for name, histogram in self.frames.items()},
+            'draw': self.draws.to_dict(),
+        }
+
+    def to_prometheus(self):
+        lines = ['# HELP plot_stage_seconds Duration of each stage of the startup',
+                 '# TYPE plot_stage_seconds gauge']
+        lines += [f'plot_stage_seconds{{stage="{name}"}} {end - start!r}' for name, start, end in self.spans]
+        for metric, help_text, histograms in [
+                ('plot_handler_seconds', "Time taken by each GUI event handler", self.handlers),
+                ('plot_handler_frame_seconds', "Time from a GUI event handler's start to the end " \
+                                               "of the redraw it asked for", self.frames)]:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+            for name, histogram in histograms.items():
+                lines += histogram.prometheus_lines(metric, {'handler': name})
+        lines += ['# HELP plot_draw_seconds Time taken by each full draw of the figure',
+                  '# TYPE plot_draw_seconds histogram']
+        lines += self.draws.prometheus_lines('plot_draw_seconds', {})
+        return '\n'.join(lines) + '\n'
+
+    def summary_lines(self):
+        """Returns one line per handler with its call count and its p50 and p99 latencies."""
+        lines = []
+        for name, histogram in self.handlers.items():
+            if histogram.count == 0:
+                continue
+            line = f"{name:<16} {histogram.count:6d} calls, p50 {histogram.quantile(0.5) * 1e3:8.2f} ms, " \
+                   f"p99 {histogram.quantile(0.99) * 1e3:8.2f} ms"
+            frames = self.frames[name]
+            if frames.count:
+                line += f"; until drawn: p50 {frames.quantile(0.5) * 1e3:8.2f} ms, " \
+                        f"p99 {frames.quantile(0.99) * 1e3:8.2f} ms"
+            lines.append(line)
+        if self.draws.count:
+            lines.append(f"{'draw':<16} {self.draws.count:6d} draws, " \
+                         f"p50 {self.draws.quantile(0.5) * 1e3:8.2f} ms, p99 {self.draws.quantile(0.99) * 1e3:8.2f} ms")
+        return lines
+
+    def dump(self, path=None):
+        """
+        Writes the measurements to `path`, or to the path given at construction, and logs a
+        summary of them.
+
+        Returns:
+        str: The path written, or None if instrumentation is disabled.
+
+        Raises:
+        OSError: If the file cannot be written.
+        """
+        path = self.path if path is None else path
+        if not self.enabled or path is None:
+            return None
+        if path.endswith(PROMETHEUS_SUFFIXES):
+            text = self.to_prometheus()
+        else:
+            text = json.dumps(self.to_dict(), indent=2)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temporary_path, path)
+        for line in self.summary_lines():
+            logger.info(f"Latency: {line}")
+        logger.info(f"Wrote the timings to {path}")
+        return path
+# End class Instrumentation
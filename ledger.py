@@ -0,0 +1,223 @@
+##
+##  Money-weighted returns (XIRRs) of real purchase and redemption ledgers
+##
+##  A ledger is a CSV file of transactions with the columns scheme_code, date (dd-mm-yyyy, or
+##  yyyy-mm-dd) and amount: positive for money invested in the scheme, negative for money taken
+##  out of it. An optional portfolio column lets one file hold many ledgers. Every transaction
+##  buys or sells units at the NAV in force on its date, and every holding (a scheme within a
+##  portfolio) is valued at the NAV of the valuation date.
+##
+##  The XIRRs of every holding and of every portfolio as a whole are then solved together by
+##  xirr.xirr_ragged: a portfolio's cash flows are all its holdings' flows, so each flow is
+##  given twice, once with its holding's set number and once with its portfolio's. Nothing
+##  loops over transactions, holdings or portfolios.
+##
+##  Usage:
+##
+##      python ledger.py LEDGER_CSV [-c config.toml] [--as-of dd-mm-yyyy] [--csv FILE]
+##          [--base-url https://api.mfapi.in/mf] [--store STORE_DIR | --cache-dir DIR [--offline]]
+##
+
+import argparse
+import logging
+import sys
+import time
+
+import numpy
+import pandas
+
+from bulk_ingest import DEFAULT_BASE_URL
+from nav_cache import scheme_code_from_url
+from nav_data import read_fund_config, parse_date, add_source_arguments, load_daily_navs
+from xirr import xirr_ragged, DAYS_PER_YEAR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTFOLIO = 'portfolio'    # The portfolio of a ledger without a portfolio column
+TOTAL = 'total'                    # The scheme code shown on a portfolio's aggregate row
+LEDGER_COLUMNS = ('scheme_code', 'date', 'amount')
+
+def read_ledger(path):
+    """
+    Reads a ledger CSV file.
+
+    Returns:
+    pd.DataFrame: The columns portfolio and scheme_code (str), date (datetime64) and amount
+    (float), one row per transaction.
+
+    Raises:
+    ValueError: If a column is missing, or a date or an amount cannot be read.
+    """
+    ledger = pandas.read_csv(path, dtype=str, skipinitialspace=True)
+    ledger.columns = [column.strip().lower() for column in ledger.columns]
+    missing = [column for column in LEDGER_COLUMNS if column not in ledger.columns]
+    if missing:
+        raise ValueError(f"The ledger {path} has no column {', '.join(missing)}")
+    if 'portfolio' not in ledger.columns:
+        ledger['portfolio'] = DEFAULT_PORTFOLIO
+    dates = ledger['date'].str.strip()
+    parsed = pandas.to_datetime(dates, format='%d-%m-%Y', errors='coerce')
+    parsed = parsed.fillna(pandas.to_datetime(dates, format='%Y-%m-%d', errors='coerce'))
+    if parsed.isna().any():
+        raise ValueError(f"The ledger {path} has dates that are neither dd-mm-yyyy nor yyyy-mm-dd")
+    amounts = pandas.to_numeric(ledger['amount'].str.replace(',', ''), errors='coerce')
+    if amounts.isna().any():
+        raise ValueError(f"The ledger {path} has amounts that are not numbers")
+    return pandas.DataFrame({'portfolio': ledger['portfolio'].str.strip(), \
+                             'scheme_code': ledger['scheme_code'].str.strip(), \
+                             'date': parsed, 'amount': amounts.astype(numpy.float64)})
+
+def value_ledgers(ledger, dates, daily_navs, scheme_codes, as_of=None):
+    """
+    Values every holding and every portfolio of a ledger and solves their XIRRs.
+
+    Parameters:
+    ledger (pd.DataFrame): Transactions, as returned by read_ledger.
+    dates (datetime64[D] array): The dates of the rows of `daily_navs`, one per calendar day.
+    daily_navs (2-D numpy array): Forward-filled NAVs, one column per scheme.
+    scheme_codes (list of str): The scheme code of each column of `daily_navs`.
+    as_of (datetime64[D]): The valuation date; the last of `dates` if None. Transactions
+    after it are left out.
+
+    Returns:
+    pd.DataFrame: One row per holding, followed by each portfolio's aggregate row (with the
+    scheme code 'total'), indexed by (portfolio, scheme_code), with the columns first_date,
+    transactions, invested, redeemed, units, nav, value, xirr and converged.
+
+    Raises:
+    ValueError: If a transaction's scheme has no NAVs, or none of the transactions can be valued.
+    """
+    as_of = dates[-1] if as_of is None else numpy.datetime64(as_of, 'D')
+    as_of_row = int((as_of - dates[0]).astype(numpy.int64))
+    if not 0 <= as_of_row < len(dates):
+        raise ValueError(f"There are no NAVs on the valuation date {as_of}")
+    fund_columns = pandas.Index(scheme_codes).get_indexer(ledger['scheme_code'])
+    if (fund_columns < 0).any():
+        unknown = sorted(set(ledger['scheme_code'][fund_columns < 0]))
+        raise ValueError(f"There are no NAVs for the scheme(s) {', '.join(unknown)}")
+
+    days = ledger['date'].to_numpy().astype('datetime64[D]')
+    rows = (days - dates[0]).astype(numpy.int64)
+    transaction_navs = numpy.full(len(ledger), numpy.nan)
+    in_range = (rows >= 0) & (rows <= as_of_row)
+    transaction_navs[in_range] = daily_navs[rows[in_range], fund_columns[in_range]]
+    valued = ~numpy.isnan(transaction_navs)
+    if numpy.count_nonzero(~valued):
+        logger.warning(f"Leaving out {numpy.count_nonzero(~valued)} transaction(s) dated before " \
+                       f"their scheme's first NAV or after the valuation date")
+    if not valued.any():
+        raise ValueError("None of the transactions can be valued")
+    portfolio_ids, portfolios = pandas.factorize(ledger['portfolio'].to_numpy()[valued])
+    fund_columns, days, amounts = fund_columns[valued], days[valued], ledger['amount'].to_numpy()[valued]
+    transaction_navs = transaction_navs[valued]
+    n_funds, n_portfolios = len(scheme_codes), len(portfolios)
+
+    # A holding is a (portfolio, scheme) pair; holdings are numbered in that order
+    holding_keys, holding_ids = numpy.unique(portfolio_ids * n_funds + fund_columns, return_inverse=True)
+    n_holdings = len(holding_keys)
+    holding_portfolios, holding_columns = numpy.divmod(holding_keys, n_funds)
+    units = numpy.bincount(holding_ids, weights=amounts / transaction_navs, minlength=n_holdings)
+    navs = daily_navs[as_of_row, holding_columns]
+    values = units * navs
+    invested = numpy.bincount(holding_ids, weights=numpy.maximum(amounts, 0.0), minlength=n_holdings)
+    redeemed = numpy.bincount(holding_ids, weights=numpy.maximum(-amounts, 0.0), minlength=n_holdings)
+    counts = numpy.bincount(holding_ids, minlength=n_holdings)
+
+    # Holdings are sets 0 to n_holdings - 1 and portfolios the sets after them. A transaction is
+    # an outflow of the investor; each holding's value is an inflow on the valuation date.
+    n_sets = n_holdings + n_portfolios
+    flow_amounts = numpy.concatenate([-amounts, values])
+    flow_days = numpy.concatenate([days, numpy.full(n_holdings, as_of)]).astype(numpy.int64)
+    flow_holdings = numpy.concatenate([holding_ids, numpy.arange(n_holdings)])
+    set_ids = numpy.concatenate([flow_holdings, n_holdings + holding_portfolios[flow_holdings]])
+    flow_amounts = numpy.concatenate([flow_amounts, flow_amounts])
+    flow_days = numpy.concatenate([flow_days, flow_days])
+    first_days = numpy.full(n_sets, numpy.iinfo(numpy.int64).max)
+    numpy.minimum.at(first_days, set_ids, flow_days)
+    times = (flow_days - first_days[set_ids]) / DAYS_PER_YEAR
+    rates, converged = xirr_ragged(flow_amounts, times, set_ids, n_sets)
+
+    def per_portfolio(values):
+        return numpy.bincount(holding_portfolios, weights=values, minlength=n_portfolios)
+
+    table = pandas.DataFrame({
+        'portfolio': numpy.concatenate([portfolios[holding_portfolios], portfolios]),
+        'scheme_code': numpy.concatenate([numpy.asarray(scheme_codes, dtype=object)[holding_columns], \
+                                          numpy.full(n_portfolios, TOTAL, dtype=object)]),
+        'first_date': first_days.astype('datetime64[D]'),
+        'transactions': numpy.concatenate([counts, per_portfolio(counts)]).astype(numpy.int64),
+        'invested': numpy.concatenate([invested, per_portfolio(invested)]),
+        'redeemed': numpy.concatenate([redeemed, per_portfolio(redeemed)]),
+        'units': numpy.concatenate([units, numpy.full(n_portfolios, numpy.nan)]),
+        'nav': numpy.concatenate([navs, numpy.full(n_portfolios, numpy.nan)]),
+        'value': numpy.concatenate([values, per_portfolio(values)]),
+        'xirr': rates,
+        'converged': converged,
+    })
+    # Each portfolio's holdings, then its aggregate row, in the order the ledger first names them
+    order = numpy.lexsort((numpy.arange(n_sets) >= n_holdings, \
+                           numpy.concatenate([holding_portfolios, numpy.arange(n_portfolios)])))
+    return table.iloc[order].set_index(['portfolio', 'scheme_code'])
+
+def format_valuation(table):
+    """Formats a valuation table for the terminal, with amounts in rupees and XIRRs in percent."""
+    rupees = lambda value: '-' if pandas.isna(value) else f"{value:,.0f}"
+    formatters = {'first_date': lambda value: value.strftime('%d-%m-%Y'), \
+                  'invested': rupees, 'redeemed': rupees, 'value': rupees, \
+                  'units': lambda value: '-' if pandas.isna(value) else f"{value:,.3f}", \
+                  'nav': lambda value: '-' if pandas.isna(value) else f"{value:,.4f}", \
+                  'xirr': lambda value: '-' if pandas.isna(value) else f"{value * 100:.2f}%"}
+    return table.to_string(formatters=formatters, na_rep='-')
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    logging.getLogger('nav_fetcher').setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Compute the XIRRs of the holdings of a transaction ledger.")
+    parser.add_argument('ledger', type=str, help='The ledger CSV file (scheme_code, date, amount[, portfolio])')
+    parser.add_argument('-c', '--config', type=str, default=None, \
+                        help="Take the URLs and labels of the configuration's funds from this TOML file")
+    parser.add_argument('--base-url', type=str, default=DEFAULT_BASE_URL, \
+                        help='The NAV history of a scheme not in the configuration is at BASE_URL/CODE')
+    parser.add_argument('--as-of', type=parse_date, default=None, \
+                        help='The valuation date (dd-mm-yyyy); the last date with NAVs by default')
+    parser.add_argument('--csv', type=str, default=None, help='Also write the table to this CSV file')
+    add_source_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        ledger = read_ledger(args.ledger)
+        known = {}
+        if args.config is not None:
+            urls, labels, _ = read_fund_config(args.config)
+            known = {scheme_code_from_url(url): (url, label) for url, label in zip(urls, labels)}
+        codes = list(dict.fromkeys(ledger['scheme_code']))
+        base_url = args.base_url.rstrip('/')
+        urls = [known[code][0] if code in known else f"{base_url}/{code}" for code in codes]
+        # Load the NAVs under the scheme codes, since two funds of the configuration may share a label
+        dates, daily_navs, kept_codes = load_daily_navs(urls, codes, args)
+        missing = set(codes) - set(kept_codes)
+        if missing:
+            logger.warning(f"Leaving out the transactions in {', '.join(sorted(missing))}, which have no NAVs")
+            ledger = ledger[ledger['scheme_code'].isin(kept_codes)]
+        as_of = None if args.as_of is None else numpy.datetime64(args.as_of.date(), 'D')
+        started = time.perf_counter()
+        table = value_ledgers(ledger, dates, daily_navs, kept_codes, as_of)
+    except (OSError, KeyError, ValueError) as e:
+        logger.critical(e)
+        sys.exit(1)
+    n_portfolios = numpy.count_nonzero(table.index.get_level_values('scheme_code') == TOTAL)
+    logger.info(f"Valued {len(ledger)} transactions in {len(table) - n_portfolios} holdings of " \
+                f"{n_portfolios} portfolio(s) in {time.perf_counter() - started:.3f} s; " \
+                f"{numpy.count_nonzero(~table['converged'])} XIRR(s) did not converge")
+
+    labels = {code: label for code, (_, label) in known.items()}
+    if labels:
+        table.insert(0, 'fund', [labels.get(code, '') for code in table.index.get_level_values('scheme_code')])
+    print(format_valuation(table))
+    if args.csv is not None:
+        table.to_csv(args.csv)
+        logger.info(f"Wrote the valuation to {args.csv}")
+
+if __name__ == "__main__":
+    main()
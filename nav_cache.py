@@ -0,0 +1,194 @@
+##
+##  A persistent on-disk cache of mutual fund NAV histories
+##
+##  Each scheme's history is kept in its own JSON file, named after the scheme code,
+##  in the same shape as an mfapi.in response (a `meta` block plus `data` rows of
+##  'dd-mm-yyyy' dates and NAVs, newest first), together with the HTTP validators
+##  (ETag, Last-Modified) that came with it.
+##
+##  An entry younger than the cache's maximum age is used without touching the network.
+##  An older entry is revalidated with a conditional request; if the server answers
+##  "304 Not Modified" the cached history is reused, otherwise only the rows dated after
+##  the newest cached row are merged into it. In offline mode the network is never used.
+##
+
+import json
+import logging
+import os
+import time
+from urllib.parse import urlparse
+
+from nav_parser import decode_payload, NavParseError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'plot_mutual_funds', 'navs')
+DEFAULT_MAX_AGE = 12 * 60 * 60   # Seconds for which a cached history is used without revalidation
+
+def scheme_code_from_url(url):
+    """Returns the scheme code at the end of an mfapi.in URL like 'https://api.mfapi.in/mf/129312'."""
+    return urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]
+
+def source_url(url, data_source):
+    """Points an mfapi.in URL at another server with the same API, e.g. nav_server.py, if one is given."""
+    if data_source is None:
+        return url
+    return f"{data_source.rstrip('/')}/mf/{scheme_code_from_url(url)}"
+
+def date_key(date):
+    """Turns a 'dd-mm-yyyy' date into a 'yyyymmdd' string, which sorts chronologically."""
+    return date[6:10] + date[3:5] + date[0:2]
+
+class NavCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_age=DEFAULT_MAX_AGE, offline=False):
+        self.directory = directory
+        self.max_age = max_age
+        self.offline = offline
+        self.hits = 0          # Histories served from the cache, including "304 Not Modified"
+        self.misses = 0        # Histories that were not cached, or could not be served at all
+        self.bytes_saved = 0   # Response bytes that did not have to be downloaded
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, scheme_code):
+        return os.path.join(self.directory, f"{scheme_code}.json")
+
+    def load(self, scheme_code):
+        """Returns the cached entry for a scheme, or None if there is no usable entry."""
+        try:
+            with open(self.path_for(scheme_code), 'rb') as f:
+                return decode_payload(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, NavParseError) as e:
+            logger.warning(f"Ignoring unreadable cache entry for scheme {scheme_code}: {e}")
+            return None
+
+    def store(self, scheme_code, entry):
+        # Write to a temporary file first so that an interrupted run never leaves a torn entry
+        path = self.path_for(scheme_code)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+    def scheme_codes(self):
+        """Returns the codes of all the schemes in the cache."""
+        return sorted(name[:-len('.json')] for name in os.listdir(self.directory) \
+                      if name.endswith('.json'))
+
+    def is_fresh(self, entry):
+        return time.time() - entry.get('fetched_at', 0) < self.max_age
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    @staticmethod
+    def new_entry(payload, result):
+        return {
+            'meta': payload.get('meta', {}),
+            'data': payload.get('data', []),
+            'etag': result.headers.get('ETag'),
+            'last_modified': result.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+            'nbytes': len(result.content),
+        }
+
+    @staticmethod
+    def merge(entry, payload, result):
+        """
+        Merges a freshly downloaded payload into a cached entry.
+
+        Only the rows dated after the newest cached row are added; the cached rows are kept.
+
+        Returns:
+        int: The number of rows added.
+        """
+        cached_rows = entry.get('data', [])
+        newest = max((date_key(row['date']) for row in cached_rows), default='')
+        new_rows = [row for row in payload.get('data', []) if date_key(row['date']) > newest]
+        entry['data'] = new_rows + cached_rows
+        entry['meta'] = payload.get('meta', entry.get('meta', {}))
+        entry['etag'] = result.headers.get('ETag')
+        entry['last_modified'] = result.headers.get('Last-Modified')
+        entry['fetched_at'] = time.time()
+        entry['nbytes'] = len(result.content)
+        return len(new_rows)
+
+    def fetch_all(self, urls, labels, fetcher):
+        """
+        Gets the NAV histories of the funds, from the cache where possible.
+
+        Parameters:
+        urls (list of str): The mfapi.in-style URLs of the funds.
+        labels (list of str): The names of the funds, in the same order, for log messages.
+        fetcher (NavFetcher): Used for whatever has to come from the network.
+
+        Returns:
+        list of dict: mfapi.in-shaped payloads, in `urls` order; None where a fund's data
+        is unavailable.
+        """
+        codes = [scheme_code_from_url(url) for url in urls]
+        entries = [self.load(code) for code in codes]
+        payloads = [None] * len(urls)
+        stale = []   # Indices of the funds that need the network
+
+        for i, entry in enumerate(entries):
+            if entry is not None and (self.offline or self.is_fresh(entry)):
+                payloads[i] = entry
+                self.hits += 1
+                self.bytes_saved += entry.get('nbytes', 0)
+            elif self.offline:
+                logger.warning(f"Offline, and no cached data for {labels[i]}")
+                self.misses += 1
+            else:
+                stale.append(i)
+
+        if stale:
+            results = fetcher.fetch_all([urls[i] for i in stale], [labels[i] for i in stale], \
+                                        {urls[i]: self.conditional_headers(entries[i]) \
+                                         for i in stale if entries[i] is not None})
+            for i, result in zip(stale, results):
+                entry = entries[i]
+                if result.status_code == 304 and entry is not None:
+                    entry['fetched_at'] = time.time()
+                    self.store(codes[i], entry)
+                    payloads[i] = entry
+                    self.hits += 1
+                    self.bytes_saved += entry.get('nbytes', 0)
+                elif result.ok:
+                    try:
+                        payload = decode_payload(result.content)
+                    except NavParseError as e:
+                        logger.warning(f"Bad response for {labels[i]}: {e}")
+                        payloads[i] = entry
+                        self.misses += 1
+                        continue
+                    if entry is not None:
+                        added = self.merge(entry, payload, result)
+                        logger.debug(f"Merged {added} new NAV(s) into the cached data for {labels[i]}")
+                    else:
+                        entry = self.new_entry(payload, result)
+                    self.store(codes[i], entry)
+                    payloads[i] = entry
+                    self.misses += 1
+                elif entry is not None:
+                    logger.warning(f"Using stale cached data for {labels[i]}: {result.error}")
+                    payloads[i] = entry
+                    self.hits += 1
+                    self.bytes_saved += entry.get('nbytes', 0)
+                else:
+                    self.misses += 1
+
+        self.log_stats()
+        return payloads
+
+    def log_stats(self):
+        logger.info(f"NAV cache: {self.hits} hit(s), {self.misses} miss(es), " \
+                    f"{self.bytes_saved} bytes saved")
+# End class NavCache
@@ -0,0 +1,145 @@
+##
+##  Loading the NAVs of a configuration's funds outside the interactive plot
+##
+##  The command-line tools (batch rendering, rolling returns, and so on) all need the same
+##  thing as the plot: the NAVs of the funds of a TOML configuration, aligned on one
+##  calendar-daily date index and forward-filled over weekends and holidays. They get them
+##  either from a memory-mapped NAV store (--store) or through the NAV cache, with the same
+##  command-line options as plot_mutual_funds.py.
+##
+
+import argparse
+import logging
+
+import numpy
+import pandas
+import toml
+
+from nav_fetcher import NavFetcher, DEFAULT_MAX_WORKERS, DEFAULT_TIMEOUT, DEFAULT_RETRIES
+from nav_cache import NavCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_AGE, scheme_code_from_url
+from nav_store import NavStore
+from nav_parser import parse_nav_payload, NavParseError
+
+logger = logging.getLogger(__name__)
+
+def read_fund_config(path):
+    """
+    Reads the URLs, labels and colors of a configuration file's `[constants]` table.
+
+    Raises:
+    ValueError: If a key is missing or the arrays do not all have the same length.
+    """
+    try:
+        constants = toml.load(path)['constants']
+        urls, labels, colors = constants['urls'], constants['labels'], constants['colors']
+    except KeyError as e:
+        raise ValueError(f"Missing key in configuration {path}: {e}") from None
+    if not (len(labels) == len(urls) and len(colors) == len(urls)):
+        raise ValueError(f"All constant arrays in {path} must have the same number of elements.")
+    return urls, labels, colors
+
+def parse_date(text):
+    """An argparse type for dates entered as dd-mm-yyyy, like the plot's text boxes."""
+    try:
+        return pandas.to_datetime(text, format='%d-%m-%Y')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' is not a date like 31-12-2023") from None
+
+def add_source_arguments(parser):
+    """Adds the options that say where the NAVs come from, as in plot_mutual_funds.py."""
+    parser.add_argument('--store', type=str, default=None, \
+                        help='Read the NAVs from this NAV store instead of fetching them')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR, \
+                        help='Directory of the on-disk NAV cache')
+    parser.add_argument('--cache-max-age', type=float, default=DEFAULT_MAX_AGE / 3600, \
+                        help='Hours for which cached NAVs are used without asking the server')
+    parser.add_argument('--offline', action='store_true', \
+                        help='Use only cached NAVs; never use the network')
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS, \
+                        help='The maximum number of NAV downloads in flight at once')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, \
+                        help='Seconds to wait for each NAV download attempt')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, \
+                        help='How many times to retry a failed NAV download')
+
+def open_cache(args):
+    return NavCache(args.cache_dir, max_age=args.cache_max_age * 3600, offline=args.offline)
+
+def fetch_payloads(urls, labels, cache, args):
+    """Gets the funds' mfapi.in payloads through the NAV cache; None where one is unavailable."""
+    with NavFetcher(max_workers=args.max_workers, timeout=args.timeout, \
+                    retries=args.retries) as fetcher:
+        return cache.fetch_all(urls, labels, fetcher)
+
+def forward_fill(navs):
+    """Fills each NaN with the last NAV above it in the same column, as `DataFrame.ffill` does."""
+    rows = numpy.where(numpy.isnan(navs), 0, numpy.arange(len(navs))[:, None])
+    numpy.maximum.accumulate(rows, axis=0, out=rows)
+    return navs[rows, numpy.arange(navs.shape[1])]
+
+def daily_matrix(funds):
+    """
+    Aligns funds on a calendar-daily index, from the first to the last date with any NAV.
+
+    Parameters:
+    funds (list of tuple): (datetime64 dates, float64 NAVs) per fund; neither may be empty.
+
+    Returns:
+    tuple: (datetime64[D] dates, float64 array of NAVs with one column per fund, NaN where
+    there is no NAV)
+    """
+    epoch = min(dates.min() for dates, _ in funds).astype('datetime64[D]')
+    last_date = max(dates.max() for dates, _ in funds).astype('datetime64[D]')
+    n_days = int((last_date - epoch).astype(numpy.int64)) + 1
+    navs = numpy.full((n_days, len(funds)), numpy.nan, order='F')
+    for column, (dates, fund_navs) in enumerate(funds):
+        navs[(dates.astype('datetime64[D]') - epoch).astype(numpy.int64), column] = fund_navs
+    return epoch + numpy.arange(n_days), navs
+
+def load_daily_navs(urls, labels, args):
+    """
+    Loads the NAVs of a configuration's funds, from the NAV store if `args.store` is set and
+    through the NAV cache otherwise. Funds without any NAVs are left out, with a warning.
+
+    Returns:
+    tuple: (datetime64[D] dates, forward-filled float64 NAVs with one column per fund in
+    column-major order, the labels of the columns)
+    """
+    codes = [scheme_code_from_url(url) for url in urls]
+    if args.store is not None:
+        store = NavStore(args.store)
+        kept = [(code, label) for code, label in zip(codes, labels) if code in store.columns]
+        for code, label in zip(codes, labels):
+            if code not in store.columns:
+                logger.warning(f"Skipping {label}: scheme {code} is not in the NAV store")
+        if not kept:
+            raise ValueError("None of the funds have NAVs.")
+        dates, navs = store.slice([code for code, _ in kept])
+        labels = [label for _, label in kept]
+        has_nav = numpy.flatnonzero(~numpy.isnan(navs).all(axis=1))
+        if len(has_nav) == 0:
+            raise ValueError("None of the funds have NAVs.")
+        rows = slice(has_nav[0], has_nav[-1] + 1)
+        dates, navs = dates[rows], navs[rows]
+    else:
+        funds = []
+        kept_labels = []
+        for payload, label in zip(fetch_payloads(urls, labels, open_cache(args), args), labels):
+            if payload is None:
+                logger.warning(f"Skipping {label}: its NAVs could not be fetched")
+                continue
+            try:
+                _, fund_dates, fund_navs = parse_nav_payload(payload)
+            except NavParseError as e:
+                logger.warning(f"Skipping {label}: {e}")
+                continue
+            if len(fund_dates) == 0:
+                logger.warning(f"Skipping {label}: the web service has no NAVs for it")
+                continue
+            funds.append((fund_dates, fund_navs))
+            kept_labels.append(label)
+        if not funds:
+            raise ValueError("None of the funds have NAVs.")
+        dates, navs = daily_matrix(funds)
+        labels = kept_labels
+    return dates, numpy.asfortranarray(forward_fill(navs)), labels
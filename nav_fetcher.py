@@ -0,0 +1,165 @@
+##
+##  Concurrent fetching of mutual fund NAV histories
+##
+##  All the configured schemes are downloaded at once by a bounded pool of worker
+##  threads that share one pooled `requests.Session`, so the total fetch time is
+##  governed by the slowest response rather than by the sum of all of them. Each
+##  request has a timeout and is retried with exponential backoff on connection
+##  errors and on server-side (5xx, 429) failures.
+##
+##  The fetcher knows nothing about mfapi.in beyond plain HTTP GETs, so it can be
+##  pointed at a local stand-in server for testing.
+##
+
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# `requests` is imported by the first NavFetcher, so that programs that only read the NAV cache or
+# a NAV store, or only print their usage, do not spend the time to import it
+requests = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 16    # The maximum number of requests in flight at once
+DEFAULT_TIMEOUT = 30.0      # Seconds to wait for a connection or a response, per attempt
+DEFAULT_RETRIES = 3         # Retries after the first attempt fails
+DEFAULT_BACKOFF = 0.5       # Seconds to wait before the first retry; doubled for each later retry
+
+# HTTP status codes that are worth retrying; any other status is final
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+class FetchResult:
+    """
+    The outcome of fetching a single URL.
+
+    `status_code` is None if no HTTP response was ever received, in which case
+    `error` describes the last failure.
+    """
+    def __init__(self, url, label=None):
+        self.url = url
+        self.label = label if label is not None else url
+        self.status_code = None
+        self.content = None       # The raw response body (bytes)
+        self.headers = {}
+        self.error = None
+        self.attempts = 0
+        self.elapsed = 0.0        # Wall-clock seconds, including retries and backoff
+
+    @property
+    def ok(self):
+        return self.error is None and self.status_code == 200
+
+    def json(self):
+        return json.loads(self.content)
+
+    def __repr__(self):
+        return f"FetchResult({self.label!r}, status={self.status_code}, attempts={self.attempts})"
+# End class FetchResult
+
+class NavFetcher:
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT, \
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+        global requests
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1.")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        # One session, with a connection pool big enough for every worker, so that
+        # connections to the same host are kept alive and reused
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def fetch_one(self, url, label=None, headers=None):
+        """
+        Fetches one URL, retrying with exponential backoff.
+
+        Parameters:
+        url (str): The URL to fetch.
+        label (str): A name for the fetch, used in log messages.
+        headers (dict): Extra request headers, e.g. for conditional requests.
+
+        Returns:
+        FetchResult: The final outcome. Never raises for network or HTTP errors.
+        """
+        result = FetchResult(url, label)
+        started = time.perf_counter()
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            result.attempts = attempt + 1
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+                result.status_code = response.status_code
+                result.headers = response.headers
+                result.content = response.content
+                if response.status_code not in RETRY_STATUS_CODES:
+                    result.error = None if response.status_code in (200, 304) else \
+                        f"HTTP {response.status_code}"
+                    break
+                result.error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                result.error = f"{type(e).__name__}: {e}"
+            if attempt < self.retries:
+                logger.debug(f"Retrying {result.label} in {delay:.2f}s after: {result.error}")
+                time.sleep(delay)
+                delay *= 2
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def fetch_all(self, urls, labels=None, headers=None):
+        """
+        Fetches all the URLs concurrently.
+
+        Parameters:
+        urls (list of str): The URLs to fetch.
+        labels (list of str): Optional names for the URLs, in the same order.
+        headers (dict): Optional mapping of URL to extra request headers for that URL.
+
+        Returns:
+        list of FetchResult: The results, in the same order as `urls`.
+        """
+        if labels is None:
+            labels = urls
+        if headers is None:
+            headers = {}
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(len(urls), 1))) as pool:
+            futures = [pool.submit(self.fetch_one, url, label, headers.get(url)) \
+                       for url, label in zip(urls, labels)]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started
+        log_fetch_report(results, elapsed)
+        return results
+# End class NavFetcher
+
+def log_fetch_report(results, elapsed):
+    failed = [result for result in results if result.error is not None]
+    for result in results:
+        if result.error is None:
+            logger.debug(f"Fetched {result.label}: HTTP {result.status_code}, " \
+                         f"{len(result.content or b'')} bytes, {result.elapsed:.2f}s, " \
+                         f"{result.attempts} attempt(s)")
+        else:
+            logger.warning(f"Failed to fetch {result.label} ({result.url}) after " \
+                           f"{result.attempts} attempt(s): {result.error}")
+    slowest = max((result.elapsed for result in results), default=0.0)
+    logger.info(f"Fetched {len(results) - len(failed)} of {len(results)} funds in {elapsed:.2f}s " \
+                f"(slowest single fetch: {slowest:.2f}s)")
@@ -0,0 +1,134 @@
+##
+##  A fast parser for mfapi.in NAV payloads
+##
+##  An mfapi.in response looks like
+##
+##      {"meta": {...}, "data": [{"date": "14-06-2024", "nav": "21.14409"}, ...], "status": "SUCCESS"}
+##
+##  The parser decodes the response body with orjson when it is installed (falling back to
+##  the standard `json` module) and then turns the rows straight into a datetime64[D] array
+##  of dates and a float64 array of NAVs. The fixed-width 'dd-mm-yyyy' dates are decoded
+##  all at once as a byte matrix instead of one string at a time, and malformed rows (a date
+##  of the wrong width or an impossible one, a NAV that is not a positive number, a date given
+##  twice) are rejected with a NavParseError that names the offending row.
+##
+
+import json
+
+import numpy
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DATE_WIDTH = 10                         # len('dd-mm-yyyy')
+DIGIT_COLUMNS = [0, 1, 3, 4, 6, 7, 8, 9]
+DASH = ord('-')
+ZERO = ord('0')
+
+class NavParseError(ValueError):
+    pass
+
+def decode_payload(raw):
+    """Decodes a response body (bytes or str) into a payload dict."""
+    try:
+        if orjson is not None:
+            return orjson.loads(raw)
+        return json.loads(raw)
+    except ValueError as e:
+        raise NavParseError(f"The NAV payload is not valid JSON: {e}") from None
+
+def parse_nav_payload(raw):
+    """
+    Parses an mfapi.in payload.
+
+    Parameters:
+    raw (bytes, str or dict): A response body, or a payload that has already been decoded.
+
+    Returns:
+    tuple: (meta dict, datetime64[D] array of dates, float64 array of NAVs), sorted by date.
+    """
+    payload = raw if isinstance(raw, dict) else decode_payload(raw)
+    rows = payload.get('data') if isinstance(payload, dict) else None
+    if not isinstance(rows, list):
+        raise NavParseError("The NAV payload has no 'data' list.")
+    dates, navs = parse_nav_rows(rows)
+    return payload.get('meta', {}), dates, navs
+
+def parse_nav_rows(rows):
+    """
+    Parses a list of {'date': 'dd-mm-yyyy', 'nav': '123.45'} rows.
+
+    Returns:
+    tuple: (datetime64[D] array of dates, float64 array of NAVs), sorted by date.
+    """
+    try:
+        date_strings = [row['date'] for row in rows]
+        nav_strings = [row['nav'] for row in rows]
+    except (KeyError, TypeError) as e:
+        bad_row = next(i for i, row in enumerate(rows) \
+                       if not isinstance(row, dict) or 'date' not in row or 'nav' not in row)
+        raise NavParseError(f"Row {bad_row} lacks a date or a NAV: {rows[bad_row]!r}") from None
+
+    dates = parse_dates(date_strings)
+    navs = parse_navs(nav_strings)
+    order = numpy.argsort(dates, kind='stable')
+    dates, navs = dates[order], navs[order]
+    repeated = numpy.flatnonzero(dates[1:] == dates[:-1])
+    if len(repeated):
+        first, second = sorted(order[repeated[0]:repeated[0] + 2])
+        raise NavParseError(f"Rows {first} and {second} have the same date: {date_strings[first]!r}")
+    return dates, navs
+
+def parse_dates(date_strings):
+    """Decodes 'dd-mm-yyyy' strings into a datetime64[D] array, all at once."""
+    n = len(date_strings)
+    # Each row's length is checked, since a short row and a long one would make up a joined
+    # string of the right length
+    widths = numpy.char.str_len(numpy.asarray(date_strings, dtype=numpy.str_)) if n else numpy.empty(0)
+    try:
+        joined = ''.join(date_strings).encode('ascii')
+    except (TypeError, UnicodeEncodeError):
+        joined = None   # Falls through to the search for the bad row below
+    if joined is None or (widths != DATE_WIDTH).any():
+        bad_row = next((i for i, date in enumerate(date_strings) \
+                        if not isinstance(date, str) or len(date) != DATE_WIDTH \
+                        or not date.isascii()), 0)
+        raise NavParseError(f"Malformed date in row {bad_row}: {date_strings[bad_row]!r}")
+
+    chars = numpy.frombuffer(joined, dtype=numpy.uint8).reshape(n, DATE_WIDTH)
+    # Non-digits wrap around to values above 9 in the unsigned subtraction
+    digits = chars[:, DIGIT_COLUMNS] - numpy.uint8(ZERO)
+    bad = (chars[:, 2] != DASH) | (chars[:, 5] != DASH) | (digits > 9).any(axis=1)
+    digits = digits.astype(numpy.int64)
+    days = digits[:, 0] * 10 + digits[:, 1]
+    months = digits[:, 2] * 10 + digits[:, 3]
+    years = digits[:, 4] * 1000 + digits[:, 5] * 100 + digits[:, 6] * 10 + digits[:, 7]
+    bad |= (months < 1) | (months > 12) | (days < 1) | (days > 31)
+
+    first_of_month = ((years - 1970) * 12 + (months - 1)).astype('datetime64[M]')
+    dates = first_of_month.astype('datetime64[D]') + (days - 1)
+    # A day past the end of its month (e.g. 30-02-2024) would spill into the next month
+    bad |= dates.astype('datetime64[M]') != first_of_month
+    if bad.any():
+        bad_row = int(numpy.argmax(bad))
+        raise NavParseError(f"Malformed date in row {bad_row}: {date_strings[bad_row]!r}")
+    return dates
+
+def parse_navs(nav_strings):
+    """Converts NAV strings into a float64 array, rejecting anything but finite, positive numbers."""
+    try:
+        navs = numpy.array(nav_strings, dtype=numpy.str_).astype(numpy.float64)
+    except (ValueError, TypeError):
+        navs = None
+    if navs is None or not (numpy.isfinite(navs) & (navs > 0)).all():
+        for i, nav in enumerate(nav_strings):
+            try:
+                value = float(nav)
+                if numpy.isfinite(value) and value > 0:
+                    continue
+            except (ValueError, TypeError):
+                pass
+            raise NavParseError(f"Malformed NAV in row {i}: {nav!r}")
+    return navs
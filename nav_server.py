@@ -0,0 +1,455 @@
+##
+##  A local HTTP JSON API serving the NAVs of a configuration's funds to many clients
+##
+##  The funds' NAVs are loaded once, from the NAV store or through the NAV cache, and aligned
+##  and forward-filled by a FundDataManager as in the plot. An asyncio server then answers
+##
+##    GET /series?codes=C1,C2&norm=D&start=D&end=D
+##                  The funds' NAVs from `start` to `end`, normalized to 100 at `norm`, one
+##                  value (or null) per calendar day. All the funds by default; `start` and
+##                  `end` default to the whole history and `norm` to `start`, and `norm` is
+##                  clamped to the range as by the plot's sliders.
+##    GET /nav?code=C&date=D
+##                  A fund's NAV on a date: the last NAV published on or before it.
+##    GET /meta     The funds (scheme code, name, label, first and last dates) and the dates.
+##    GET /mf/C     A fund's NAV history in the shape of mfapi.in's responses, so that
+##                  plot_mutual_funds.py --data-source can use the server instead of mfapi.in.
+##    GET /stats    Request and response-cache counts.
+##
+##  Dates are yyyy-mm-dd or dd-mm-yyyy. Responses other than /nav and /stats are built once, in
+##  a thread so that the event loop keeps answering other clients, and kept in a response
+##  cache of limited size that evicts the least recently used responses. Concurrent requests
+##  for the same response share one build. The data never change while the server runs, so a
+##  successful response carries an ETag made from the resource it returns and the time the data
+##  were loaded, and a revalidation of a valid request is answered "304 Not Modified". Errors
+##  carry no ETag.
+##
+##  Usage:
+##
+##      python nav_server.py -c config.toml [--host 127.0.0.1] [--port 8765] [--cache-mb 256]
+##          [--store STORE_DIR | --cache-dir DIR [--offline]]
+##      python plot_mutual_funds.py -c config.toml --data-source http://127.0.0.1:8765
+##
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import numpy
+
+from nav_data import read_fund_config, add_source_arguments, open_cache, fetch_payloads
+from nav_cache import scheme_code_from_url
+from nav_parser import parse_nav_payload, NavParseError
+from plot_mutual_funds import FundDataManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_MB = 256
+DEFAULT_WORKERS = 2
+KEEP_ALIVE_TIMEOUT = 30      # Seconds an idle connection is kept open
+DECIMALS = 4                 # Decimals of the normalized NAVs in /series responses
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', \
+           405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+# End class HttpError
+
+class ResponseCache:
+    """Response bodies by key, the least recently used evicted first once they exceed a size."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bodies = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        body = self.bodies.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self.bodies.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key, body):
+        if key in self.bodies or len(body) > self.max_bytes:
+            return
+        self.bodies[key] = body
+        self.nbytes += len(body)
+        while self.nbytes > self.max_bytes:
+            _, evicted = self.bodies.popitem(last=False)
+            self.nbytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return {'entries': len(self.bodies), 'bytes': self.nbytes, 'max_bytes': self.max_bytes, \
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+# End class ResponseCache
+
+def parse_date(text):
+    """Turns a yyyy-mm-dd or dd-mm-yyyy date into a datetime64[D]."""
+    try:
+        if len(text) == 10 and text[2] == '-' and text[5] == '-':
+            text = f"{text[6:10]}-{text[3:5]}-{text[0:2]}"
+        return numpy.datetime64(text, 'D')
+    except ValueError:
+        raise HttpError(400, f"'{text}' is not a date like 2023-12-31 or 31-12-2023") from None
+
+def to_json(document, nan_as_null=False):
+    text = json.dumps(document, separators=(',', ':'))
+    if nan_as_null:
+        # NaN is not JSON. Only call this for documents with no text that could contain "NaN".
+        text = text.replace('NaN', 'null')
+    return text.encode()
+
+class ServedFunds:
+    def __init__(self, fdm, raw, scheme_codes, metas):
+        """
+        Parameters:
+        fdm (FundDataManager): Holds the funds' normalized, calendar-daily NAVs, in columns
+                               labelled by scheme code.
+        raw (pd.DataFrame): The funds' NAVs as published, aligned but not filled.
+        scheme_codes (list of str): The funds, in column order.
+        metas (list of dict): The funds' mfapi.in `meta` blocks, with their labels.
+        """
+        self.fdm = fdm
+        self.raw = raw
+        self.scheme_codes = scheme_codes
+        self.metas = metas
+        self.columns = {code: fdm.get_daily_column(code) for code in scheme_codes}
+        self.meta_of = dict(zip(scheme_codes, metas))
+        self.daily_navs = fdm.get_daily_navs()
+        self.dates = fdm.get_daily_dates()
+        self.date_strings = numpy.datetime_as_string(self.dates).tolist()
+        self.raw_date_strings = None   # The dd-mm-yyyy dates of `raw`, once /mf/ needs them
+
+    def day_offset(self, date):
+        return self.fdm.day_offset(date)
+
+    def column(self, code):
+        try:
+            return self.columns[code]
+        except KeyError:
+            raise HttpError(404, f"Scheme {code} is not served.") from None
+
+    def meta_body(self):
+        funds = []
+        for code, meta in zip(self.scheme_codes, self.metas):
+            valid = numpy.flatnonzero(~numpy.isnan(self.raw[code].to_numpy()))
+            funds.append(dict(meta, scheme_code=code, \
+                              first_date=str(self.raw.index[valid[0]].date()), \
+                              last_date=str(self.raw.index[valid[-1]].date())))
+        return to_json({'first_date': self.date_strings[0], 'last_date': self.date_strings[-1], \
+                        'n_days': len(self.dates), 'funds': funds})
+
+    def series_rows(self, codes, norm, start, end):
+        """
+        Checks the parameters of a /series request.
+
+        Returns:
+        tuple: (columns, first row, last row, normalization row), which identify the response.
+        """
+        columns = tuple(self.column(code) for code in codes)
+        first_row = 0 if start is None else self.day_offset(parse_date(start))
+        last_row = len(self.dates) - 1 if end is None else self.day_offset(parse_date(end))
+        if last_row < first_row:
+            raise HttpError(400, "The end date is before the start date.")
+        base_row = first_row if norm is None else self.day_offset(parse_date(norm))
+        return columns, first_row, last_row, min(max(base_row, first_row), last_row)
+
+    def series_body(self, columns, first_row, last_row, base_row):
+        column_list = list(columns)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            window = self.daily_navs[first_row:last_row + 1, column_list] * \
+                     (100.0 / self.daily_navs[base_row, column_list])
+        window = numpy.round(window, DECIMALS)
+        codes = [self.scheme_codes[column] for column in column_list]
+        return to_json({'start': self.date_strings[first_row], 'end': self.date_strings[last_row], \
+                        'norm_date': self.date_strings[base_row], \
+                        'dates': self.date_strings[first_row:last_row + 1], \
+                        'series': {code: window[:, i].tolist() for i, code in enumerate(codes)}}, \
+                       nan_as_null=True)
+
+    def nav_row(self, code, date):
+        """Checks the parameters of a /nav request, and returns the row of the date."""
+        self.column(code)
+        return self.day_offset(parse_date(date))
+
+    def nav_body(self, code, row):
+        nav = float(self.daily_navs[row, self.column(code)])
+        return to_json({'scheme_code': code, 'date': self.date_strings[row], \
+                        'nav': None if numpy.isnan(nav) else nav})
+
+    def mf_body(self, code):
+        self.column(code)
+        if self.raw_date_strings is None:
+            self.raw_date_strings = self.raw.index.strftime('%d-%m-%Y').tolist()
+        navs = self.raw[code].to_numpy()
+        rows = numpy.flatnonzero(~numpy.isnan(navs))[::-1]   # Newest first, as mfapi.in sends them
+        meta = {key: value for key, value in self.meta_of[code].items() if key != 'label'}
+        return to_json({'meta': meta, \
+                        'data': [{'date': self.raw_date_strings[row], 'nav': str(nav)} \
+                                 for row, nav in zip(rows.tolist(), navs[rows].tolist())], \
+                        'status': 'SUCCESS'})
+# End class ServedFunds
+
+def load_funds(urls, labels, args):
+    """
+    Loads the funds of a configuration once, from the NAV store if `args.store` is set and
+    through the NAV cache otherwise, and normalizes them as the plot does. Funds without any
+    NAVs are left out, with a warning.
+
+    Raises:
+    ValueError: If none of the funds have NAVs.
+    OSError, KeyError: If the NAV store cannot be read.
+    """
+    fdm = FundDataManager()
+    codes = []
+    metas = []
+    seen = set()
+    if args.store is not None:
+        store = fdm.open_store(args.store)
+        for url, label in zip(urls, labels):
+            code = scheme_code_from_url(url)
+            if code in seen:
+                continue
+            if code not in store.columns:
+                logger.warning(f"Skipping {label}: scheme {code} is not in the NAV store")
+                continue
+            seen.add(code)
+            codes.append(code)
+            metas.append({'scheme_code': int(code), 'scheme_name': store.names[store.columns[code]], \
+                          'label': label})
+        if codes:
+            fdm.load_fund_data_from_store(codes, codes)
+    else:
+        for payload, url, label in zip(fetch_payloads(urls, labels, open_cache(args), args), urls, labels):
+            code = scheme_code_from_url(url)
+            if code in seen:
+                continue
+            if payload is None:
+                logger.warning(f"Skipping {label}: its NAVs could not be fetched")
+                continue
+            try:
+                meta, dates, navs = parse_nav_payload(payload)
+            except NavParseError as e:
+                logger.warning(f"Skipping {label}: {e}")
+                continue
+            if len(dates) == 0:
+                logger.warning(f"Skipping {label}: the web service has no NAVs for it")
+                continue
+            seen.add(code)
+            codes.append(code)
+            metas.append(dict(meta, label=label))
+            fdm.add_fund(code, dates, navs)
+    if not codes or fdm.get_all_fund_data().empty:
+        raise ValueError("None of the funds have NAVs.")
+    raw = fdm.get_all_fund_data()
+    fdm.normalize_all_fund_data()
+    return ServedFunds(fdm, raw, codes, metas)
+
+class NavServer:
+    def __init__(self, funds, cache, workers=DEFAULT_WORKERS):
+        self.funds = funds
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.building = {}          # Response key: the future of the response being built
+        self.loaded_at = time.time()
+        self.requests = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    async def cached(self, key, build, *args):
+        """Returns a response from the cache or, built in a thread, once for all who ask at once."""
+        body = self.cache.get(key)
+        if body is not None:
+            return body
+        future = self.building.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, build, *args)
+            self.building[key] = future
+            try:
+                body = await future
+            finally:
+                del self.building[key]
+            self.cache.put(key, body)
+            return body
+        return await asyncio.shield(future)
+
+    def etag(self, key):
+        # The same resource of the same data always gets the same tag, and a different one otherwise
+        digest = hashlib.sha1(repr((self.loaded_at, key)).encode()).hexdigest()
+        return f'"{digest[:20]}"'
+
+    def route(self, path, query):
+        """
+        Checks a request's path and parameters.
+
+        Returns:
+        tuple: (the key of the response, whether it is cached, the function that builds it and
+        its arguments), or None for /stats
+
+        Raises:
+        HttpError: If there is no such resource or a parameter is wrong.
+        """
+        if path == '/series':
+            codes = query['codes'].split(',') if query.get('codes') else self.funds.scheme_codes
+            rows = self.funds.series_rows(codes, query.get('norm'), query.get('start'), query.get('end'))
+            return ('series',) + rows, True, self.funds.series_body, rows
+        if path == '/nav':
+            if 'code' not in query or 'date' not in query:
+                raise HttpError(400, "/nav needs a code and a date.")
+            args = (query['code'], self.funds.nav_row(query['code'], query['date']))
+            return ('nav',) + args, False, self.funds.nav_body, args
+        if path == '/meta':
+            return ('meta',), True, self.funds.meta_body, ()
+        if path.startswith('/mf/'):
+            code = path[len('/mf/'):]
+            self.funds.column(code)
+            return ('mf', code), True, self.funds.mf_body, (code,)
+        if path == '/stats':
+            return None
+        raise HttpError(404, f"No such endpoint: {path}")
+
+    async def respond(self, method, target, headers):
+        """
+        Returns:
+        tuple: (HTTP status, body bytes, ETag or None)
+        """
+        if method != 'GET':
+            raise HttpError(405, f"{method} is not supported.")
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        route = self.route(url.path.rstrip('/') or '/', query)
+        if route is None:
+            return 200, to_json({'requests': self.requests, 'not_modified': self.not_modified, \
+                                 'errors': self.errors, 'cache': self.cache.stats()}), None
+
+        key, cached, build, args = route
+        etag = self.etag(key)
+        if etag in (tag.strip() for tag in headers.get('if-none-match', '').split(',')):
+            self.not_modified += 1
+            return 304, b'', etag
+        if cached:
+            return 200, await self.cached(key, build, *args), etag
+        return 200, build(*args), etag
+
+    async def handle_connection(self, reader, writer):
+        # Requests on one connection are answered in turn, for as long as the client keeps it open
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, \
+                        ConnectionError):
+                    break
+                request_line, *header_lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.split(' ')
+                except ValueError:
+                    method, target, version = None, None, 'HTTP/1.0'
+                if headers.get('content-length', '0').isdigit() and int(headers.get('content-length', '0')):
+                    await reader.readexactly(int(headers['content-length']))
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+
+                self.requests += 1
+                etag = None
+                try:
+                    if method is None:
+                        raise HttpError(400, "Malformed request line.")
+                    status, body, etag = await self.respond(method, target, headers)
+                except HttpError as e:
+                    status, body = e.status, to_json({'error': str(e)})
+                    self.errors += 1
+                except Exception as e:
+                    logger.exception(f"Failed to answer {request_line}")
+                    status, body = 500, to_json({'error': f"{type(e).__name__}: {e}"})
+                    self.errors += 1
+                logger.debug(f"{request_line} -> {status}, {len(body)} bytes")
+
+                head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n" \
+                       f"Content-Type: application/json\r\n" \
+                       f"Content-Length: {len(body)}\r\n" + \
+                       ('' if etag is None else f"ETag: {etag}\r\n") + \
+                       f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                writer.write(head.encode('latin-1') + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            # The client went away, or the server is shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port, started=None):
+        """Serves until cancelled. `started`, if given, is a future set to the bound port."""
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        bound_port = server.sockets[0].getsockname()[1]
+        logger.info(f"Serving {len(self.funds.scheme_codes)} funds on http://{host}:{bound_port}")
+        if started is not None:
+            started.set_result(bound_port)
+        async with server:
+            await server.serve_forever()
+
+    def log_stats(self):
+        stats = self.cache.stats()
+        logger.info(f"Served {self.requests} request(s), {self.not_modified} not modified, " \
+                    f"{self.errors} error(s); response cache: {stats['hits']} hit(s), " \
+                    f"{stats['misses']} miss(es), {stats['evictions']} eviction(s)")
+# End class NavServer
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Serve the NAVs of a configuration's funds over a local " \
+                                     "HTTP JSON API.")
+    parser.add_argument('-c', '--config', type=str, default='config.toml', \
+                        help='Path to the TOML configuration file')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST, help='Address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_CACHE_MB, \
+                        help='Megabytes of responses to keep in the response cache')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, \
+                        help='Threads that build responses which are not in the response cache')
+    add_source_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        urls, labels, _ = read_fund_config(args.config)
+        funds = load_funds(urls, labels, args)
+    except (OSError, KeyError, ValueError) as e:
+        logger.critical(e)
+        sys.exit(1)
+
+    server = NavServer(funds, ResponseCache(int(args.cache_mb * 1024 * 1024)), args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        logger.critical(f"Cannot serve on {args.host}:{args.port}: {e}")
+        sys.exit(1)
+    finally:
+        server.log_stats()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+##
+##  A persistent, memory-mapped, columnar store of NAV histories
+##
+##  The store is a directory holding two files:
+##
+##    navs.f64    One float64 array of shape (days, funds), in column-major (Fortran) order,
+##                so that each fund's history is contiguous on disk. Row `d` holds the NAVs
+##                for the date `epoch + d days`; days without a NAV hold NaN.
+##    index.json  The epoch, the number of days, the capacity, and the scheme codes and names
+##                of the columns, in column order.
+##
+##  The array may have room for more days than the store covers (its capacity), so that days
+##  can be appended, e.g. by a daily update, without rewriting the file. When the room runs
+##  out the file is rewritten once, with room for another year.
+##
+##  Opening a store only reads the small index and maps the array, so it takes the same
+##  time however many funds the store holds. Slices of a contiguous range of funds and
+##  dates are views of the mapping: only the pages that are actually read are loaded.
+##
+##  Build a store from the NAV cache with
+##
+##      python nav_store.py STORE_DIR [--cache-dir CACHE_DIR]
+##
+
+import argparse
+import json
+import logging
+import os
+
+import numpy
+import pandas
+
+from nav_parser import parse_nav_payload, NavParseError
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+NAVS_FILE = 'navs.f64'
+STORE_VERSION = 2            # Version 1 stores have no headroom, and are still read
+DEFAULT_HEADROOM_DAYS = 366  # Days of room added whenever an extended store has to grow
+GROW_BLOCK_COLUMNS = 1024    # Columns copied at a time while a store grows
+
+class NavStore:
+    def __init__(self, directory, mode='r'):
+        """
+        Opens an existing store.
+
+        Parameters:
+        directory (str): The store's directory.
+        mode (str): 'r' to open the store read-only, 'r+' to allow writing NAVs.
+        """
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') not in (1, STORE_VERSION):
+            raise ValueError(f"Unsupported NAV store version: {index.get('version')}")
+        self.mode = mode
+        self.epoch = numpy.datetime64(index['epoch'], 'D')
+        self.n_days = index['n_days']
+        self.capacity = index.get('capacity', self.n_days)
+        self.scheme_codes = index['scheme_codes']
+        self.names = index['names']
+        self.columns = {code: column for column, code in enumerate(self.scheme_codes)}
+        self.map_navs()
+
+    def map_navs(self):
+        # The rows past the last day are headroom, and are not part of `navs`
+        self.mapped = numpy.memmap(os.path.join(self.directory, NAVS_FILE), dtype=numpy.float64, \
+                                   mode=self.mode, shape=(self.capacity, len(self.scheme_codes)), \
+                                   order='F')
+        self.navs = self.mapped[:self.n_days]
+
+    @classmethod
+    def create(cls, directory, scheme_codes, names, first_date, last_date, headroom_days=0):
+        """
+        Creates an empty store (all NaN) covering the dates from `first_date` to `last_date`,
+        with room for `headroom_days` more days.
+
+        Returns:
+        NavStore: The new store, opened for writing with `write_fund`.
+        """
+        if len(scheme_codes) != len(names):
+            raise ValueError("There must be one name per scheme code.")
+        os.makedirs(directory, exist_ok=True)
+        # Remove any earlier index first, so that it can never describe the new array
+        if os.path.exists(os.path.join(directory, INDEX_FILE)):
+            os.remove(os.path.join(directory, INDEX_FILE))
+        epoch = numpy.datetime64(first_date, 'D')
+        n_days = int((numpy.datetime64(last_date, 'D') - epoch).astype(numpy.int64)) + 1
+        navs = numpy.memmap(os.path.join(directory, NAVS_FILE), dtype=numpy.float64, \
+                            mode='w+', shape=(n_days + headroom_days, len(scheme_codes)), order='F')
+        navs[:] = numpy.nan
+        navs.flush()
+        del navs
+        # The index is written last, so a store whose creation was interrupted cannot be opened
+        write_index(directory, epoch, n_days, n_days + headroom_days, scheme_codes, names)
+        return cls(directory, mode='r+')
+
+    @classmethod
+    def build(cls, directory, funds):
+        """
+        Creates a store holding the given funds.
+
+        Parameters:
+        directory (str): The store's directory.
+        funds (list of tuple): (scheme code, name, datetime64 dates, float64 NAVs) per fund.
+        """
+        funds = [fund for fund in funds if len(fund[2]) > 0]
+        if not funds:
+            raise ValueError("There are no NAVs to store.")
+        first_date = min(fund[2].min() for fund in funds)
+        last_date = max(fund[2].max() for fund in funds)
+        store = cls.create(directory, [fund[0] for fund in funds], [fund[1] for fund in funds], \
+                           first_date, last_date)
+        for column, (_, _, dates, navs) in enumerate(funds):
+            store.write_fund(column, dates, navs)
+        store.flush()
+        return store
+
+    def write_fund(self, column, dates, navs):
+        offsets = (dates.astype('datetime64[D]') - self.epoch).astype(numpy.int64)
+        self.navs[offsets, column] = navs
+
+    def flush(self):
+        self.mapped.flush()
+
+    def extend(self, last_date, headroom_days=DEFAULT_HEADROOM_DAYS):
+        """
+        Extends the store's dates (with NaN NAVs) to `last_date`, growing the file, with room
+        for `headroom_days` more days, only if it has no room left. Needs mode 'r+'.
+
+        Returns:
+        int: The number of days added.
+        """
+        n_days = int((numpy.datetime64(last_date, 'D') - self.epoch).astype(numpy.int64)) + 1
+        if n_days <= self.n_days:
+            return 0
+        if n_days > self.capacity:
+            self.grow(n_days + headroom_days)
+        added = n_days - self.n_days
+        self.n_days = n_days
+        self.navs = self.mapped[:n_days]
+        write_index(self.directory, self.epoch, self.n_days, self.capacity, self.scheme_codes, \
+                    self.names)
+        return added
+
+    def grow(self, capacity):
+        """Rewrites the file with room for `capacity` days, copying a block of funds at a time."""
+        path = os.path.join(self.directory, NAVS_FILE)
+        grown = numpy.memmap(f"{path}.tmp", dtype=numpy.float64, mode='w+', \
+                             shape=(capacity, len(self.scheme_codes)), order='F')
+        for start in range(0, len(self.scheme_codes), GROW_BLOCK_COLUMNS):
+            columns = slice(start, start + GROW_BLOCK_COLUMNS)
+            grown[:self.n_days, columns] = self.mapped[:self.n_days, columns]
+            grown[self.n_days:, columns] = numpy.nan
+        grown.flush()
+        del grown
+        logger.info(f"Grew the NAV store in {self.directory} from {self.capacity} to {capacity} days")
+        # As in `create`, no index may describe the new file until it is complete
+        os.remove(os.path.join(self.directory, INDEX_FILE))
+        os.replace(f"{path}.tmp", path)
+        self.capacity = capacity
+        self.map_navs()
+        write_index(self.directory, self.epoch, self.n_days, self.capacity, self.scheme_codes, \
+                    self.names)
+
+    def day_offset(self, date):
+        """Returns the row of a date, clipped to the store's date range."""
+        offset = int((numpy.datetime64(pandas.Timestamp(date).date(), 'D') - self.epoch) \
+                     .astype(numpy.int64))
+        return min(max(offset, 0), self.n_days - 1)
+
+    def dates(self, first_row=0, last_row=None):
+        if last_row is None:
+            last_row = self.n_days - 1
+        return self.epoch + numpy.arange(first_row, last_row + 1)
+
+    def column_indices(self, scheme_codes):
+        try:
+            return [self.columns[str(code)] for code in scheme_codes]
+        except KeyError as e:
+            raise KeyError(f"Scheme {e} is not in the NAV store.") from None
+
+    def slice(self, scheme_codes=None, start_date=None, end_date=None):
+        """
+        Returns the NAVs of some funds over a range of dates.
+
+        The result is a view of the mapped file, not a copy, when the funds occupy a
+        contiguous, ascending run of columns (e.g. when `scheme_codes` is None). Any other
+        selection of funds copies just the requested columns for the requested dates.
+
+        Parameters:
+        scheme_codes (list of str): The funds to select; None means all of them.
+        start_date, end_date (str or date-like): The date range; None means unbounded.
+
+        Returns:
+        tuple: (datetime64[D] dates, 2-D array of NAVs with one column per fund)
+        """
+        first_row = 0 if start_date is None else self.day_offset(start_date)
+        last_row = self.n_days - 1 if end_date is None else self.day_offset(end_date)
+        rows = slice(first_row, last_row + 1)
+        if scheme_codes is None:
+            navs = self.navs[rows, :]
+        else:
+            columns = self.column_indices(scheme_codes)
+            if columns and columns == list(range(columns[0], columns[0] + len(columns))):
+                navs = self.navs[rows, columns[0]:columns[0] + len(columns)]
+            else:
+                navs = self.navs[rows, columns]
+        return self.dates(first_row, last_row), navs
+
+    def to_frame(self, scheme_codes=None, start_date=None, end_date=None, labels=None):
+        """Like `slice`, but returns a DataFrame with a DatetimeIndex, sharing the sliced memory."""
+        dates, navs = self.slice(scheme_codes, start_date, end_date)
+        if labels is None:
+            labels = self.scheme_codes if scheme_codes is None else [str(code) for code in scheme_codes]
+        return pandas.DataFrame(navs, index=pandas.DatetimeIndex(dates.astype('datetime64[ns]')), \
+                                columns=labels, copy=False)
+# End class NavStore
+
+def write_index(directory, epoch, n_days, capacity, scheme_codes, names):
+    index = {
+        'version': STORE_VERSION,
+        'epoch': str(epoch),
+        'n_days': n_days,
+        'capacity': capacity,
+        'scheme_codes': [str(code) for code in scheme_codes],
+        'names': list(names),
+    }
+    path = os.path.join(directory, INDEX_FILE)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(f"{path}.tmp", path)
+
+def build_store_from_cache(store_directory, cache, scheme_codes=None):
+    """Builds a store from the entries of a NavCache (all of them, by default)."""
+    if scheme_codes is None:
+        scheme_codes = cache.scheme_codes()
+    funds = []
+    for code in scheme_codes:
+        entry = cache.load(code)
+        if entry is None:
+            logger.warning(f"Scheme {code} is not in the NAV cache")
+            continue
+        try:
+            meta, dates, navs = parse_nav_payload(entry)
+        except NavParseError as e:
+            logger.warning(f"Skipping scheme {code}: {e}")
+            continue
+        funds.append((code, meta.get('scheme_name', code), dates, navs))
+    store = NavStore.build(store_directory, funds)
+    logger.info(f"Stored {len(store.scheme_codes)} funds over {store.n_days} days in {store_directory}")
+    return store
+
+def main():
+    from nav_cache import NavCache, DEFAULT_CACHE_DIR
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Build a memory-mapped NAV store from the NAV cache.")
+    parser.add_argument('store', type=str, help='Directory of the NAV store to build')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR, \
+                        help='Directory of the on-disk NAV cache')
+    args = parser.parse_args()
+    build_store_from_cache(args.store, NavCache(args.cache_dir, offline=True))
+
+if __name__ == "__main__":
+    main()
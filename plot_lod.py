@@ -0,0 +1,69 @@
+##
+##  Level-of-detail downsampling of plotted NAV series
+##
+##  An axes about 1,000 pixels wide cannot show more than about 1,000 distinct x positions,
+##  yet a fund with a 20-year daily history has over 7,000 points. The rows of the series
+##  are split into one bucket of consecutive rows per pixel column, and each bucket is drawn
+##  as just two points: its minimum and its maximum, in the order in which the series moves
+##  through the bucket. The decimated lines cover the same pixels as the full ones, so peaks
+##  and troughs are never lost, and the cost of drawing depends on the width of the axes
+##  instead of on the length of the history or the number of funds.
+##
+
+import numpy
+
+def _bucket_extremes(y):
+    """
+    Returns the (first, second) points of each bucket of `y`, shaped (buckets, size, columns).
+
+    NaN is ignored; a bucket with no values at all gives NaN, so gaps in a series stay gaps.
+    """
+    with numpy.errstate(invalid='ignore'):
+        lowest = numpy.fmin.reduce(y, axis=1)
+        highest = numpy.fmax.reduce(y, axis=1)
+        rising = y[:, -1] >= y[:, 0]
+    return numpy.where(rising, lowest, highest), numpy.where(rising, highest, lowest)
+
+def decimate(x, y, n_buckets):
+    """
+    Downsamples several series that share an x array.
+
+    Parameters:
+    x (1-D numpy array): The x values shared by all the series, ascending.
+    y (2-D numpy array): One series per column; NaN marks missing values.
+    n_buckets (int): The number of buckets, normally the width of the axes in pixels.
+
+    Returns:
+    tuple: (x, y) to draw: a 1-D array shared by all the series and a 2-D array with one
+    column per series. The first and the last rows are always kept as they are.
+    """
+    n_rows = len(x)
+    n_buckets = max(int(n_buckets), 1)
+    if n_rows <= 2 * n_buckets + 2:
+        return x, y
+
+    bucket_size = -(-n_rows // n_buckets)   # Ceiling division
+    n_full = n_rows // bucket_size          # Buckets that are completely filled
+    full_rows = n_full * bucket_size
+    # A C-ordered copy puts the funds of one date next to each other, which makes the
+    # reductions along the date axis much faster than on the column-major original
+    buckets = numpy.ascontiguousarray(y[:full_rows]).reshape(n_full, bucket_size, y.shape[1])
+    first, second = _bucket_extremes(buckets)
+    starts = numpy.arange(n_full) * bucket_size
+    first_x, second_x = x[starts], x[starts + bucket_size - 1]
+    if full_rows < n_rows:
+        tail_first, tail_second = _bucket_extremes(y[None, full_rows:])
+        first = numpy.concatenate([first, tail_first])
+        second = numpy.concatenate([second, tail_second])
+        first_x = numpy.append(first_x, x[full_rows])
+        second_x = numpy.append(second_x, x[-1])
+
+    decimated_x = numpy.empty(2 * len(first_x) + 2, dtype=x.dtype)
+    decimated_x[1:-1:2] = first_x
+    decimated_x[2:-1:2] = second_x
+    decimated_x[0], decimated_x[-1] = x[0], x[-1]
+    decimated_y = numpy.empty((len(decimated_x), y.shape[1]), dtype=y.dtype)
+    decimated_y[1:-1:2] = first
+    decimated_y[2:-1:2] = second
+    decimated_y[0], decimated_y[-1] = y[0], y[-1]
+    return decimated_x, decimated_y
@@ -10,29 +10,55 @@
 #                   IMPORTS
 # ===================================================================================================
 
+import time
+STARTED = time.perf_counter()  # For the startup report, which times the imports too
+
 import logging
 import argparse
 import toml
 import pandas
 from datetime import timedelta
-import requests
-import numpy  # For debugging in function `on_mouse_move`
-import pickle
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import sys
-import traceback
 import numpy
 
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-import matplotlib.dates as mdates
-from matplotlib.widgets import Slider, Button, TextBox
-from matplotlib.dates import num2date
-from matplotlib.lines import Line2D
-
-# Alias the specific classes and functions from ticker
-ScalarFormatter = ticker.ScalarFormatter
-#FormatStrFormatter = ticker.FormatStrFormatter
-#LinearLocator = ticker.LinearLocator
+# Matplotlib's pyplot and widgets take longer to import than everything else together, so they
+# are only imported, by `import_gui`, when a figure is going to be shown (see `main`)
+plt = None
+ticker = None
+mdates = None
+Slider = Button = TextBox = None
+num2date = None
+Line2D = None
+TimerBase = None
+
+RISK_BLOCK_SIZE = 256        # Compact funds whose risk metrics are computed at once
+
+from nav_fetcher import NavFetcher, DEFAULT_MAX_WORKERS, DEFAULT_TIMEOUT, DEFAULT_RETRIES
+from nav_cache import NavCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_AGE, scheme_code_from_url, source_url
+from nav_store import NavStore
+from nav_parser import parse_nav_payload, NavParseError
+from plot_lod import decimate
+from risk_metrics import RiskMetrics, DEFAULT_RISK_FREE_RATE, MAX_CACHED_WINDOWS, format_risk_table
+from portfolio_backtest import read_portfolios, backtest_portfolio
+from screening import open_metric_table, screen_labels, read_screen_query
+from instrumentation import Instrumentation
+from compact_navs import CompactNavs, DTYPES
+from chart import FIGURE_SIZE, LINE_WIDTH, PORTFOLIO_LINE_WIDTH, normalize_window, plot_nav_lines, \
+                  add_norm_date_line, format_log_axis, label_chart
+
+def import_gui():
+    """Imports Matplotlib's pyplot and widgets into the names above."""
+    global plt, ticker, mdates, Slider, Button, TextBox, num2date, Line2D, TimerBase
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+    import matplotlib.dates as mdates
+    from matplotlib.widgets import Slider, Button, TextBox
+    from matplotlib.dates import num2date
+    from matplotlib.lines import Line2D
+    from matplotlib.backend_bases import TimerBase
 
 # ===================================================================================================
 #                   GLOBALS
@@ -51,17 +77,42 @@ labels = []                  # Arbitrary, short names of the funds, for the lege
 cursor_enabled = False       # User-controlled cursor is visible?
 legline_to_origline = None   # ?
 selected_fund = None         # The raw NAV of this fund can be shown
+instruments = Instrumentation()  # Times the startup and the event handlers; off unless --instrument
 
 # ===================================================================================================
 #                   CLASS DEFINITIONS
 # ===================================================================================================
 
+def drop_duplicate_dates(label, dates, navs):
+    """
+    Keeps the last of a fund's NAVs on each date, in the order they were given, so that a date
+    that the source repeats has one NAV when the funds are aligned.
+
+    Returns:
+    tuple: (label, dates, NAVs), with the dates sorted if any were repeated.
+    """
+    unique_dates, last = numpy.unique(dates[::-1], return_index=True)
+    if len(unique_dates) == len(dates):
+        return label, dates, navs
+    logger.warning(f"{label}: {len(dates) - len(unique_dates)} repeated date(s); keeping the last " \
+                   f"NAV given for each")
+    return label, unique_dates, navs[::-1][last]
+
 class FundDataManager:
     _instance = None
     all_fund_data = None
     all_fund_data_normalized = None
     start_date = None
     end_date = None
+    store = None              # A memory-mapped NavStore, if one has been opened
+    pending_funds = None      # (label, dates, NAVs) of funds added but not yet aligned
+    pending_labels = None     # The labels of `pending_funds`
+    daily_navs = None         # Forward-filled NAVs, one row per calendar day, one column per fund
+    daily_epoch = None        # The date (numpy datetime64[D]) of the first row of `daily_navs`
+    daily_dates_num = None    # The Matplotlib date numbers of the rows of `daily_navs`
+    daily_columns = None      # Maps each fund's label to its column in `daily_navs`
+    compact_dtype = None      # 'float64' or 'float32' to keep the funds in a CompactNavs instead
+    compact = None            # The CompactNavs that takes the place of `daily_navs`, if any
 
     # This method implements the singleton pattern
     def __new__(cls, *args, **kwargs):
@@ -72,19 +123,144 @@ class FundDataManager:
         return cls._instance
 
     def __init__(self, *args, **kwargs):
-        if not hasattr(self, '_initialized'):
+        if not self._initialized:
             self.all_fund_data = pandas.DataFrame()
+            self.pending_funds = []
+            self.pending_labels = set()
             self._initialized = True
 
+    def add_fund(self, label, dates, navs):
+        """
+        Adds one fund's NAVs. The funds are aligned on a common date index only when the
+        data is next needed, all together, by `align_fund_data`.
+
+        Parameters:
+        label (str): The fund's name, used as its column label.
+        dates (array-like of datetime64): The dates of the NAVs, in any order.
+        navs (array-like of float): The NAVs.
+
+        Raises:
+        ValueError: If a fund with the same label has already been added.
+        """
+        if self.has_fund(label):
+            raise ValueError(f"A fund labelled '{label}' has already been added.")
+        self.pending_funds.append((label, numpy.asarray(dates, dtype='datetime64[ns]'), \
+                                   numpy.asarray(navs, dtype=numpy.float64)))
+        self.pending_labels.add(label)
+
+    def has_fund(self, label):
+        # Whether a fund has been added with this label, aligned or not
+        if label in self.pending_labels:
+            return True
+        if self.is_compact() and self.compact is not None:
+            return label in self.compact.columns
+        return label in self.all_fund_data.columns
+
+    def add_funds(self, funds):
+        # `funds` is an iterable of (label, dates, NAVs) tuples
+        for label, dates, navs in funds:
+            self.add_fund(label, dates, navs)
+
     def concatenate_fund_data(self, fund_dataframe):
-        # Concatenate along columns (axis=1)
-        self.all_fund_data = pandas.concat( \
-                                [self.all_fund_data, fund_dataframe], axis=1)
+        # Add each column of a DataFrame with a DatetimeIndex as a fund
+        for label in fund_dataframe.columns:
+            self.add_fund(label, fund_dataframe.index.values, fund_dataframe[label].values)
+
+    def use_compact_storage(self, dtype='float64'):
+        """
+        Keeps the funds added from now on in a CompactNavs (see compact_navs.py): each fund's
+        NAVs on the business days from its first NAV to its last only, forward-filled as they
+        are read, instead of in calendar-daily DataFrames and matrices.
+        """
+        self.compact_dtype = dtype
+
+    def is_compact(self):
+        return self.compact_dtype is not None
+
+    def align_fund_data(self):
+        """
+        Aligns all the added funds on the union of their dates in a single pass, instead of
+        re-aligning and copying the accumulated DataFrame once per fund.
+        """
+        if not self.pending_funds:
+            return
+        pending_funds = [drop_duplicate_dates(*fund) for fund in self.pending_funds]
+        self.pending_funds = []
+        self.pending_labels = set()
+        if self.is_compact():
+            funds = [] if self.compact is None else list(self.compact.funds())
+            self.compact = CompactNavs.from_funds(funds + pending_funds, self.compact_dtype)
+            return
+        funds = [(label, self.all_fund_data.index.values.astype('datetime64[ns]'), \
+                  self.all_fund_data[label].values) for label in self.all_fund_data.columns]
+        funds.extend(pending_funds)
+
+        all_dates = numpy.concatenate([dates for _, dates, _ in funds])
+        all_navs = numpy.concatenate([navs for _, _, navs in funds])
+        fund_columns = numpy.repeat(numpy.arange(len(funds)), [len(dates) for _, dates, _ in funds])
+
+        # `date_rows` gives the row in the union of the dates of every single NAV
+        union_dates, date_rows = numpy.unique(all_dates, return_inverse=True)
+        aligned_navs = numpy.full((len(union_dates), len(funds)), numpy.nan)
+        aligned_navs[date_rows, fund_columns] = all_navs
+
+        self.all_fund_data = pandas.DataFrame(aligned_navs, \
+                                              index=pandas.DatetimeIndex(union_dates), \
+                                              columns=[label for label, _, _ in funds])
 
     def get_all_fund_data(self):
+        self.align_fund_data()
         return self.all_fund_data
 
+    def open_store(self, directory):
+        # Only the store's index is read here; NAVs are paged in as they are sliced.
+        self.store = NavStore(directory)
+        return self.store
+
+    def get_store(self):
+        return self.store
+
+    def get_store_fund_data(self, scheme_codes=None, start_date=None, end_date=None, labels=None):
+        """
+        Slices NAVs out of the opened store without copying them where possible.
+
+        Parameters:
+        scheme_codes (list of str): The funds to select; None means all of them.
+        start_date, end_date (str or pd.Timestamp): The date range; None means unbounded.
+        labels (list of str): Column names for the funds; the scheme codes by default.
+
+        Returns:
+        pd.DataFrame: The NAVs, with a daily DateTimeIndex and NaN on days without a NAV.
+        """
+        if self.store is None:
+            raise ValueError("No NAV store has been opened.")
+        return self.store.to_frame(scheme_codes, start_date, end_date, labels)
+
+    def screen_store(self, query, metrics_path=None):
+        """
+        Screens the funds of the opened store (see screening.py), from its cached metrics.
+
+        Returns:
+        tuple: (scheme codes, labels) of the funds that passed, in the query's order.
+        """
+        if self.store is None:
+            raise ValueError("No NAV store has been opened.")
+        table = open_metric_table(self.store, metrics_path)
+        columns = table.screen(query)
+        return list(table.scheme_codes[columns]), screen_labels(table, columns)
+
+    def load_fund_data_from_store(self, scheme_codes, labels):
+        if self.is_compact():
+            self.compact = CompactNavs.from_store(self.store, scheme_codes, labels, self.compact_dtype)
+            return
+        # Keep only the dates on which at least one of the funds has a NAV, as when the
+        # funds are fetched from the web service
+        self.all_fund_data = self.get_store_fund_data(scheme_codes, labels=labels).dropna(how='all')
+
     def get_all_fund_data_columns(self):
+        self.align_fund_data()
+        if self.is_compact():
+            return pandas.Index([] if self.compact is None else self.compact.labels)
         return self.all_fund_data.columns
 
     def extract_fund_data(self, data, start_date, end_date):
@@ -121,6 +297,9 @@ class FundDataManager:
         return extracted_data
 
     def interpolate_fund_series_frame(self, label):
+        self.align_fund_data()
+        if self.is_compact():
+            return   # Compact funds are forward-filled as they are read
         fund_series_frame = self.all_fund_data[label].to_frame()
         # Get the first and last non-NaN values in `fund_series`
         first_valid_index = fund_series_frame.first_valid_index()
@@ -160,6 +339,10 @@ class FundDataManager:
 
     # FIXME: Consider using 0 as the base, and +5%, +10%, -5%, -10%, etc. as the y-axis scale.
     def normalize_all_fund_data(self):
+        self.align_fund_data()
+        if self.is_compact():
+            self.normalize_compact_fund_data()
+            return
         self.start_date = self.all_fund_data.index.min()
         self.end_date = self.all_fund_data.index.max()
                 
@@ -174,24 +357,337 @@ class FundDataManager:
         # Perform the division and handle NaN values
         try:
             # Forward fill to handle gaps
-            self.all_fund_data = self.all_fund_data.asfreq('D').ffill()
-            if self.start_date in self.all_fund_data.index:
-                normalized_data = (self.all_fund_data.divide(self.all_fund_data.loc[self.start_date], axis='columns')) * 100
-            else:
-                raise ValueError(f"Start date {self.start_date} not in data index.")
-
-            self.all_fund_data_normalized = self.all_fund_data.divide(base_navs, axis='columns') * 100
+            self.build_daily_matrix()
+            base_row = self.day_offset(self.start_date)
+            self.all_fund_data_normalized = pandas.DataFrame( \
+                self.normalized_window(0, len(self.daily_navs) - 1, base_row), \
+                index=pandas.date_range(self.start_date, periods=len(self.daily_navs), freq='D'), \
+                columns=self.all_fund_data.columns)
         except Exception as e:
             print(f"Error during normalization: {e}")
             sys.exit(1)
 
+    def normalize_compact_fund_data(self):
+        # The rows are the business days. Nothing is normalized until a date range is plotted, so
+        # the lines start out empty (see `PlotManager.update`).
+        import matplotlib.dates as mdates
+
+        if self.compact is None or len(self.compact.calendar) == 0:
+            print("There are no NAVs to normalize.")
+            sys.exit(1)
+        calendar = self.compact.calendar
+        self.start_date = pandas.Timestamp(calendar[0])
+        self.end_date = pandas.Timestamp(calendar[-1])
+        self.daily_epoch = calendar[0]
+        self.daily_dates_num = mdates.date2num(calendar.astype('datetime64[ns]'))
+        self.daily_columns = self.compact.columns
+        self.all_fund_data_normalized = pandas.DataFrame(columns=self.compact.labels, \
+                                                         index=pandas.DatetimeIndex([]), dtype=numpy.float64)
+
     def get_all_fund_data_normalized(self):
         return self.all_fund_data_normalized
+
+    def get_storage_nbytes(self):
+        """
+        Returns:
+        tuple: (bytes held for the funds' NAVs, bytes that calendar-daily float64 matrices of
+        the forward-filled and the normalized NAVs take, or would take)
+        """
+        if self.is_compact():
+            return self.compact.nbytes(), 2 * self.compact.daily_nbytes()
+        nbytes = self.daily_navs.nbytes + self.all_fund_data_normalized.memory_usage(index=False).sum()
+        return nbytes, nbytes
+
+    def build_daily_matrix(self):
+        """
+        Precomputes the forward-filled, calendar-daily NAVs of all the funds as one NumPy
+        matrix, so that a change of the plotted date range or of the normalization date is
+        just integer slicing and one broadcast division (see `normalized_window`).
+        """
+        import matplotlib.dates as mdates   # Only the date numbers; not the GUI
+
+        daily_fund_data = self.all_fund_data.asfreq('D').ffill()
+        # Column-major, so that each fund's slice of a window is contiguous
+        self.daily_navs = numpy.asfortranarray(daily_fund_data.to_numpy(dtype=numpy.float64))
+        self.daily_epoch = daily_fund_data.index[0].to_datetime64().astype('datetime64[D]')
+        self.daily_dates_num = mdates.date2num(daily_fund_data.index.values)
+        self.daily_columns = {label: column for column, label in enumerate(daily_fund_data.columns)}
+        # From here on, `all_fund_data` is the daily data too, sharing the matrix's memory
+        self.all_fund_data = pandas.DataFrame(self.daily_navs, index=daily_fund_data.index, \
+                                              columns=daily_fund_data.columns, copy=False)
+
+    def get_daily_navs(self):
+        if self.is_compact():
+            # The rows of compact NAVs are the business days (see `get_daily_dates`)
+            return self.compact.window(0, len(self.compact.calendar) - 1)
+        return self.daily_navs
+
+    def nav_at(self, row, column):
+        """Returns a fund's forward-filled NAV at a row of the daily NAVs."""
+        if self.is_compact():
+            return self.compact.value(column, row)
+        return self.daily_navs[row, column]
+
+    def get_daily_dates_num(self):
+        return self.daily_dates_num
+
+    def get_daily_dates(self):
+        # The numpy datetime64[D] dates of the rows of `daily_navs`
+        if self.is_compact():
+            return self.compact.calendar
+        return self.daily_epoch + numpy.arange(len(self.daily_navs))
+
+    def get_risk_nbytes(self):
+        """Returns about the most memory that the risk table of the whole date range takes."""
+        if self.is_compact():
+            # A block of funds at a time, with its window of NAVs (see `PlotManager.get_compact_risk_table`)
+            n_rows, n_funds = len(self.compact.calendar), min(len(self.compact.labels), RISK_BLOCK_SIZE)
+            return RiskMetrics.working_nbytes(n_rows, n_funds) + n_rows * n_funds * 8
+        return RiskMetrics.working_nbytes(*self.daily_navs.shape)
+
+    def get_daily_column(self, label):
+        return self.daily_columns.get(label)
+
+    def day_offset(self, date):
+        """Returns the row of `daily_navs` for a date, clipped to the rows that exist."""
+        if self.is_compact():
+            return self.compact.row_of(date)
+        offset = int((numpy.datetime64(date, 'D') - self.daily_epoch).astype(numpy.int64))
+        return min(max(offset, 0), len(self.daily_navs) - 1)
+
+    def add_portfolios(self, portfolios):
+        """
+        Backtests model portfolios over the daily NAVs and adds each portfolio's value as a
+        column of the daily data, so that it is sliced, normalized and plotted like a fund.
+
+        Parameters:
+        portfolios (list of PortfolioSpec): The portfolios, whose weights name funds by label.
+
+        Returns:
+        list of PortfolioSpec: The portfolios added; the others are skipped with a warning.
+        """
+        if self.is_compact():
+            return self.add_compact_portfolios(portfolios)
+        dates = self.get_daily_dates()
+        added = []
+        columns = []
+        for spec in portfolios:
+            try:
+                values, rebalances, costs = backtest_portfolio(dates, self.daily_navs, self.daily_columns, spec)
+            except ValueError as e:
+                logger.warning(f"Skipping a portfolio: {e}")
+                continue
+            logger.info(f"Portfolio {spec.label}: {len(rebalances)} rebalance(s), " \
+                        f"costs of {costs:.2f} on 100 invested")
+            added.append(spec)
+            columns.append(values)
+        if not added:
+            return added
+        labels = list(self.all_fund_data.columns) + [spec.label for spec in added]
+        self.daily_navs = numpy.asfortranarray(numpy.column_stack([self.daily_navs] + columns))
+        self.daily_columns = {label: column for column, label in enumerate(labels)}
+        self.all_fund_data = pandas.DataFrame(self.daily_navs, index=self.all_fund_data.index, \
+                                              columns=labels, copy=False)
+        self.all_fund_data_normalized = pandas.DataFrame( \
+            self.normalized_window(0, len(self.daily_navs) - 1, self.day_offset(self.start_date)), \
+            index=self.all_fund_data_normalized.index, columns=labels)
+        return added
+
+    def add_compact_portfolios(self, portfolios):
+        # The backtests run on the business days, over the NAVs of the funds the portfolios hold
+        calendar = self.compact.calendar
+        added = []
+        for spec in portfolios:
+            funds = [fund for fund in spec.weights if fund in self.compact.columns]
+            navs = self.compact.window(0, len(calendar) - 1, [self.compact.columns[fund] for fund in funds])
+            try:
+                values, rebalances, costs = backtest_portfolio(calendar, navs, \
+                                                               {fund: i for i, fund in enumerate(funds)}, spec)
+            except ValueError as e:
+                logger.warning(f"Skipping a portfolio: {e}")
+                continue
+            logger.info(f"Portfolio {spec.label}: {len(rebalances)} rebalance(s), " \
+                        f"costs of {costs:.2f} on 100 invested")
+            self.compact.add_fund(spec.label, values)
+            added.append(spec)
+        self.all_fund_data_normalized = pandas.DataFrame(columns=self.compact.labels, \
+                                                         index=pandas.DatetimeIndex([]), dtype=numpy.float64)
+        return added
+
+    def normalized_window(self, first_row, last_row, base_row):
+        """
+        Returns the NAVs of the rows `first_row` to `last_row` (inclusive), normalized to 100 at
+        `base_row`. Funds that have no NAV yet at `base_row` come out as NaN.
+        """
+        if self.is_compact():
+            return self.compact.normalized_window(first_row, last_row, base_row)
+        return normalize_window(self.daily_navs, first_row, last_row, base_row)
 # End class FundDataManager
 
+class BlitManager:
+    """
+    Redraws a few frequently changing ("animated") artists without redrawing the whole figure.
+
+    After every full draw of the figure, the rendered figure minus the animated artists is saved
+    as a background. An update restores that background, draws just the animated artists on it,
+    and blits the result to the screen. The background is thrown away when anything that it
+    shows may have changed (a resize, a zoom or pan, a new plotted date range), and the next
+    full draw saves a new one. Canvases that cannot blit get an ordinary idle redraw instead.
+    """
+    def __init__(self, canvas, animated_artists=()):
+        self.canvas = canvas
+        self.background = None
+        self.artists = []
+        for artist in animated_artists:
+            self.add_artist(artist)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def add_artist(self, artist):
+        # Animated artists are left out of full draws; `on_draw` and `update` draw them instead
+        artist.set_animated(True)
+        self.artists.append(artist)
+
+    def invalidate(self, *args):
+        self.background = None
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        figure = self.canvas.figure
+        for artist in self.artists:
+            figure.draw_artist(artist)
+
+    def update(self):
+        if not self.canvas.supports_blit or self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_animated()
+        self.canvas.blit(self.canvas.figure.bbox)
+        self.canvas.flush_events()
+# End class BlitManager
+
+class UpdateScheduler:
+    """
+    Coalesces requests to recompute the plot into at most one recompute per frame.
+
+    A request only marks the plot as out of date and starts a single-shot timer of one frame;
+    when the timer fires, one recompute handles all the requests made in the meantime, such as
+    the many intermediate values of a fast slider drag. Inside a `transaction`, requests are
+    held back until the outermost transaction ends, so that several related changes (the three
+    sliders set from the text boxes) give one recompute. Requests made by the recompute itself,
+    when it clamps a slider, are counted and dropped, since the recompute already sees the
+    clamped value. Canvases without an event loop, which cannot run timers, recompute at once.
+    """
+    def __init__(self, canvas, recompute, interval=16):
+        self.recompute = recompute
+        self.requested = 0          # Recomputes asked for
+        self.performed = 0          # Recomputes actually run
+        self.pending = False
+        self.timer_started = False
+        self.recomputing = False
+        self.transaction_depth = 0
+        self.timer = canvas.new_timer(interval=interval)
+        self.timer.single_shot = True
+        self.timer.add_callback(self.flush)
+        # The base class is what non-interactive backends such as Agg hand out; it never fires
+        self.synchronous = type(self.timer) is TimerBase
+
+    def request(self, *args):
+        self.requested += 1
+        if self.recomputing:
+            return
+        self.pending = True
+        if self.transaction_depth == 0:
+            self.schedule()
+
+    def schedule(self):
+        if self.synchronous:
+            self.flush()
+        elif not self.timer_started:
+            self.timer_started = True
+            self.timer.start()
+
+    @contextmanager
+    def transaction(self):
+        self.transaction_depth += 1
+        try:
+            yield self
+        finally:
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0 and self.pending:
+                self.schedule()
+
+    def flush(self):
+        """Runs the recompute now if one is pending."""
+        if self.timer_started:
+            self.timer_started = False
+            self.timer.stop()
+        if not self.pending or self.recomputing:
+            return
+        self.pending = False
+        self.recomputing = True
+        try:
+            self.recompute()
+            self.performed += 1
+        finally:
+            self.recomputing = False
+
+    def get_counts(self):
+        return self.requested, self.performed
+
+    def log_counts(self, *args):
+        logger.info(f"Plot updates: {self.requested} requested, {self.performed} performed")
+# End class UpdateScheduler
+
+class RiskRefresher:
+    """
+    Refreshes the risk table as the plotted date range changes, at most once per `interval`.
+
+    Every recompute of the plot requests a refresh. The first request after a quiet spell
+    refreshes at once; the requests that arrive before the interval is up are folded into one
+    refresh at its end, which sees the date range the plot has by then. A refresh of a range
+    that was already shown is skipped. Canvases without an event loop refresh at once.
+    """
+    def __init__(self, canvas, refresh, interval=1.0):
+        self.refresh = refresh
+        self.interval = interval      # Seconds
+        self.last_refresh = None      # When the table was last refreshed, by time.monotonic()
+        self.pending = False
+        self.timer_started = False
+        self.timer = canvas.new_timer()
+        self.timer.single_shot = True
+        self.timer.add_callback(self.flush)
+        self.synchronous = type(self.timer) is TimerBase
+
+    def request(self):
+        self.pending = True
+        if self.timer_started:
+            return
+        wait = 0.0 if self.last_refresh is None else \
+               self.last_refresh + self.interval - time.monotonic()
+        if self.synchronous or wait <= 0.0:
+            self.flush()
+        else:
+            self.timer_started = True
+            self.timer.interval = max(int(wait * 1000), 1)
+            self.timer.start()
+
+    def flush(self):
+        self.timer_started = False
+        if not self.pending:
+            return
+        self.pending = False
+        self.last_refresh = time.monotonic()
+        self.refresh()
+# End class RiskRefresher
+
 class PlotManager:
     _instance = None
-    instructions = "Press 'c' to add cursor, then enter a fund's index. Press 'c' to remove cursor."
+    instructions = "Press 'c' to add cursor, then enter a fund's index. Press 'c' to remove cursor. " \
+                   "Press 'r' to print a risk table."
     cursor_line = None
     msg_box = None            # A box for the user to enter cursor commands and to see NAVs
     norm_date_slider = None   # A slider to set the date at which all NAVs are normalized to 100
@@ -201,7 +697,15 @@ class PlotManager:
     min_date_text_box = None  # A TextBox to set the earliest date of the plot
     max_date_text_box = None  # A TextBox to set the latest date of the plot
     norm_date_line = None     # The vertical line showing the normalization dat
+    blit_manager = None       # Redraws the cursor line, the normalization-date line and the messages
+    update_scheduler = None   # Coalesces the slider and text-box changes into one `update` per frame
     input_digits = ""         # The digits input by the user to select a fund to view a single NAV
+    risk_metrics = None       # Computes and caches the risk tables of the plotted date ranges
+    compact_risk_tables = None  # The risk tables of recently plotted ranges of compact funds, by rows
+    risk_free_rate = DEFAULT_RISK_FREE_RATE
+    risk_csv_path = None      # Where to export each risk table, if anywhere
+    risk_refresher = None     # Refreshes the risk table as the plotted date range changes, if asked to
+    live_risk_range = None    # The date range of the risk table last refreshed
 
     # This method implements the singleton pattern
     def __new__(cls, *args, **kwargs):
@@ -213,8 +717,9 @@ class PlotManager:
     def __init__(self, *args, **kwargs):
         if self._initialized:  # Check if already initialized
             return
-        self.fig, self.ax = plt.subplots(figsize=(10, 6))
+        self.fig, self.ax = plt.subplots(figsize=FIGURE_SIZE)
         self.fdm = FundDataManager()
+        self.compact_risk_tables = OrderedDict()
         self._initialized = True  # Mark as initialized
 
     def get_ax(self):
@@ -224,11 +729,106 @@ class PlotManager:
         return self.fig
     
     def post_log_message(self, message):
-        self.msg_box.set_val(message)
+        self.set_message(message)
+        self.refresh_animated()
+
+    # Change the text of the message box without redrawing anything
+    def set_message(self, message):
+        if self.blit_manager is None:
+            self.msg_box.set_val(message)
+        else:
+            # `TextBox.set_val` would redraw the whole figure
+            self.msg_box.text_disp.set_text(message)
+
+    # Redraw just the cursor line, the normalization-date line and the message box
+    def refresh_animated(self):
+        if self.blit_manager is None:
+            self.fig.canvas.draw_idle()
+        else:
+            self.blit_manager.update()
+
+    # Recompute the plot for the current slider values, at the next frame or, if `immediate`, now
+    def request_update(self, immediate=False):
+        self.update_scheduler.request()
+        if immediate:
+            self.update_scheduler.flush()
+
+    # Redraw the whole figure, after a change to something other than the animated artists
+    def redraw(self):
+        if self.blit_manager is not None:
+            self.blit_manager.invalidate()
+        self.fig.canvas.draw_idle()
 
     def get_cursor_line(self):
         return self.cursor_line
 
+    def set_risk_options(self, risk_free_rate, csv_path=None):
+        self.risk_free_rate = risk_free_rate
+        self.risk_csv_path = csv_path
+        if self.risk_metrics is not None:
+            self.risk_metrics.set_risk_free_rate(risk_free_rate)
+        self.compact_risk_tables.clear()
+
+    def get_risk_table(self):
+        """
+        Returns the risk metrics of all the funds over the plotted date range. Tables of recently
+        plotted ranges are cached, so only a range that has not been seen is computed.
+        """
+        first_row, last_row = fdm.day_offset(fdm.get_start_date()), fdm.day_offset(fdm.get_end_date())
+        if fdm.is_compact():
+            return self.get_compact_risk_table(first_row, last_row)
+        if self.risk_metrics is None:
+            self.risk_metrics = RiskMetrics(fdm.get_daily_dates(), fdm.get_daily_navs(), \
+                                            fdm.get_all_fund_data_columns(), self.risk_free_rate)
+        return self.risk_metrics.table(first_row, last_row)
+
+    def get_compact_risk_table(self, first_row, last_row):
+        """
+        Returns the risk metrics of compact funds over the business days `first_row` to `last_row`.
+        They are computed from the NAVs of those days only, a block of funds at a time, so that
+        no matrix of all the funds over all the days is ever built.
+        """
+        key = (first_row, last_row)
+        if key in self.compact_risk_tables:
+            self.compact_risk_tables.move_to_end(key)
+            return self.compact_risk_tables[key]
+        compact = fdm.compact
+        dates = compact.calendar[first_row:last_row + 1]
+        blocks = []
+        for start in range(0, len(compact.labels), RISK_BLOCK_SIZE):
+            columns = numpy.arange(start, min(start + RISK_BLOCK_SIZE, len(compact.labels)))
+            risk_metrics = RiskMetrics(dates, compact.window(first_row, last_row, columns), \
+                                       compact.labels[columns[0]:columns[-1] + 1], self.risk_free_rate)
+            blocks.append(risk_metrics.table(0, len(dates) - 1))
+        table = pandas.concat(blocks)
+        self.compact_risk_tables[key] = table
+        if len(self.compact_risk_tables) > MAX_CACHED_WINDOWS:
+            self.compact_risk_tables.popitem(last=False)
+        return table
+
+    # Print the risk table of the plotted date range to the terminal, and export it if asked to
+    def show_risk_table(self):
+        table = self.get_risk_table()
+        print(f"\nRisk metrics from {fdm.get_start_date():%d-%m-%Y} to {fdm.get_end_date():%d-%m-%Y}, " \
+              f"with a risk-free rate of {self.risk_free_rate * 100:g}%:")
+        print(format_risk_table(table))
+        if self.risk_csv_path is not None:
+            table.to_csv(self.risk_csv_path)
+            self.post_log_message(f"Risk table printed and written to {self.risk_csv_path}")
+        else:
+            self.post_log_message("Risk table printed to the terminal")
+
+    # Refresh the risk table as the plotted date range changes, at most every `interval` seconds
+    def enable_live_risk(self, interval):
+        self.risk_refresher = RiskRefresher(self.fig.canvas, self.refresh_live_risk, interval)
+
+    def refresh_live_risk(self):
+        date_range = (fdm.get_start_date(), fdm.get_end_date())
+        if date_range == self.live_risk_range:
+            return
+        self.live_risk_range = date_range
+        self.show_risk_table()
+
     def get_norm_date_slider(self):
         return self.norm_date_slider
 
@@ -308,30 +908,43 @@ class PlotManager:
                                          initial=end_date.strftime('%d-%m-%Y'))    
          
         # The vertical line showing the normalization date
-        self.norm_date_line = self.ax_method_call('axvline', start_date, color='black', \
-                                                  linewidth=0.5)
+        self.norm_date_line = add_norm_date_line(self.ax, start_date)
 
     def setup_event_handlers(self):
         # Connect input events to their handlers
-        self.fig.canvas.mpl_connect('key_press_event', self.on_key)
-        self.fig.canvas.mpl_connect('motion_notify_event', self.on_mouse_move)
+        # (Each handler is timed if instrumentation is on; otherwise it is connected as it is.)
+        instruments.watch_figure(self.fig)
+        self.fig.canvas.mpl_connect('key_press_event', instruments.wrap('on_key', self.on_key))
+        self.fig.canvas.mpl_connect('motion_notify_event', \
+                                    instruments.wrap('on_mouse_move', self.on_mouse_move))
         # Trigger a handler when the mouse pointer leaves the plot area
-        self.fig.canvas.mpl_connect('axes_leave_event', self.on_leave)
-        self.fig.canvas.mpl_connect('pick_event', self.on_legend_click)
+        self.fig.canvas.mpl_connect('axes_leave_event', instruments.wrap('on_leave', self.on_leave))
+        self.fig.canvas.mpl_connect('pick_event', instruments.wrap('on_legend_click', self.on_legend_click))
+        # Downsample the lines again when the window, and so the plot, changes size
+        self.fig.canvas.mpl_connect('resize_event', instruments.wrap('on_resize', self.on_resize))
+
+        # Blit the artists that change with every mouse movement, rather than redrawing the figure.
+        # A zoom or pan changes the limits of the plot, which makes the saved background stale.
+        self.blit_manager = BlitManager(self.fig.canvas, \
+                                        [self.cursor_line, self.norm_date_line, self.msg_box.text_disp])
+        self.ax.callbacks.connect('xlim_changed', self.blit_manager.invalidate)
+        self.ax.callbacks.connect('xlim_changed', plm.on_xlim_changed)
+        self.ax.callbacks.connect('ylim_changed', self.blit_manager.invalidate)
 
         # Connect the text boxes with code
-        self.norm_date_text_box.on_submit(self.submit_dates)
-        self.min_date_text_box.on_submit(self.submit_dates)
-        self.max_date_text_box.on_submit(self.submit_dates)
+        submit_dates = instruments.wrap('submit_dates', self.submit_dates)
+        self.norm_date_text_box.on_submit(submit_dates)
+        self.min_date_text_box.on_submit(submit_dates)
+        self.max_date_text_box.on_submit(submit_dates)
         
-        # Connect the sliders to the `update` function
-        self.norm_date_slider.on_changed(lambda val: self.update(val, event_source='slider'))
-        self.min_date_slider.on_changed(lambda val: self.update(val, event_source='slider'))
-        self.max_date_slider.on_changed(lambda val: self.update(val, event_source='slider'))
-        # FIXME: Try to attach the update function to sliders directly
-        #min_date_slider.on_changed(update)
-        #max_date_slider.on_changed(update)
-        #norm_date_slider.on_changed(update)
+        # Connect the sliders to the `update` function, through a scheduler that runs it at most
+        # once per frame however many slider changes arrive
+        self.update_scheduler = UpdateScheduler(self.fig.canvas, instruments.wrap('update', \
+                                                lambda: self.update(None, event_source='slider')))
+        self.norm_date_slider.on_changed(self.update_scheduler.request)
+        self.min_date_slider.on_changed(self.update_scheduler.request)
+        self.max_date_slider.on_changed(self.update_scheduler.request)
+        self.fig.canvas.mpl_connect('close_event', self.update_scheduler.log_counts)
 
     # Modify the existing key-press event handler
     def on_key(self, event):
@@ -349,20 +962,33 @@ class PlotManager:
                 selected_fund = self.select_fund(self.input_digits)
                 cursor_line = pm.get_cursor_line()
                 cursor_line.set_visible(cursor_enabled)
-                pm.get_fig().canvas.draw_idle()
+                pm.refresh_animated()
                 self.input_digits = ""
         elif event.key == 'c':
             cursor_enabled = not cursor_enabled
-            pm.get_fig().canvas.draw_idle()
             if cursor_enabled:
                 self.input_digits = ""
                 pm.post_log_message("Now select a fund by typing its 2-digit identifier.")
             else:
                 cursor_line = pm.get_cursor_line()
                 cursor_line.set_visible(cursor_enabled)
-                pm.get_fig().canvas.draw_idle()
                 selected_fund = None
                 pm.post_log_message(self.instructions)
+        elif event.key == 'r':
+            self.show_risk_table()
+        elif event.key == 'i':
+            self.dump_timings()
+
+    # Write the timings of the startup and the event handlers, if instrumentation is on
+    def dump_timings(self):
+        if not instruments.enabled:
+            self.post_log_message("Timings are not recorded; start the program with --instrument FILE")
+            return
+        try:
+            self.post_log_message(f"Timings written to {instruments.dump()}")
+        except OSError as e:
+            logger.warning(f"Cannot write the timings: {e}")
+            self.post_log_message(f"Cannot write the timings: {e}")
 
     # Select one of the funds; takes the number-ID of the fund returns the fund's index
     def select_fund(self, id):
@@ -386,10 +1012,12 @@ class PlotManager:
             min_date_num = mdates.date2num(min_date.to_pydatetime())
             max_date_num = mdates.date2num(max_date.to_pydatetime())
             
-            pm.get_norm_date_slider().set_val(norm_date_num)
-            pm.get_min_date_slider().set_val(min_date_num)
-            pm.get_max_date_slider().set_val(max_date_num)
-            pm.get_fig().canvas.draw_idle()
+            # Set all three sliders before the plot is recomputed, once
+            with pm.update_scheduler.transaction():
+                pm.get_norm_date_slider().set_val(norm_date_num)
+                pm.get_min_date_slider().set_val(min_date_num)
+                pm.get_max_date_slider().set_val(max_date_num)
+            pm.redraw()
         except Exception as e:
             logger.debug(f"Error parsing dates: {e}")
 
@@ -399,7 +1027,6 @@ class PlotManager:
         global pm, norm_date_slider, lines, labels, norm_date_line
 
         logger_update.debug("Entering update")
-        all_fund_data = fdm.get_all_fund_data()
         
         # Convert slider values to datetime objects
         new_base_date = mdates.num2date(pm.get_norm_date_slider().val).replace(tzinfo=None)
@@ -429,40 +1056,46 @@ class PlotManager:
         fdm.set_start_date(min_display_date)
         fdm.set_end_date(max_display_date)
             
-        # Filter data based on display dates
-        filtered_data_with_gaps = all_fund_data[(all_fund_data.index >= min_display_date) \
-                                                & (all_fund_data.index <= max_display_date)]
-        filtered_data = filtered_data_with_gaps.asfreq('D').ffill()
-        
-        if new_base_date in filtered_data.index:
-            base_navs = filtered_data.loc[new_base_date]
-            normalized_data = (filtered_data.divide(base_navs, axis='columns')) * 100
+        # Slice the display dates out of the precomputed daily NAVs and normalize them
+        first_row = fdm.day_offset(min_display_date)
+        last_row = fdm.day_offset(max_display_date)
+        base_row = fdm.day_offset(new_base_date)
+        new_x_data = fdm.get_daily_dates_num()[first_row:last_row + 1]
+        normalized_data = fdm.normalized_window(first_row, last_row, base_row)
                 
-            for line, label in zip(lines, labels):
-                if label in normalized_data:
-                    new_y_data = normalized_data[label]
-                    new_x_data = normalized_data.index
-                    line.set_data(new_x_data, new_y_data)
-                    #logger_update.debug(f'Type of line: {type(line)}')
+        line_columns = [(line, fdm.get_daily_column(label)) for line, label in zip(lines, labels) \
+                        if fdm.get_daily_column(label) is not None]
+        plotted_columns = [column for _, column in line_columns]
+        plm.set_window(new_x_data, normalized_data, line_columns, first_row)
                     
-            pm.get_norm_date_line().set_xdata([new_base_date, new_base_date])
-            self.ax_method_call('set_xlim', [min_display_date, max_display_date])
-            self.ax_method_call('relim')
-            self.ax_method_call('autoscale_view')
-
-            # Check if the y-axis is set to log scale and reapply log-scale formatting if necessary
-            if pm.get_ax().get_yscale() == 'log':
-                apply_log_scale_formatting()
+        pm.get_norm_date_line().set_xdata([new_base_date, new_base_date])
+        self.ax_method_call('set_xlim', [min_display_date, max_display_date])
+        self.autoscale_y(normalized_data[:, plotted_columns])
+
+        # Check if the y-axis is set to log scale and reapply log-scale formatting if necessary
+        if pm.get_ax().get_yscale() == 'log':
+            apply_log_scale_formatting()
             
-            pm.get_fig().canvas.draw_idle()
-        else:
-            print("`new_base_date` not found in `filtered_data.index`.")
-            sys.exit(1)
+        pm.redraw()
             
         pm.get_norm_date_slider().valtext.set_text(new_base_date.strftime('%d-%m-%Y'))
         pm.get_min_date_slider().valtext.set_text(min_display_date.strftime('%d-%m-%Y'))
         pm.get_max_date_slider().valtext.set_text(max_display_date.strftime('%d-%m-%Y'))
 
+        if self.risk_refresher is not None:
+            self.risk_refresher.request()
+
+    # Rescale the y-axis to fit the plotted data. This takes the data limits straight from the
+    # normalized NAVs instead of using `relim`, which recomputes the path of every line.
+    def autoscale_y(self, plotted_data):
+        with numpy.errstate(all='ignore'):
+            y_min = numpy.nanmin(plotted_data, initial=numpy.inf)
+            y_max = numpy.nanmax(plotted_data, initial=-numpy.inf)
+        if not numpy.isfinite(y_min) or not numpy.isfinite(y_max):
+            return
+        self.ax.dataLim.intervaly = (y_min, y_max)
+        self.ax_method_call('autoscale_view', scalex=False)
+
     # Make a vertical cursor line follow the mouse
     def on_mouse_move(self, event):
         global pm, cursor_enabled, selected_fund, labels
@@ -478,20 +1111,14 @@ class PlotManager:
         if event.inaxes == ax:
             cursor_line.set_xdata([event.xdata])  # Update the position of the vertical line
             cursor_line.set_visible(True)         # Make the line visible
-            pm.get_fig().canvas.draw_idle()
             line = lines[selected_fund]
             if line.get_visible():  # Is the line visible?
                 date, index = plm.get_index_and_date_at_cursor(line, event.xdata)
-                all_fund_data = fdm.get_all_fund_data()
-                start_date = fdm.get_start_date()
-                end_date = fdm.get_end_date()
-                extracted_data = fdm.extract_fund_data( \
-                                    all_fund_data, start_date, \
-                                    end_date)
-                indexed_ydata = extracted_data[labels[selected_fund]]
-                all_indexed_ydata = all_fund_data[labels[selected_fund]].iloc
-                pm.post_log_message( \
-                    f"Fund: {labels[selected_fund]}, Date: {date}, NAV: {indexed_ydata[index]:.2f}")
+                # The raw NAV is in the precomputed daily NAVs, at the same date
+                nav = fdm.nav_at(plm.get_window_first_row() + index, plm.get_line_column(line))
+                pm.set_message(f"Fund: {labels[selected_fund]}, Date: {date}, NAV: {nav:.2f}")
+            # Only the cursor line and the message box have changed
+            pm.refresh_animated()
 
     # Make the legend items clickable for hiding/showing individual plot lines
     def on_legend_click(self, event):
@@ -501,18 +1128,29 @@ class PlotManager:
         vis = not origline.get_visible()
         origline.set_visible(vis)
         legline.set_alpha(1.0 if vis else 0.2)
-        pm.get_fig().canvas.draw_idle()  # FIXME: Try to use `execute_draw_idle(fig)`.
+        # Showing or hiding a fund changes the plot itself, not just the animated artists
+        pm.redraw()
+
+    def on_resize(self, event):
+        plm.draw_window()
+        pm.redraw()
 
     def on_leave(self, event):
         global pm
         cursor_line = pm.get_cursor_line()
         cursor_line.set_visible(False)  # Hide the vertical line
-        pm.get_fig().canvas.draw_idle()
+        pm.refresh_animated()
 # End class PlotManager
 
 class PlotLineManager:
     global pm, lines
     _instance = None
+    window_x = None           # The date numbers of the plotted date range, at full resolution
+    window_y = None           # The plotted normalized NAVs, at full resolution, one column per fund
+    line_columns = None       # (line, column of `window_y`) for every plotted line
+    line_column = None        # Maps each plotted line to its column of `window_y`
+    window_first_row = 0      # The row of the daily NAVs at which the plotted date range starts
+    drawn_rows = None         # The first and last rows of the window that the lines were last drawn over
 
     # This method implements the singleton pattern
     def __new__(cls, *args, **kwargs):
@@ -520,34 +1158,127 @@ class PlotLineManager:
             cls._instance = super(PlotLineManager, cls).__new__(cls, *args, **kwargs)
         return cls._instance
     
-    def draw_plot_lines(self, start_date, end_date, labels, colors, all_fund_data_normalized):
-        # Plot the initial normalized NAV data
-        # The following `for` loop could be encapsulated as 
-        #   lines = [ax.plot(all_fund_data_normalized.index, all_fund_data_normalized[label], color=color, label=label, linewidth=1.5)[0] for label, color in zip(labels, colors)]
-        # However, for simpler debugging, it is expressed in a `for` loop instead.
-        for label, color in zip(labels, colors):
-            line, = pm.get_ax().plot(all_fund_data_normalized.index, \
-                                     all_fund_data_normalized[label], \
-                                     color=color, label=label, linewidth=1.5)
-            lines.append(line)
-        for idx, line in enumerate(lines):
-            x_data = line.get_xdata()
-            y_data = line.get_ydata()
+    def draw_plot_lines(self, start_date, end_date, labels, colors, all_fund_data_normalized, \
+                        linewidth=LINE_WIDTH):
+        # Plot the initial normalized NAV data, as batch_render.py does (see chart.py)
+        lines.extend(plot_nav_lines(pm.get_ax(), all_fund_data_normalized.index, \
+                                    all_fund_data_normalized[list(labels)].to_numpy(), labels, colors, \
+                                    linewidth))
+
+    def set_window(self, x, y, line_columns, first_row=0):
+        """
+        Sets the full-resolution data of the plotted date range and draws it, downsampled.
+
+        Parameters:
+        x (numpy array): The Matplotlib date numbers of the date range, ascending.
+        y (2-D numpy array): The normalized NAVs over the date range, one column per fund.
+        line_columns (list of tuple): (line, column of `y`) for every line to draw.
+        first_row (int): The row of the daily NAVs at which the date range starts.
+        """
+        self.window_x = x
+        self.window_y = y
+        self.line_columns = line_columns
+        self.line_column = dict(line_columns)
+        self.window_first_row = first_row
+        # The x limits are set to the date range next, so the whole window will be visible
+        self.draw_window(0, len(x) - 1)
+
+    def visible_rows(self):
+        # The rows of the window within the x limits, and the row just outside them on either
+        # side, so that the lines run up to the edges of the plot
+        x_min, x_max = pm.get_ax().get_xlim()
+        first = max(int(numpy.searchsorted(self.window_x, x_min, side='right')) - 1, 0)
+        last = min(int(numpy.searchsorted(self.window_x, x_max, side='left')), len(self.window_x) - 1)
+        return first, max(first, last)
+
+    def draw_window(self, first=None, last=None):
+        """
+        Draws the rows `first` to `last` (inclusive) of the window, downsampled to about two
+        points per pixel column of the plot: each column's minimum and maximum. By default the
+        rows are those within the plot's x limits.
+        """
+        if self.window_x is None or len(self.window_x) == 0:
+            return
+        if first is None:
+            first, last = self.visible_rows()
+        x, y = decimate(self.window_x[first:last + 1], self.window_y[first:last + 1], pm.get_ax().bbox.width)
+        for line, column in self.line_columns:
+            line.set_data(x, y[:, column])
+        self.drawn_rows = (first, last)
+
+    def on_xlim_changed(self, ax):
+        # A zoom or pan of the toolbar shows another part of the window: downsample that part
+        # alone, at the resolution of the plot
+        if self.window_x is None or len(self.window_x) == 0:
+            return
+        rows = self.visible_rows()
+        if rows != self.drawn_rows:
+            self.draw_window(*rows)
+
+    def get_window_first_row(self):
+        return self.window_first_row
+
+    def get_line_column(self, line):
+        return self.line_column[line]
+
+    def get_raw_data(self, line):
+        # The full-resolution data of a line, for cursor readouts
+        return (self.window_x, self.window_y[:, self.line_column[line]])
 
     def get_index_and_date_at_cursor(self, line, mouse_xdata):
-        xdata, ydata = line.get_data()
-        # Convert xdata to numerical dates
-        numerical_xdata = mdates.date2num(xdata)
-        # Find the x value closest to the cursor position
-        closest_x = min(numerical_xdata, key=lambda x: abs(x - mouse_xdata))
+        # The x data are Matplotlib date numbers, cached in ascending order when the plotted
+        # date range was set, so the closest one can be found by binary search
+        numerical_xdata = self.window_x
+        index = int(numpy.searchsorted(numerical_xdata, mouse_xdata))
+        if index == len(numerical_xdata) or (index > 0 and \
+                mouse_xdata - numerical_xdata[index - 1] <= numerical_xdata[index] - mouse_xdata):
+            index -= 1
         # Get the closest x value's corresponding date
-        date = num2date(closest_x).strftime('%d-%m-%Y')
-        # Get the corresponding y value
-        index = list(numerical_xdata).index(closest_x)
+        date = num2date(numerical_xdata[index]).strftime('%d-%m-%Y')
         return (date, index)
 
 # End class PlotLineManager
 
+class StartupTimer:
+    """
+    Times the phases of the program's startup, from the start of the imports to the window being
+    shown, and the first frame drawn in the window.
+
+    Phases normally follow each other: `end_phase` ends the current phase, which began where the
+    one before it ended. A phase that overlaps others, such as the imports of the GUI while the
+    NAVs are being downloaded, is added with its own start and end by `add_phase`.
+    """
+    def __init__(self, started=STARTED):
+        self.started = started
+        self.phase_started = started
+        self.phases = []          # (name, start, end), as `time.perf_counter` values
+        self.canvas = None
+        self.draw_callback_id = None
+
+    def end_phase(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, self.phase_started, now))
+        self.phase_started = now
+
+    def add_phase(self, name, start, end):
+        self.phases.append((name, start, end))
+
+    def report(self):
+        for name, start, end in sorted(self.phases, key=lambda phase: phase[1]):
+            logger.info(f"Startup: {name:<12} {end - start:6.3f} s, from {start - self.started:.3f} s")
+        logger.info(f"Startup: {time.perf_counter() - self.started:.3f} s until the window is shown")
+
+    def watch_first_draw(self, canvas):
+        self.canvas = canvas
+        self.draw_callback_id = canvas.mpl_connect('draw_event', self.on_first_draw)
+
+    def on_first_draw(self, event):
+        now = time.perf_counter()
+        self.canvas.mpl_disconnect(self.draw_callback_id)
+        instruments.record_span('first_draw', self.started, now)
+        logger.info(f"Startup: {now - self.started:.3f} s until the first frame was drawn")
+# End class StartupTimer
+
 class ToggleSwitch:
     global pm
     
@@ -555,7 +1286,7 @@ class ToggleSwitch:
         self.state = "linear"
         self.button_ax = pm.get_fig().add_axes([0.89, 0.08, 0.1, 0.04])  # The parameters are left, bottom, width, height
         self.button = Button(self.button_ax, 'Linear Scale')
-        self.button.on_clicked(self.toggle)
+        self.button.on_clicked(instruments.wrap('toggle', self.toggle))
 
     def toggle(self, event):
         self.state = "log" if self.state == "linear" else "linear"
@@ -641,13 +1372,15 @@ def extract_data_for_on_move(event, cursor_enabled, selected_fund, labels, \
         "all_fund_data_normalized": all_fund_data_normalized,
         "start_data": start_date
     }
+    import pickle
+
     with open('data_for_on_move_tests.pkl', 'wb') as f:
         pickle.dump(data, f)
     
 def read_and_validate_config(file_path):
     config = toml.load(file_path)
 
-    constants = config['constants']
+    constants = config.get('constants', {})
 
     return constants
 
@@ -709,41 +1442,40 @@ def debug_data():
 # Set the y-axis scale type to 'linear' or 'log'
 def set_log_yaxis_scale(scale_type):
     global pm
-    val = pm.get_min_date_slider().val
     formatter = ticker.ScalarFormatter()
     
     match scale_type:
         case "linear":
             pm.ax_method_call('set_yscale', 'linear')
-            pm.update(val)
+            pm.request_update(immediate=True)
         case "log":
             pm.ax_method_call('set_yscale', 'log')
             apply_log_scale_formatting()
-            pm.update(val)
+            pm.request_update(immediate=True)
         case _:
             logger.debug("failed\n")
 
 # Apply log scale formatting to the y-axis
 def apply_log_scale_formatting():
     global pm
-    formatter = ticker.ScalarFormatter()
-    
-    formatter.set_scientific(False)
-    formatter.set_useOffset(False)
-    pm.get_ax().yaxis.set_major_formatter(formatter)
-    subs = numpy.concatenate([
-        numpy.arange(1.0, 2.0, 0.2),   # Finer ticks between 1 and 2
-        numpy.arange(2.0, 5.0, 0.5),   # Medium ticks between 2 and 5
-        numpy.arange(5.0, 10.0, 1.0)   # Coarser ticks between 5 and 10
-    ])
-    pm.get_ax().yaxis.set_major_locator(ticker.LogLocator(base=10, subs=subs, numticks=20))
+    format_log_axis(pm.get_ax())
+
+# Fetch the data for all the funds concurrently, from the NAV cache where possible
+def fetch_fund_payloads(urls, labels, args):
+    with NavFetcher(max_workers=args.max_workers, timeout=args.timeout, \
+                    retries=args.retries) as fetcher:
+        if args.no_cache:
+            return [result.content if result.ok else None \
+                    for result in fetcher.fetch_all(urls, labels)]
+        cache = NavCache(args.cache_dir, max_age=args.cache_max_age * 3600, offline=args.offline)
+        return cache.fetch_all(urls, labels, fetcher)
 
 # ===================================================================================================
 #                   MAIN
 # ===================================================================================================
 
 def main():
-    global fdm, pm, plm, labels, lines, legline_to_origline
+    global fdm, pm, plm, labels, lines, legline_to_origline, instruments
 
     parser = None            # Command-line arguments parser
     args = None              # Command-line arguments
@@ -751,9 +1483,11 @@ def main():
     config = None            # URLs, labels, and colors for fetching and plotting NAVs
     urls_length = None       # The number of URLs in the configuration file, for checking the file
     urls = None              # The URLs of the funds' data
-    response = None          # The HTTP (web) response to a request for a single fund's data
+    fund_payloads = None     # The funds' data, from the web service or the cache, in `urls` order
     toggle_switch = None     # The switch for toggling between a linear y-scale and a log y-scale
+    startup = StartupTimer() # Times the phases of the startup, for the report logged at the end
 
+    startup.end_phase('import')
     initialize_loggers()
     set_general_logging_level(logging.DEBUG)
     set_update_logging_level(logging.DEBUG)
@@ -770,18 +1504,60 @@ def main():
     parser = argparse.ArgumentParser(description="Read and validate a TOML configuration file.")
     parser.add_argument('-c', '--config', type=str, default='config.toml', \
                         help='Path to the TOML configuration file')
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS, \
+                        help='The maximum number of NAV downloads in flight at once')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, \
+                        help='Seconds to wait for each NAV download attempt')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, \
+                        help='How many times to retry a failed NAV download')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR, \
+                        help='Directory of the on-disk NAV cache')
+    parser.add_argument('--cache-max-age', type=float, default=DEFAULT_MAX_AGE / 3600, \
+                        help='Hours for which cached NAVs are used without asking the server')
+    parser.add_argument('--no-cache', action='store_true', \
+                        help='Neither read nor write the NAV cache')
+    parser.add_argument('--offline', action='store_true', \
+                        help='Use only cached NAVs; never use the network')
+    parser.add_argument('--store', type=str, default=None, \
+                        help='Read the NAVs from this memory-mapped NAV store instead of fetching them')
+    parser.add_argument('--data-source', type=str, default=None, metavar='URL', \
+                        help='Fetch the NAVs from this server with the API of mfapi.in, e.g. a ' \
+                             'nav_server.py at http://127.0.0.1:8765, instead of from api.mfapi.in')
+    parser.add_argument('--screen', type=str, default=None, metavar='QUERY', \
+                        help="Plot the funds of the NAV store (--store) that pass this screening query " \
+                             "instead of the configuration's funds")
+    parser.add_argument('--risk-free-rate', type=float, default=DEFAULT_RISK_FREE_RATE * 100, \
+                        help="The annual risk-free rate, in percent, for the risk table (key 'r')")
+    parser.add_argument('--risk-csv', type=str, default=None, \
+                        help="Also write the risk table (key 'r') to this CSV file")
+    parser.add_argument('--live-risk', type=float, nargs='?', const=1.0, default=None, metavar='SECONDS', \
+                        help="Print the risk table again whenever the plotted date range changes, at most " \
+                             "once every SECONDS (1 by default)")
+    parser.add_argument('--instrument', type=str, default=None, metavar='FILE', \
+                        help="Time the startup stages and the event handlers, and write the timings to " \
+                             "this file (Prometheus's text format for .prom or .txt, else JSON) when " \
+                             "the key 'i' is pressed and at exit")
+    parser.add_argument('--compact', type=str, nargs='?', const='float64', default=None, choices=DTYPES, \
+                        help="Keep each fund's NAVs on the business days of its own history only, " \
+                             "forward-filled as they are read, instead of in calendar-daily matrices; " \
+                             "optionally as float32 to halve their memory")
     
     args = parser.parse_args()
+    instruments = Instrumentation(args.instrument, started=startup.started)
     config_file = args.config
     config = read_and_validate_config(config_file)
+    screen_query = args.screen if args.screen is not None else read_screen_query(config_file)
 
     # Assign elements to variables
     try:
+        if screen_query is not None:
+            # The funds will be those that pass the screen, not the configuration's lists
+            config = {'urls': [], 'labels': [], 'colors': []}
         # Check if all constants have the same number of elements
         urls_length = len(config['urls'])
         if not (len(config['labels']) == urls_length and len(config['colors']) == urls_length):
             raise ValueError("All constant arrays must have the same number of elements.")
-        urls = config['urls']
+        urls = [source_url(url, args.data_source) for url in config['urls']]
         labels = config['labels']
         colors = config['colors']
     except KeyError as e:
@@ -790,6 +1566,7 @@ def main():
     except ValueError as e:
         logger.critical(f"Validation error: {e}")
         sys.exit(1)
+    startup.end_phase('config')
 
     # ================================================
     #             SET UP A DataFrame
@@ -798,36 +1575,70 @@ def main():
     logger.info("Initializing a Dataframe for all fund data")
 
     fdm = FundDataManager()
-    pm = PlotManager()
-    plm = PlotLineManager()
+    if args.compact is not None:
+        fdm.use_compact_storage(args.compact)
     
-    # Fetch and process data for each fund
-    # QUESTION: What does `zip` do? Is `labels` used here?
-    for url, label in zip(urls, labels):
-        # These 3 variables are local.
-        fund_data = None              # A fund's data parsed from the web server's response
-        df = None                     # A DataFrame containing a single fund's processed NAV data
-        temp_df = None                # A temporary store for a DataFrame
-        response = requests.get(url)  # Fetch all the data for one fund from the web service
-
-        if response.status_code == 200:
-            fund_data = response.json()  # Parse the web service's response
-            df = pandas.DataFrame(fund_data['data'])  # Convert fund_data['data'] to a DataFrame
-            df['date'] = pandas.to_datetime(df['date'], format='%d-%m-%Y')
-            df.set_index('date', inplace=True)  # Sets the datetime-format dates in the 'date' column as the index of the DataFrame
-            
-            # FIXME: Convert NAV values to floating point format?
-            df['nav'] = df['nav'].astype(float)
+    if args.offline and args.no_cache:
+        logger.critical("--offline needs the NAV cache, but --no-cache was given.")
+        sys.exit(1)
 
-            # Assign `df` column to corresponding column in `all_fund_data_df`
-            if 'nav' in df:  # Ensure `df` has data for 'nav'
-                # Create a DataFrame with the current label
-                temp_df = pandas.DataFrame({label: df['nav']})
-                # Concatenate along columns (axis=1)
-                fdm.concatenate_fund_data(temp_df)
+    if screen_query is not None and args.store is None:
+        logger.critical("A screening query needs a NAV store (--store).")
+        sys.exit(1)
 
-        else:
+    if args.store is not None:
+        try:
+            fdm.open_store(args.store)
+            scheme_codes = [scheme_code_from_url(url) for url in urls]
+            if screen_query is not None:
+                scheme_codes, labels = fdm.screen_store(screen_query)
+                colors = [f"C{number % 10}" for number in range(len(labels))]
+                if not labels:
+                    raise ValueError(f"No fund passed the screen: {screen_query}")
+                logger.info(f"{len(labels)} funds passed the screen: {screen_query}")
+            logger.info(f"Reading NAV data for {len(labels)} funds from the store {args.store}")
+            fdm.load_fund_data_from_store(scheme_codes, labels)
+        except (OSError, KeyError, ValueError) as e:
+            logger.critical(f"Cannot read the NAV store: {e}")
+            sys.exit(1)
+        fund_payloads = []
+        startup.end_phase('store')
+    else:
+        # Fetch the data for all the funds concurrently, from the cache where possible, while
+        # the GUI is imported
+        logger.info(f"Fetching NAV data for {len(urls)} funds")
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            fetching = executor.submit(fetch_fund_payloads, urls, labels, args)
+            import_started = time.perf_counter()
+            import_gui()
+            startup.add_phase('gui import', import_started, time.perf_counter())
+            fund_payloads = fetching.result()
+        startup.end_phase('fetch')
+
+    # Process the data for each fund
+    for fund_data, label in zip(fund_payloads, labels):
+        if fund_data is None:
             logger.debug(f"Failed to fetch data for {label}")
+            continue
+        try:
+            meta, dates, navs = parse_nav_payload(fund_data)
+        except NavParseError as e:
+            logger.warning(f"Skipping {label}: {e}")
+            continue
+        if len(dates) == 0:
+            logger.warning(f"Skipping {label}: the web service has no NAVs for it")
+            continue
+
+        # Collect the fund's NAVs; all the funds are aligned together afterwards
+        try:
+            fdm.add_fund(label, dates, navs)
+        except ValueError as e:
+            logger.warning(f"Skipping {label}: {e}")
+    startup.end_phase('parse')
+
+    logger.info("Aligning the data of all funds on a common date index")
+    fdm.align_fund_data()
+    startup.end_phase('align')
 
     # ================================================
     #        FILL IN OR INTERPOLATE AND NORMALIZE FUND DATA
@@ -840,9 +1651,27 @@ def main():
     # Probably this should use the ffill method, not interpolation.
     for label in fdm.get_all_fund_data_columns():
         fdm.interpolate_fund_series_frame(label)
+    startup.end_phase('interpolate')
 
     logger.info("Normalizing all fund data")
     fdm.normalize_all_fund_data()
+
+    # Model portfolios, if the configuration describes any, are plotted alongside the funds
+    try:
+        portfolios = fdm.add_portfolios(read_portfolios(config_file))
+    except ValueError as e:
+        logger.critical(f"Invalid portfolio in configuration: {e}")
+        sys.exit(1)
+    startup.end_phase('normalize')
+    nbytes, daily_nbytes = fdm.get_storage_nbytes()
+    risk_nbytes = fdm.get_risk_nbytes()
+    if fdm.is_compact():
+        logger.info(f"NAV storage: {nbytes / 1e6:.1f} MB, compact {args.compact}, instead of " \
+                    f"{daily_nbytes / 1e6:.1f} MB calendar-daily; up to {risk_nbytes / 1e6:.1f} MB " \
+                    f"more while a risk table is computed")
+    else:
+        logger.info(f"NAV storage: {nbytes / 1e6:.1f} MB calendar-daily; up to {risk_nbytes / 1e6:.1f} MB " \
+                    f"more for the risk tables")
     
     # ================================================
     #    Create the Figure, a Message Box, a Plot,
@@ -850,23 +1679,34 @@ def main():
     #          the NAV-Normalization Date
     # ================================================
 
+    if plt is None:
+        import_gui()
+        startup.end_phase('gui import')
+
     logger.info("Creating figure components")
+    pm = PlotManager()
+    plm = PlotLineManager()
     pm.create_figure_components(fdm.get_start_date(), fdm.get_end_date())
 
     all_fund_data_normalized = fdm.get_all_fund_data_normalized()
     plm.draw_plot_lines(fdm.get_start_date(), fdm.get_end_date(), labels, colors, all_fund_data_normalized)
+    plm.draw_plot_lines(fdm.get_start_date(), fdm.get_end_date(), [spec.label for spec in portfolios], \
+                        [spec.color for spec in portfolios], all_fund_data_normalized, PORTFOLIO_LINE_WIDTH)
+    labels = labels + [spec.label for spec in portfolios]
 
     pm.setup_event_handlers()
+    if fdm.is_compact():
+        pm.update(None)   # The lines start out empty
+    pm.set_risk_options(args.risk_free_rate / 100, args.risk_csv)
+    if args.live_risk is not None:
+        pm.enable_live_risk(args.live_risk)
     
     # Instantiate and show the toggle switch
     toggle_switch = ToggleSwitch()
     toggle_switch.show()
 
     # Set plot title, labels, and legend
-    pm.get_ax().set_title('Normalized Indian Mutual Fund NAVs')
-    pm.get_ax().set_xlabel('Date')
-    pm.get_ax().set_ylabel('Normalized NAV')
-    legend = pm.get_ax().legend()
+    legend = label_chart(pm.get_ax())
     
     # Ensure legend and lines have the same length
     if len(legend.get_lines()) != len(lines):
@@ -889,6 +1729,11 @@ def main():
     # ================================================
     
     set_log_yaxis_scale("linear")
+    startup.end_phase('figure')
+    startup.report()
+    startup.watch_first_draw(pm.get_fig().canvas)
+    for phase in startup.phases:
+        instruments.record_span(*phase)
     
     logger.info("Showing the plot")
     try:
@@ -903,5 +1748,10 @@ def main():
     except Exception as e:
         logger.debug(f"Error during plt.show(): {e}")
 
+    try:
+        instruments.dump()
+    except OSError as e:
+        logger.warning(f"Cannot write the timings: {e}")
+
 if __name__ == "__main__":
     main()
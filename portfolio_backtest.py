@@ -0,0 +1,383 @@
+##
+##  Backtests of model portfolios of funds, rebalanced on a schedule or when they drift
+##
+##  A configuration file can describe model portfolios after its [constants] table, each as a
+##  [[portfolios]] table:
+##
+##      [[portfolios]]
+##      label = '11. Value & FMCG'
+##      color = 'black'
+##      weights = { '06. ICICI FMCG' = 40, '07. ICICI Value' = 60 }   # By fund label
+##      rebalance = 'quarterly'   # never, monthly, quarterly, half-yearly or yearly
+##      band = 5                  # Also rebalance when a weight drifts this many percentage points
+##      cost = 0.1                # Percent of the value traded at each rebalance
+##
+##  A portfolio starts, worth 100, on the first date on which all its funds have NAVs, and
+##  holds fixed numbers of units until the next rebalance, so between two rebalances its value
+##  is a matrix-vector product of the funds' NAVs with its units. Given the dates of the
+##  rebalances, the values of all the segments between them come from one such product and a
+##  cumulative product of each segment's growth. Scheduled rebalances fall on the first business
+##  day of each period; with a drift band, the weights are computed for a block of days at once
+##  and the first day on which any of them strays outside the band is the next rebalance. Costs
+##  are charged on the value traded.
+##
+##  A parameter sweep backtests every combination of weights (on a grid), rebalancing schedule,
+##  band and cost for a portfolio's funds, in a pool of processes that each receive the NAVs
+##  once, and ranks the candidates by their risk metrics.
+##
+##  Usage:
+##
+##      python portfolio_backtest.py -c config_portfolios.toml [--csv FILE]
+##          [--sweep LABEL [--weight-step 10] [--rebalance never quarterly] [--bands 0 5]
+##          [--costs 0.1] [--workers N] [--sort sharpe] [--top 20]]
+##          [--store STORE_DIR | --cache-dir DIR [--offline]]
+##
+
+import argparse
+import itertools
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import pandas
+import toml
+
+from nav_data import read_fund_config, add_source_arguments, load_daily_navs
+from risk_metrics import RiskMetrics
+
+logger = logging.getLogger(__name__)
+
+INITIAL_VALUE = 100.0
+REBALANCE_MONTHS = {'never': None, 'monthly': 1, 'quarterly': 3, 'half-yearly': 6, 'yearly': 12}
+BAND_SCAN_ROWS = 366           # Days whose weights are checked against a drift band at once
+DEFAULT_COLOR = 'black'
+DEFAULT_WEIGHT_STEP = 10       # Percent
+DEFAULT_TOP = 20
+
+class PortfolioSpec:
+    """A model portfolio: target weights of funds, a rebalancing rule and a transaction cost."""
+    def __init__(self, label, weights, rebalance='never', band=None, cost=0.0, color=DEFAULT_COLOR):
+        """
+        Parameters:
+        label (str): The portfolio's name, used as its label in the plot.
+        weights (dict): The target weight of each fund, by fund label, in any unit; they are
+        scaled to add up to 1.
+        rebalance (str): One of the keys of REBALANCE_MONTHS.
+        band (float): The largest drift of any weight from its target, as a fraction, before
+        the portfolio is rebalanced; None for no band.
+        cost (float): The cost of trading, as a fraction of the value traded.
+
+        Raises:
+        ValueError: If any of the parameters is out of range.
+        """
+        if rebalance not in REBALANCE_MONTHS:
+            raise ValueError(f"Portfolio {label}: unknown rebalancing schedule '{rebalance}'; " \
+                             f"use one of {', '.join(REBALANCE_MONTHS)}")
+        if not weights or any(weight < 0 for weight in weights.values()) or sum(weights.values()) <= 0:
+            raise ValueError(f"Portfolio {label}: the weights must be non-negative and not all zero")
+        if band is not None and band <= 0:
+            raise ValueError(f"Portfolio {label}: the drift band must be positive")
+        if not 0 <= cost < 1:
+            raise ValueError(f"Portfolio {label}: the cost must be from 0% to under 100%")
+        total = sum(weights.values())
+        self.label = label
+        self.weights = {fund: weight / total for fund, weight in weights.items()}
+        self.rebalance = rebalance
+        self.band = band
+        self.cost = cost
+        self.color = color
+
+    def describe(self):
+        weights = ', '.join(f"{weight * 100:.3g}% {fund}" for fund, weight in self.weights.items() if weight > 0)
+        band = '' if self.band is None else f", band {self.band * 100:g}%"
+        return f"{weights}; {self.rebalance}{band}, cost {self.cost * 100:g}%"
+# End class PortfolioSpec
+
+def read_portfolios(path):
+    """
+    Reads the [[portfolios]] tables of a configuration file; percentages are turned into
+    fractions.
+
+    Returns:
+    list of PortfolioSpec: The portfolios, in the order of the file; empty if there are none.
+
+    Raises:
+    ValueError: If a portfolio has no label or weights, or a value is out of range.
+    """
+    portfolios = []
+    for number, table in enumerate(toml.load(path).get('portfolios', []), start=1):
+        try:
+            label, weights = table['label'], table['weights']
+        except KeyError as e:
+            raise ValueError(f"Portfolio {number} in {path} has no {e}") from None
+        band = table.get('band')
+        portfolios.append(PortfolioSpec(label, weights, table.get('rebalance', 'never'), \
+                                        None if not band else band / 100, \
+                                        table.get('cost', 0.0) / 100, table.get('color', DEFAULT_COLOR)))
+    return portfolios
+
+def rebalance_rows(dates, rebalance, first_row):
+    """
+    Returns the rows of `dates` (datetime64[D], calendar-daily or business days) of the
+    scheduled rebalances after `first_row`: the first business day of every period counted from
+    its month, or the first date after it that has a row.
+    """
+    months = REBALANCE_MONTHS[rebalance]
+    if months is None:
+        return numpy.empty(0, dtype=numpy.int64)
+    first_month = dates[first_row].astype('datetime64[M]')
+    period_starts = numpy.arange(first_month + months, dates[-1].astype('datetime64[M]') + 1, months)
+    days = numpy.busday_offset(period_starts.astype('datetime64[D]'), 0, roll='forward')
+    rows = numpy.unique(numpy.searchsorted(dates, days))
+    return rows[rows < len(dates)]
+
+def first_breach(navs, units, weights, band, first_row, last_row):
+    """
+    Returns the first row from `first_row` up to `last_row` (exclusive) on which a weight is
+    outside the band, or None. `units` are the holdings of the segment, for any value.
+    """
+    for start in range(first_row, last_row, BAND_SCAN_ROWS):
+        holdings = navs[start:min(start + BAND_SCAN_ROWS, last_row)] * units
+        drift = numpy.abs(holdings / holdings.sum(axis=1, keepdims=True) - weights).max(axis=1)
+        outside = numpy.flatnonzero(drift > band)
+        if len(outside):
+            return start + int(outside[0])
+    return None
+
+def segment_values(navs, weights, events, cost):
+    """
+    Computes a portfolio's values given the rows of its start and of all its rebalances.
+
+    Within the segment that starts at a rebalance on row r, the value on row t is the value at
+    r times the growth (NAV[t] / NAV[r]) @ weights, and the value at the next rebalance is the
+    value at r times the growth to it, less the cost of trading back to the target weights, so
+    all the segments are computed at once, from a cumulative product of those factors.
+
+    Returns:
+    tuple: (the values, NaN before the start; the total cost paid)
+    """
+    n_rows = len(navs)
+    first_row = events[0]
+    segments = numpy.repeat(numpy.arange(len(events)), numpy.diff(numpy.append(events, n_rows)))
+    start_navs = navs[events]
+    growth = (navs[first_row:] / start_navs[segments]) @ weights
+    # The holdings of each segment on the day of the rebalance that ends it, as shares of the value
+    end_relative = navs[events[1:]] / start_navs[:-1]
+    end_growth = end_relative @ weights
+    traded = numpy.abs(end_relative * weights / end_growth[:, None] - weights).sum(axis=1)
+    factors = end_growth * (1.0 - cost * traded)
+    start_values = INITIAL_VALUE * numpy.concatenate([[1.0], numpy.cumprod(factors)])
+    values = numpy.full(n_rows, numpy.nan)
+    values[first_row:] = growth * start_values[segments]
+    paid = float((start_values[:-1] * end_growth * cost * traded).sum())
+    return values, paid
+
+def backtest(dates, navs, weights, rebalance='never', band=None, cost=0.0):
+    """
+    Backtests one portfolio.
+
+    Parameters:
+    dates (datetime64[D] array): The dates of the rows of `navs`, one per calendar day or one
+    per business day.
+    navs (2-D numpy array): Forward-filled NAVs of the portfolio's funds, one column each.
+    weights (1-D numpy array): The target weights of the columns, adding up to 1.
+    rebalance, band, cost: As for PortfolioSpec.
+
+    Returns:
+    tuple: (the portfolio's value on every row, NaN before its start; the rows of its
+    rebalances; the total cost paid)
+
+    Raises:
+    ValueError: If the funds never all have NAVs on the same day.
+    """
+    complete = numpy.flatnonzero(~numpy.isnan(navs).any(axis=1))
+    if len(complete) == 0:
+        raise ValueError("The portfolio's funds never all have NAVs on the same day")
+    row = int(complete[0])
+    events = numpy.append(row, rebalance_rows(dates, rebalance, row))
+    if band is not None:
+        # A drift band adds rebalances that depend on the path. The weights do not depend on
+        # the value invested, so each segment's units can be taken for a value of 1.
+        scheduled = events[1:]
+        events = [row]
+        while True:
+            next_scheduled = numpy.searchsorted(scheduled, row, side='right')
+            end = int(scheduled[next_scheduled]) if next_scheduled < len(scheduled) else len(navs)
+            breach = first_breach(navs, weights / navs[row], weights, band, row + 1, end)
+            if breach is not None:
+                end = breach
+            if end == len(navs):
+                break
+            events.append(end)
+            row = end
+        events = numpy.array(events, dtype=numpy.int64)
+    values, paid = segment_values(navs, weights, events, cost)
+    return values, events[1:], paid
+
+def backtest_portfolio(dates, daily_navs, columns, spec):
+    """
+    Backtests a PortfolioSpec over a daily NAV matrix.
+
+    Parameters:
+    columns (dict): The column of `daily_navs` of each fund, by label.
+
+    Returns:
+    tuple: As for backtest.
+
+    Raises:
+    ValueError: If a fund of the portfolio is not in `columns`, or the funds never all have
+    NAVs on the same day.
+    """
+    missing = [fund for fund in spec.weights if fund not in columns]
+    if missing:
+        raise ValueError(f"Portfolio {spec.label}: there are no NAVs for {', '.join(missing)}")
+    funds = [fund for fund, weight in spec.weights.items() if weight > 0]
+    weights = numpy.array([spec.weights[fund] for fund in funds])
+    navs = daily_navs[:, [columns[fund] for fund in funds]]
+    try:
+        return backtest(dates, navs, weights, spec.rebalance, spec.band, spec.cost)
+    except ValueError as e:
+        raise ValueError(f"Portfolio {spec.label}: {e}") from None
+
+def weight_grid(n_funds, step):
+    """
+    Returns every set of `n_funds` weights in multiples of `step` percent that add up to 100%,
+    as fractions, one set per row.
+    """
+    if 100 % step:
+        raise ValueError("The weight step must divide 100")
+    n_steps = 100 // step
+    # Stars and bars: the positions of the n_funds - 1 bars among n_steps stars
+    bars = numpy.array(list(itertools.combinations(range(n_steps + n_funds - 1), n_funds - 1)), \
+                       dtype=numpy.int64).reshape(-1, n_funds - 1)
+    edges = numpy.hstack([numpy.full((len(bars), 1), -1), bars, \
+                          numpy.full((len(bars), 1), n_steps + n_funds - 1)])
+    return (numpy.diff(edges, axis=1) - 1) * (step / 100)
+
+def sweep_candidates(spec, weight_step=DEFAULT_WEIGHT_STEP, rebalances=None, bands=None, costs=None):
+    """
+    Returns the candidate portfolios of a sweep over a portfolio's funds: every combination of
+    weights on the grid, rebalancing schedule, band (0 for none) and cost, the last three
+    defaulting to the portfolio's own.
+    """
+    funds = list(spec.weights)
+    rebalances = rebalances or [spec.rebalance]
+    bands = bands if bands is not None else [spec.band or 0.0]
+    costs = costs if costs is not None else [spec.cost]
+    candidates = []
+    for weights in weight_grid(len(funds), weight_step):
+        for rebalance, band, cost in itertools.product(rebalances, bands, costs):
+            candidates.append(PortfolioSpec(f"{spec.label} #{len(candidates) + 1}", \
+                                            dict(zip(funds, weights)), rebalance, band or None, cost))
+    return candidates
+
+# The NAVs that a sweep's worker processes backtest the candidates over, set once per process
+_worker_dates = None
+_worker_navs = None
+_worker_columns = None
+
+def init_sweep_worker(dates, daily_navs, columns):
+    global _worker_dates, _worker_navs, _worker_columns
+    _worker_dates, _worker_navs, _worker_columns = dates, daily_navs, columns
+
+def backtest_chunk(specs):
+    # The values of a chunk of candidates, one column each
+    return numpy.column_stack([backtest_portfolio(_worker_dates, _worker_navs, _worker_columns, spec)[0] \
+                               for spec in specs])
+
+def sweep(dates, daily_navs, columns, candidates, max_workers=None):
+    """
+    Backtests many candidate portfolios in a pool of processes.
+
+    Returns:
+    2-D numpy array: The value of every candidate on every row, one column per candidate.
+    """
+    workers = max_workers or os.cpu_count() or 1
+    chunk_size = max(1, -(-len(candidates) // (4 * workers)))
+    chunks = [candidates[start:start + chunk_size] for start in range(0, len(candidates), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_sweep_worker, \
+                             initargs=(dates, daily_navs, columns)) as executor:
+        return numpy.hstack(list(executor.map(backtest_chunk, chunks)))
+
+def summarize(dates, values, specs):
+    """
+    Tabulates the risk metrics of portfolios over their whole history, with their rules, one
+    row per portfolio.
+    """
+    table = RiskMetrics(dates, values, [spec.label for spec in specs]).table(0, len(dates) - 1)
+    table = table[['annual_return', 'volatility', 'sharpe', 'sortino', 'max_drawdown']]
+    table.insert(0, 'portfolio', [spec.describe() for spec in specs])
+    table.index.name = 'label'
+    return table
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    logging.getLogger('nav_fetcher').setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Backtest the model portfolios of a configuration.")
+    parser.add_argument('-c', '--config', type=str, default='config_portfolios.toml', \
+                        help='Path to the TOML configuration file')
+    parser.add_argument('--csv', type=str, default=None, help='Also write the table to this CSV file')
+    parser.add_argument('--sweep', type=str, default=None, metavar='LABEL', \
+                        help="Sweep the weights and rules of this portfolio's funds")
+    parser.add_argument('--weight-step', type=int, default=DEFAULT_WEIGHT_STEP, \
+                        help='The step, in percent, of the weights in a sweep')
+    parser.add_argument('--rebalance', type=str, nargs='+', default=None, choices=list(REBALANCE_MONTHS), \
+                        help='The rebalancing schedules of a sweep')
+    parser.add_argument('--bands', type=float, nargs='+', default=None, \
+                        help='The drift bands, in percentage points (0 for none), of a sweep')
+    parser.add_argument('--costs', type=float, nargs='+', default=None, \
+                        help='The transaction costs, in percent, of a sweep')
+    parser.add_argument('--workers', type=int, default=None, help='Processes running a sweep')
+    parser.add_argument('--sort', type=str, default='sharpe', \
+                        choices=['annual_return', 'volatility', 'sharpe', 'sortino', 'max_drawdown'], \
+                        help='The metric by which a sweep is ranked, best first')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='The number of candidates to list')
+    add_source_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        urls, labels, _ = read_fund_config(args.config)
+        portfolios = read_portfolios(args.config)
+        if not portfolios:
+            raise ValueError(f"{args.config} describes no [[portfolios]]")
+        dates, daily_navs, kept_labels = load_daily_navs(urls, labels, args)
+        columns = {label: column for column, label in enumerate(kept_labels)}
+        started = time.perf_counter()
+        if args.sweep is None:
+            results = [backtest_portfolio(dates, daily_navs, columns, spec) for spec in portfolios]
+            for spec, (_, events, paid) in zip(portfolios, results):
+                logger.info(f"{spec.label}: {len(events)} rebalance(s), costs of {paid:.2f} on 100 invested")
+            specs = portfolios
+            values = numpy.column_stack([values for values, _, _ in results])
+        else:
+            base = [spec for spec in portfolios if spec.label == args.sweep]
+            if not base:
+                raise ValueError(f"No portfolio is labelled '{args.sweep}'")
+            specs = sweep_candidates(base[0], args.weight_step, args.rebalance, \
+                                     None if args.bands is None else [band / 100 for band in args.bands], \
+                                     None if args.costs is None else [cost / 100 for cost in args.costs])
+            values = sweep(dates, daily_navs, columns, specs, args.workers)
+        logger.info(f"Backtested {len(specs)} portfolio(s) in {time.perf_counter() - started:.2f} s")
+    except (OSError, KeyError, ValueError) as e:
+        logger.critical(e)
+        sys.exit(1)
+
+    table = summarize(dates, values, specs)
+    if args.sweep is not None:
+        table = table.sort_values(args.sort, ascending=args.sort in ('volatility', 'max_drawdown'), \
+                                  na_position='last')
+    percent = lambda value: '-' if pandas.isna(value) else f"{value * 100:.1f}%"
+    ratio = lambda value: '-' if pandas.isna(value) else f"{value:.2f}"
+    print(table.head(args.top if args.sweep is not None else len(table)).to_string( \
+        formatters={'annual_return': percent, 'volatility': percent, 'sharpe': ratio, 'sortino': ratio, \
+                    'max_drawdown': percent}, na_rep='-'))
+    if args.csv is not None:
+        table.to_csv(args.csv)
+        logger.info(f"Wrote the table to {args.csv}")
+
+if __name__ == "__main__":
+    main()
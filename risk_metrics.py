@@ -0,0 +1,222 @@
+##
+##  Risk metrics of many funds over a window of dates
+##
+##  For every fund, over a window of dates: the annualized return, the annualized volatility
+##  and downside deviation of its daily returns, the Sharpe and Sortino ratios against a
+##  risk-free rate, and the maximum drawdown with the dates of its peak, its trough, and the
+##  recovery to the peak.
+##
+##  Everything is computed for all the funds at once with array operations. The daily returns
+##  are summed into running (prefix) sums once, so the return statistics of any window are
+##  differences of two rows of those sums; only the drawdowns need a pass over the window's
+##  NAVs. The tables of recently seen windows are cached, so moving back to a window, or asking
+##  for the same window twice, costs nothing.
+##
+##  Usage:
+##
+##      python risk_metrics.py -c config.toml [--min-date dd-mm-yyyy] [--max-date dd-mm-yyyy]
+##          [--risk-free-rate 6.5] [--csv FILE] [--store STORE_DIR | --cache-dir DIR [--offline]]
+##
+
+import argparse
+import logging
+import sys
+from collections import OrderedDict
+
+import numpy
+import pandas
+
+from nav_data import read_fund_config, parse_date, add_source_arguments, load_daily_navs
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS_PER_YEAR = 252
+DAYS_PER_YEAR = 365.25
+DEFAULT_RISK_FREE_RATE = 0.065     # An annual rate, as a fraction
+MAX_CACHED_WINDOWS = 16
+WORKING_ARRAYS = 9                 # Arrays the size of the NAVs that a RiskMetrics and a table take at most
+
+class RiskMetrics:
+    def __init__(self, dates, daily_navs, labels, risk_free_rate=DEFAULT_RISK_FREE_RATE):
+        """
+        Parameters:
+        dates (datetime64[D] array): The dates of the rows of `daily_navs`, ascending: one per
+        calendar day, or one per business day.
+        daily_navs (2-D numpy array): Forward-filled NAVs, one column per fund.
+        labels (list of str): The names of the funds, in column order.
+        risk_free_rate (float): The annual risk-free rate, as a fraction.
+        """
+        self.dates = dates
+        self.daily_navs = daily_navs
+        self.labels = list(labels)
+        self.tables = OrderedDict()    # The most recently used windows' tables, by (first, last) row
+        # Returns are taken between business days only; weekends would add zero returns
+        self.business_rows = numpy.flatnonzero(numpy.is_busday(dates))
+        business_navs = daily_navs[self.business_rows]
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            returns = business_navs[1:] / business_navs[:-1] - 1.0
+        self.valid = ~numpy.isnan(returns)
+        self.returns = numpy.where(self.valid, returns, 0.0)
+        self.count_sums = self.prefix_sums(self.valid.astype(numpy.float64))
+        self.return_sums = self.prefix_sums(self.returns)
+        self.square_sums = self.prefix_sums(self.returns * self.returns)
+        self.set_risk_free_rate(risk_free_rate)
+
+    @staticmethod
+    def working_nbytes(n_rows, n_funds):
+        """Returns about the most memory that a RiskMetrics and one of its tables take, besides the NAVs."""
+        return WORKING_ARRAYS * n_rows * n_funds * 8
+
+    @staticmethod
+    def prefix_sums(values):
+        # Row k holds the sum of the first k rows of `values`
+        sums = numpy.zeros((len(values) + 1, values.shape[1]))
+        numpy.cumsum(values, axis=0, out=sums[1:])
+        return sums
+
+    def set_risk_free_rate(self, risk_free_rate):
+        self.risk_free_rate = risk_free_rate
+        self.daily_risk_free_rate = (1.0 + risk_free_rate) ** (1.0 / TRADING_DAYS_PER_YEAR) - 1.0
+        shortfall = numpy.minimum(self.returns - self.daily_risk_free_rate, 0.0) * self.valid
+        self.shortfall_sums = self.prefix_sums(shortfall * shortfall)
+        self.tables.clear()
+
+    def table(self, first_row, last_row):
+        """
+        Returns the risk metrics of all the funds over the rows `first_row` to `last_row`
+        (inclusive) of the daily NAVs, as a DataFrame with one row per fund.
+        """
+        key = (int(first_row), int(last_row))
+        if key in self.tables:
+            self.tables.move_to_end(key)
+            return self.tables[key]
+        table = self.compute(*key)
+        self.tables[key] = table
+        if len(self.tables) > MAX_CACHED_WINDOWS:
+            self.tables.popitem(last=False)
+        return table
+
+    def return_statistics(self, first_row, last_row):
+        # Returns k runs from business row k to business row k + 1; take those inside the window
+        first = numpy.searchsorted(self.business_rows, first_row, side='left')
+        last = max(numpy.searchsorted(self.business_rows, last_row, side='right') - 1, first)
+        n = self.count_sums[last] - self.count_sums[first]
+        total = self.return_sums[last] - self.return_sums[first]
+        squares = self.square_sums[last] - self.square_sums[first]
+        shortfall = self.shortfall_sums[last] - self.shortfall_sums[first]
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            mean = total / n
+            variance = numpy.maximum(squares - total * mean, 0.0) / (n - 1)
+            volatility = numpy.sqrt(variance * TRADING_DAYS_PER_YEAR)
+            downside_deviation = numpy.sqrt(shortfall / n * TRADING_DAYS_PER_YEAR)
+            excess = (mean - self.daily_risk_free_rate) * TRADING_DAYS_PER_YEAR
+            sharpe = excess / volatility
+            sortino = excess / downside_deviation
+        few = n < 2
+        for values in (volatility, downside_deviation, sharpe, sortino):
+            values[few] = numpy.nan
+        return volatility, downside_deviation, sharpe, sortino
+
+    def compute(self, first_row, last_row):
+        navs = self.daily_navs[first_row:last_row + 1]
+        n_rows, n_funds = navs.shape
+        funds = numpy.arange(n_funds)
+        rows = numpy.arange(n_rows)[:, None]
+        started = ~numpy.isnan(navs)
+        has_navs = started.any(axis=0)
+        first_valid = started.argmax(axis=0)
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            # The annualized return from each fund's first NAV in the window to its last, over the
+            # calendar days between them (the rows may be business days only)
+            window_dates = self.dates[first_row:last_row + 1]
+            days = (window_dates[-1] - window_dates[first_valid]).astype(numpy.int64)
+            growth = navs[-1] / navs[first_valid, funds]
+            annual_return = numpy.where(days > 0, growth ** (DAYS_PER_YEAR / days) - 1.0, numpy.nan)
+
+            # The drawdown on each day is the fall from the highest NAV so far
+            peak = numpy.fmax.accumulate(navs, axis=0)
+            drawdown = 1.0 - navs / peak
+        trough_row = numpy.where(started, drawdown, -1.0).argmax(axis=0)
+        max_drawdown = numpy.where(has_navs, drawdown[trough_row, funds], numpy.nan)
+        # The row of the highest NAV so far is the last row on which the NAV rose to a new high;
+        # the forward-filled copies of that NAV on the following holidays do not count
+        previous_peak = numpy.empty_like(peak)
+        previous_peak[0] = numpy.nan
+        previous_peak[1:] = peak[:-1]
+        new_high = (navs == peak) & ~(previous_peak == peak)
+        peak_rows = numpy.maximum.accumulate(numpy.where(new_high, rows, 0), axis=0)
+        peak_row = peak_rows[trough_row, funds]
+        peak_value = peak[trough_row, funds]
+        recovered_rows = (rows > trough_row) & (navs >= peak_value)
+        recovered = recovered_rows.any(axis=0) | (max_drawdown == 0.0)
+        recovery_row = numpy.where(max_drawdown == 0.0, trough_row, recovered_rows.argmax(axis=0))
+
+        volatility, downside_deviation, sharpe, sortino = self.return_statistics(first_row, last_row)
+        recovery_days = (window_dates[recovery_row] - window_dates[trough_row]).astype(numpy.int64)
+        not_a_time = numpy.datetime64('NaT')
+        return pandas.DataFrame({
+            'annual_return': annual_return,
+            'volatility': volatility,
+            'downside_deviation': downside_deviation,
+            'sharpe': sharpe,
+            'sortino': sortino,
+            'max_drawdown': max_drawdown,
+            'peak_date': numpy.where(has_navs, window_dates[peak_row], not_a_time),
+            'trough_date': numpy.where(has_navs, window_dates[trough_row], not_a_time),
+            'recovery_date': numpy.where(has_navs & recovered, window_dates[recovery_row], not_a_time),
+            'recovery_days': numpy.where(has_navs & recovered, recovery_days, numpy.nan),
+        }, index=pandas.Index(self.labels, name='fund'))
+# End class RiskMetrics
+
+def format_risk_table(table):
+    """Formats a risk table for the terminal, with returns and drawdowns in percent."""
+    # The formatters are given the missing values too
+    percent = lambda value: '-' if pandas.isna(value) else f"{value * 100:.1f}%"
+    ratio = lambda value: '-' if pandas.isna(value) else f"{value:.2f}"
+    date = lambda value: '-' if pandas.isna(value) else value.strftime('%d-%m-%Y')
+    days = lambda value: '-' if pandas.isna(value) else f"{value:.0f}"
+    formatters = {'annual_return': percent, 'volatility': percent, 'downside_deviation': percent, \
+                  'sharpe': ratio, 'sortino': ratio, 'max_drawdown': percent, 'peak_date': date, \
+                  'trough_date': date, 'recovery_date': date, 'recovery_days': days}
+    return table.to_string(formatters=formatters, na_rep='-')
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    logging.getLogger('nav_fetcher').setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Tabulate the risk metrics of a configuration's funds.")
+    parser.add_argument('-c', '--config', type=str, default='config.toml', \
+                        help='Path to the TOML configuration file')
+    parser.add_argument('--min-date', type=parse_date, default=None, \
+                        help='The first date (dd-mm-yyyy) of the window')
+    parser.add_argument('--max-date', type=parse_date, default=None, \
+                        help='The last date (dd-mm-yyyy) of the window')
+    parser.add_argument('--risk-free-rate', type=float, default=DEFAULT_RISK_FREE_RATE * 100, \
+                        help='The annual risk-free rate, in percent, for the Sharpe and Sortino ratios')
+    parser.add_argument('--csv', type=str, default=None, help='Also write the table to this CSV file')
+    add_source_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        urls, labels, _ = read_fund_config(args.config)
+        dates, daily_navs, labels = load_daily_navs(urls, labels, args)
+    except (OSError, KeyError, ValueError) as e:
+        logger.critical(e)
+        sys.exit(1)
+
+    def row_of(date, default):
+        if date is None:
+            return default
+        offset = int((numpy.datetime64(date.date(), 'D') - dates[0]).astype(numpy.int64))
+        return min(max(offset, 0), len(dates) - 1)
+
+    first_row, last_row = row_of(args.min_date, 0), row_of(args.max_date, len(dates) - 1)
+    table = RiskMetrics(dates, daily_navs, labels, args.risk_free_rate / 100).table(first_row, last_row)
+    print(format_risk_table(table))
+    if args.csv is not None:
+        table.to_csv(args.csv)
+        logger.info(f"Wrote the risk metrics to {args.csv}")
+
+if __name__ == "__main__":
+    main()
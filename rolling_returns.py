@@ -0,0 +1,181 @@
+##
+##  Rolling returns of many funds at once
+##
+##  The rolling N-year CAGR of a fund on a date is the compound annual growth rate of its NAV
+##  over the N years that end on that date. With the NAVs forward-filled onto a calendar-daily
+##  matrix (one row per day, one column per fund), an N-year window is a fixed number of rows,
+##  so the CAGRs of every window of every fund come from one subtraction of the log-NAV matrix
+##  from itself shifted by that many rows:
+##
+##      CAGR = exp((log(NAV[t]) - log(NAV[t - days])) / years) - 1
+##
+##  Their distributions (minimum, median, maximum, and the share of windows that beat a
+##  hurdle rate) are then reductions along the date axis. Nothing loops over funds or dates.
+##
+##  Usage:
+##
+##      python rolling_returns.py -c config.toml [--years 1 3 5] [--hurdle 12] [--csv FILE]
+##          [--plot 3 [--output FILE]] [--store STORE_DIR | --cache-dir DIR [--offline]]
+##
+
+import argparse
+import logging
+import sys
+import warnings
+
+import numpy
+import pandas
+
+from nav_data import read_fund_config, add_source_arguments, load_daily_navs
+
+logger = logging.getLogger(__name__)
+
+DAYS_PER_YEAR = 365.25
+DEFAULT_PERIODS = (1, 3, 5)    # Years
+DEFAULT_HURDLE = 0.12          # A CAGR of 12%
+STATISTICS = ('min', 'median', 'max', 'above_hurdle', 'windows')
+
+def period_days(years):
+    return int(round(DAYS_PER_YEAR * years))
+
+def log_navs(daily_navs):
+    # Non-positive NAVs would be errors in the data; they give NaN rather than warnings
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return numpy.log(daily_navs)
+
+def rolling_cagr(log_daily_navs, years):
+    """
+    Computes the rolling CAGR of every fund.
+
+    Parameters:
+    log_daily_navs (2-D numpy array): Log NAVs, one row per calendar day, one column per fund.
+    years (float): The length of the windows.
+
+    Returns:
+    2-D numpy array: The CAGR of the window ending on each row, as a fraction; NaN where the
+    window starts before the fund's first NAV.
+    """
+    days = period_days(years)
+    cagr = numpy.full(log_daily_navs.shape, numpy.nan, order='F')
+    if days < len(log_daily_navs):
+        window_cagr = cagr[days:]
+        numpy.subtract(log_daily_navs[days:], log_daily_navs[:-days], out=window_cagr)
+        window_cagr *= DAYS_PER_YEAR / days
+        numpy.expm1(window_cagr, out=window_cagr)
+    return cagr
+
+def rolling_return_stats(cagr, hurdle=DEFAULT_HURDLE):
+    """
+    Summarizes the distribution of each fund's rolling CAGRs.
+
+    Returns:
+    dict: 1-D arrays, one value per fund, keyed by the names in STATISTICS. 'above_hurdle' is
+    the fraction of windows whose CAGR beats `hurdle`; the others are NaN for a fund with no
+    complete window.
+    """
+    windows = numpy.count_nonzero(~numpy.isnan(cagr), axis=0)
+    # A fund with no complete window gives an all-NaN column, which NumPy warns about
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        minimum = numpy.nanmin(cagr, axis=0)
+        median = numpy.nanmedian(cagr, axis=0)
+        maximum = numpy.nanmax(cagr, axis=0)
+    above = numpy.count_nonzero(cagr > hurdle, axis=0)
+    above_hurdle = numpy.divide(above, windows, out=numpy.full(len(windows), numpy.nan), \
+                                where=windows > 0)
+    return {'min': minimum, 'median': median, 'max': maximum, 'above_hurdle': above_hurdle, \
+            'windows': windows}
+
+def rolling_return_table(daily_navs, labels, periods=DEFAULT_PERIODS, hurdle=DEFAULT_HURDLE):
+    """
+    Tabulates the rolling-return statistics of every fund for several window lengths.
+
+    Returns:
+    pd.DataFrame: One row per fund (indexed by `labels`) and one column per period and
+    statistic, named like 'rolling_3y_median'. Returns are fractions, not percentages.
+    """
+    log_daily_navs = log_navs(daily_navs)
+    columns = {}
+    for years in periods:
+        stats = rolling_return_stats(rolling_cagr(log_daily_navs, years), hurdle)
+        for name in STATISTICS:
+            columns[f"rolling_{years:g}y_{name}"] = stats[name]
+    return pandas.DataFrame(columns, index=pandas.Index(labels, name='fund'))
+
+def format_table(table):
+    """Formats a rolling-return table for the terminal, with returns in percent."""
+    formatters = {column: (lambda value: f"{value:d}") if column.endswith('_windows') \
+                  else (lambda value: f"{value * 100:.1f}%") for column in table.columns}
+    return table.to_string(formatters=formatters, na_rep='-')
+
+def plot_rolling_cagr(dates, cagr, labels, colors, years, hurdle, output=None):
+    """Plots the rolling CAGRs of the funds over time, and shows or saves the chart."""
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    from plot_lod import decimate
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    has_window = numpy.flatnonzero(~numpy.isnan(cagr).all(axis=1))
+    if len(has_window) == 0:
+        raise ValueError(f"No fund has {years:g} years of NAVs.")
+    rows = slice(has_window[0], None)
+    x = mdates.date2num(dates[rows].astype('datetime64[ns]'))
+    plotted_x, plotted_y = decimate(x, cagr[rows] * 100.0, ax.bbox.width)
+    for column, (label, color) in enumerate(zip(labels, colors)):
+        ax.plot(plotted_x, plotted_y[:, column], label=label, color=color)
+    ax.axhline(hurdle * 100.0, color='gray', linestyle='--', label=f"Hurdle ({hurdle * 100:g}%)")
+    ax.xaxis_date()
+    ax.set_title(f"Rolling {years:g}-Year CAGR of Indian Mutual Funds")
+    ax.set_xlabel('Window End Date')
+    ax.set_ylabel('CAGR (%)')
+    ax.legend()
+    if output is None:
+        plt.show()
+    else:
+        fig.savefig(output)
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    logging.getLogger('nav_fetcher').setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Compute the rolling returns of a configuration's funds.")
+    parser.add_argument('-c', '--config', type=str, default='config.toml', \
+                        help='Path to the TOML configuration file')
+    parser.add_argument('--years', type=float, nargs='+', default=list(DEFAULT_PERIODS), \
+                        help='Lengths, in years, of the rolling windows')
+    parser.add_argument('--hurdle', type=float, default=DEFAULT_HURDLE * 100, \
+                        help='The CAGR, in percent, that a window has to beat')
+    parser.add_argument('--csv', type=str, default=None, help='Also write the table to this CSV file')
+    parser.add_argument('--plot', type=float, default=None, metavar='YEARS', \
+                        help='Plot the rolling CAGRs for windows of this many years')
+    parser.add_argument('--output', type=str, default=None, \
+                        help='Save the plot to this file instead of showing it')
+    add_source_arguments(parser)
+    args = parser.parse_args()
+    hurdle = args.hurdle / 100
+
+    try:
+        urls, labels, colors = read_fund_config(args.config)
+        dates, daily_navs, kept_labels = load_daily_navs(urls, labels, args)
+    except (OSError, KeyError, ValueError) as e:
+        logger.critical(e)
+        sys.exit(1)
+
+    table = rolling_return_table(daily_navs, kept_labels, args.years, hurdle)
+    print(format_table(table))
+    if args.csv is not None:
+        table.to_csv(args.csv)
+        logger.info(f"Wrote the rolling returns to {args.csv}")
+
+    if args.plot is not None:
+        kept = set(kept_labels)
+        kept_colors = [color for label, color in zip(labels, colors) if label in kept]
+        try:
+            plot_rolling_cagr(dates, rolling_cagr(log_navs(daily_navs), args.plot), kept_labels, \
+                              kept_colors, args.plot, hurdle, args.output)
+        except ValueError as e:
+            logger.critical(e)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
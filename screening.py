@@ -0,0 +1,387 @@
+##
+##  Screening the funds of a NAV store with queries over precomputed metrics
+##
+##  The metrics of every fund in a NAV store (rolling returns, risk metrics and the length of
+##  its history) are computed once, a block of funds at a time, and cached next to the store as
+##  a columnar table (one array per metric, in an .npz file) together with a sorted index of
+##  every metric. The cache is rebuilt only when the store changes. A query such as
+##
+##      rolling_3y_median > 14% and max_drawdown < 25% order by sortino desc limit 20
+##
+##  then costs one binary search of a sorted index per condition, a boolean mask per condition
+##  and one pass over the order of the sorting metric, so it answers in milliseconds even for
+##  tens of thousands of funds.
+##
+##  Query syntax (keywords are case-insensitive):
+##
+##      [where] CONDITION [and CONDITION ...] [order by METRIC [asc | desc]] [limit N]
+##
+##      CONDITION:  METRIC (< | <= | > | >= | =) NUMBER[%]
+##                  name contains 'TEXT'
+##
+##  A number with a % sign is a percentage: returns, volatilities and drawdowns are stored as
+##  fractions. Funds without a value for a metric (e.g. without 5 years of history) fail every
+##  condition on it and are sorted last.
+##
+##  The funds that pass can be plotted straight away with
+##
+##      python plot_mutual_funds.py --store STORE_DIR --screen "QUERY"
+##
+##  or by a [screen] table with a `query` in the configuration file.
+##
+##  Usage:
+##
+##      python screening.py STORE_DIR "QUERY" [--csv FILE] [--write-config FILE] [--rebuild]
+##          [--metrics FILE] [-c config.toml]
+##
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+import numpy
+import pandas
+import toml
+
+from nav_data import forward_fill
+from nav_store import NavStore, INDEX_FILE, NAVS_FILE
+from risk_metrics import RiskMetrics
+from rolling_returns import rolling_return_table, DEFAULT_PERIODS, DEFAULT_HURDLE
+
+logger = logging.getLogger(__name__)
+
+METRICS_VERSION = 1
+METRICS_FILE = 'metrics.npz'
+DEFAULT_BLOCK_SIZE = 512       # Funds whose metrics are computed at once
+DAYS_PER_YEAR = 365.25
+RISK_COLUMNS = ('annual_return', 'volatility', 'downside_deviation', 'sharpe', 'sortino', \
+                'max_drawdown', 'recovery_days')
+DISPLAY_METRICS = ('rolling_3y_median', 'annual_return', 'volatility', 'sortino', 'max_drawdown', \
+                   'history_years')   # Shown with the metrics of a query; a CSV file gets them all
+
+class QueryError(ValueError):
+    pass
+
+class Query:
+    """A parsed screening query."""
+    def __init__(self, conditions=(), name_filters=(), order_by=None, descending=False, limit=None):
+        self.conditions = list(conditions)         # (metric, operator, value)
+        self.name_filters = list(name_filters)     # Lower-case texts that names must contain
+        self.order_by = order_by
+        self.descending = descending
+        self.limit = limit
+# End class Query
+
+TOKEN = re.compile(r"\s*(?:(?P<number>-?\d+(?:\.\d*)?(?:[eE]-?\d+)?%?)|(?P<string>'[^']*'|\"[^\"]*\")|" \
+                   r"(?P<operator><=|>=|<|>|=)|(?P<word>[A-Za-z_][A-Za-z0-9_]*))")
+
+def tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise QueryError(f"Cannot read the query at: {text[position:].strip()}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+def parse_query(text):
+    """
+    Parses a screening query (see the syntax above).
+
+    Raises:
+    QueryError: If the query does not follow the syntax.
+    """
+    tokens = tokenize(text)
+    position = 0
+
+    def peek_word(*words):
+        return position < len(tokens) and tokens[position][0] == 'word' and \
+               tokens[position][1].lower() in words
+
+    def take(kind, what):
+        nonlocal position
+        if position >= len(tokens) or tokens[position][0] != kind:
+            found = 'the end of the query' if position >= len(tokens) else f"'{tokens[position][1]}'"
+            raise QueryError(f"Expected {what} but found {found}")
+        position += 1
+        return tokens[position - 1][1]
+
+    def number():
+        text = take('number', 'a number')
+        return float(text[:-1]) / 100 if text.endswith('%') else float(text)
+
+    query = Query()
+    if peek_word('where'):
+        position += 1
+    while position < len(tokens) and not peek_word('order', 'limit'):
+        metric = take('word', 'a metric')
+        if metric.lower() == 'name' and peek_word('contains'):
+            position += 1
+            query.name_filters.append(take('string', 'a quoted text')[1:-1].lower())
+        else:
+            query.conditions.append((metric, take('operator', 'a comparison'), number()))
+        if peek_word('and'):
+            position += 1
+        elif position < len(tokens) and not peek_word('order', 'limit'):
+            raise QueryError(f"Expected 'and', 'order by' or 'limit' but found '{tokens[position][1]}'")
+    if peek_word('order'):
+        position += 1
+        if not peek_word('by'):
+            raise QueryError("Expected 'by' after 'order'")
+        position += 1
+        query.order_by = take('word', 'a metric')
+        if peek_word('asc', 'desc'):
+            query.descending = tokens[position][1].lower() == 'desc'
+            position += 1
+    if peek_word('limit'):
+        position += 1
+        text = take('number', 'a number of funds')
+        if not text.isdigit():
+            raise QueryError(f"Expected a whole number of funds after 'limit' but found '{text}'")
+        query.limit = int(text)
+    if position < len(tokens):
+        raise QueryError(f"Unexpected '{tokens[position][1]}' at the end of the query")
+    return query
+
+class MetricTable:
+    """
+    The metrics of every fund of a NAV store, one array per metric, with a sorted index of
+    each metric for range conditions and ordering.
+    """
+    def __init__(self, scheme_codes, names, metrics):
+        """
+        Parameters:
+        scheme_codes, names (list of str): The store's funds, in column order.
+        metrics (dict): A 1-D float64 array per metric, one value per fund, NaN where missing.
+        """
+        self.scheme_codes = numpy.asarray(scheme_codes, dtype=object)
+        self.names = numpy.asarray(names, dtype=object)
+        self.metrics = metrics
+        self.lower_names = None
+        self.orders = {}       # Per metric: the funds in ascending order of the metric, NaN last
+        self.sorted_values = {}
+        for metric, values in metrics.items():
+            self.orders[metric] = numpy.argsort(values, kind='stable')
+            self.sorted_values[metric] = values[self.orders[metric]]
+
+    @classmethod
+    def build(cls, store, periods=DEFAULT_PERIODS, hurdle=DEFAULT_HURDLE, block_size=DEFAULT_BLOCK_SIZE):
+        """Computes the metrics of all the funds of a NavStore, a block of funds at a time."""
+        dates = store.dates()
+        blocks = []
+        for start in range(0, len(store.scheme_codes), block_size):
+            columns = slice(start, min(start + block_size, len(store.scheme_codes)))
+            labels = store.scheme_codes[columns]
+            navs = numpy.asarray(store.navs[:, columns])
+            has_nav = ~numpy.isnan(navs)
+            first_row = has_nav.argmax(axis=0)
+            last_row = len(navs) - 1 - has_nav[::-1].argmax(axis=0)
+            navs = forward_fill(navs)
+            rolling = rolling_return_table(navs, labels, periods, hurdle)
+            rolling = rolling.drop(columns=[column for column in rolling.columns if column.endswith('_windows')])
+            risk = RiskMetrics(dates, navs, labels).table(0, len(dates) - 1)[list(RISK_COLUMNS)]
+            block = pandas.concat([rolling, risk], axis=1)
+            block['history_years'] = numpy.where(has_nav.any(axis=0), (last_row - first_row) / DAYS_PER_YEAR, \
+                                                 numpy.nan)
+            blocks.append(block)
+        table = pandas.concat(blocks)
+        metrics = {column: table[column].to_numpy(dtype=numpy.float64) for column in table.columns}
+        return cls(store.scheme_codes, store.names, metrics)
+
+    @classmethod
+    def load(cls, path, key):
+        """Loads a cached table, or returns None if there is none or it was built for another key."""
+        try:
+            with numpy.load(path, allow_pickle=False) as arrays:
+                if str(arrays['key']) != key:
+                    return None
+                header = json.loads(str(arrays['header']))
+                metrics = {metric: arrays[f"metric_{metric}"] for metric in header['metrics']}
+        except (OSError, KeyError, ValueError):
+            return None
+        return cls(header['scheme_codes'], header['names'], metrics)
+
+    def save(self, path, key):
+        header = {'scheme_codes': list(self.scheme_codes), 'names': list(self.names), \
+                  'metrics': list(self.metrics)}
+        temp_path = f"{path}.tmp.npz"
+        numpy.savez(temp_path, key=numpy.array(key), header=numpy.array(json.dumps(header)), \
+                    **{f"metric_{metric}": values for metric, values in self.metrics.items()})
+        os.replace(temp_path, path)
+
+    def check_metric(self, metric):
+        if metric not in self.metrics:
+            raise QueryError(f"Unknown metric '{metric}'; the metrics are: {', '.join(self.metrics)}")
+
+    def matching(self, metric, operator, value):
+        """Returns the funds whose metric satisfies a condition, from the metric's sorted index."""
+        self.check_metric(metric)
+        order, values = self.orders[metric], self.sorted_values[metric]
+        # NaNs sort last, so the funds with a value are a prefix of the order
+        n_valid = len(values) - numpy.count_nonzero(numpy.isnan(values))
+        values = values[:n_valid]
+        low, high = 0, n_valid
+        if operator in ('>', '>='):
+            low = numpy.searchsorted(values, value, side='right' if operator == '>' else 'left')
+        elif operator in ('<', '<='):
+            high = numpy.searchsorted(values, value, side='left' if operator == '<' else 'right')
+        else:
+            low = numpy.searchsorted(values, value, side='left')
+            high = numpy.searchsorted(values, value, side='right')
+        return order[low:high]
+
+    def screen(self, query):
+        """
+        Runs a query.
+
+        Parameters:
+        query (Query or str): The query, parsed or not.
+
+        Returns:
+        numpy int array: The columns of the store of the funds that pass, in the query's order.
+        """
+        if isinstance(query, str):
+            query = parse_query(query)
+        n_funds = len(self.scheme_codes)
+        passed = numpy.ones(n_funds, dtype=bool)
+        for metric, operator, value in query.conditions:
+            matching = numpy.zeros(n_funds, dtype=bool)
+            matching[self.matching(metric, operator, value)] = True
+            passed &= matching
+        if query.name_filters:
+            if self.lower_names is None:
+                self.lower_names = numpy.char.lower(self.names.astype(str))
+            for text in query.name_filters:
+                passed &= numpy.char.find(self.lower_names, text) >= 0
+        if query.order_by is None:
+            result = numpy.flatnonzero(passed)
+        else:
+            self.check_metric(query.order_by)
+            order = self.orders[query.order_by]
+            if query.descending:
+                n_valid = len(order) - numpy.count_nonzero(numpy.isnan(self.sorted_values[query.order_by]))
+                order = numpy.concatenate([order[:n_valid][::-1], order[n_valid:]])
+            result = order[passed[order]]
+        return result if query.limit is None else result[:query.limit]
+
+    def to_frame(self, columns=None):
+        """Returns the metrics of the funds at `columns` (all of them by default) as a DataFrame."""
+        if columns is None:
+            columns = numpy.arange(len(self.scheme_codes))
+        frame = pandas.DataFrame({metric: values[columns] for metric, values in self.metrics.items()}, \
+                                 index=pandas.Index(self.scheme_codes[columns], name='scheme_code'))
+        frame.insert(0, 'name', self.names[columns])
+        return frame
+# End class MetricTable
+
+def store_key(store, periods, hurdle):
+    """Identifies the contents of a store and the parameters of its metrics, for the cache."""
+    digest = hashlib.sha256()
+    with open(os.path.join(store.directory, INDEX_FILE), 'rb') as f:
+        digest.update(f.read())
+    status = os.stat(os.path.join(store.directory, NAVS_FILE))
+    digest.update(f"{status.st_size} {status.st_mtime_ns} {METRICS_VERSION} {list(periods)} {hurdle}".encode())
+    return digest.hexdigest()
+
+def open_metric_table(store, path=None, rebuild=False, periods=DEFAULT_PERIODS, hurdle=DEFAULT_HURDLE):
+    """
+    Returns the metric table of a NavStore, from the cache if it is up to date, else built and
+    saved to the cache.
+
+    Parameters:
+    path (str): The cache file; METRICS_FILE in the store's directory by default.
+    rebuild (bool): Rebuild the table even if the cache is up to date.
+    """
+    path = path or os.path.join(store.directory, METRICS_FILE)
+    key = store_key(store, periods, hurdle)
+    table = None if rebuild else MetricTable.load(path, key)
+    if table is None:
+        started = time.perf_counter()
+        table = MetricTable.build(store, periods, hurdle)
+        logger.info(f"Computed the metrics of {len(table.scheme_codes)} funds in " \
+                    f"{time.perf_counter() - started:.1f} s")
+        try:
+            table.save(path, key)
+        except OSError as e:
+            logger.warning(f"Cannot cache the metrics in {path}: {e}")
+    return table
+
+def screen_labels(table, columns, max_name_length=30):
+    """Labels for the funds that passed a screen, numbered like the funds of a configuration."""
+    return [f"{number:02d}. {name[:max_name_length]}" \
+            for number, name in enumerate(table.names[columns], start=1)]
+
+def read_screen_query(path):
+    """Returns the query of a configuration file's [screen] table, or None."""
+    return toml.load(path).get('screen', {}).get('query')
+
+def main():
+    from bulk_ingest import DEFAULT_BASE_URL
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Screen the funds of a NAV store by their metrics.")
+    parser.add_argument('store', type=str, help='Directory of the NAV store')
+    parser.add_argument('query', type=str, nargs='?', default=None, \
+                        help="The query, e.g. \"rolling_3y_median > 14%% order by sortino desc limit 20\"")
+    parser.add_argument('-c', '--config', type=str, default=None, \
+                        help='Take the query from the [screen] table of this configuration file')
+    parser.add_argument('--metrics', type=str, default=None, \
+                        help=f"The metrics cache file; {METRICS_FILE} in the store by default")
+    parser.add_argument('--rebuild', action='store_true', help='Recompute the metrics even if cached')
+    parser.add_argument('--csv', type=str, default=None, help='Also write the results to this CSV file')
+    parser.add_argument('--write-config', type=str, default=None, metavar='FILE', \
+                        help='Write a configuration file listing the funds that passed, for the other tools')
+    parser.add_argument('--base-url', type=str, default=DEFAULT_BASE_URL, \
+                        help='The base of the URLs written by --write-config')
+    args = parser.parse_args()
+
+    try:
+        query = args.query
+        if query is None and args.config is not None:
+            query = read_screen_query(args.config)
+        if query is None:
+            raise ValueError("Give a query, or a configuration file with a [screen] query.")
+        parsed = parse_query(query)
+        table = open_metric_table(NavStore(args.store), args.metrics, args.rebuild)
+        started = time.perf_counter()
+        columns = table.screen(parsed)
+        elapsed = time.perf_counter() - started
+    except (OSError, KeyError, ValueError) as e:
+        logger.critical(e)
+        sys.exit(1)
+    logger.info(f"{len(columns)} of {len(table.scheme_codes)} funds passed in {elapsed * 1000:.2f} ms")
+
+    results = table.to_frame(columns)
+    shown = list(dict.fromkeys(['name'] + [metric for metric, _, _ in parsed.conditions] + \
+                               ([parsed.order_by] if parsed.order_by else []) + list(DISPLAY_METRICS)))
+    percent = lambda value: '-' if pandas.isna(value) else f"{value * 100:.1f}%"
+    number = lambda value: '-' if pandas.isna(value) else f"{value:.2f}"
+    days = lambda value: '-' if pandas.isna(value) else f"{value:.0f}"
+    formatters = {column: days if column == 'recovery_days' else \
+                  number if column in ('sharpe', 'sortino', 'history_years') else percent \
+                  for column in shown if column != 'name'}
+    print(results[shown].to_string(formatters=formatters, na_rep='-'))
+    if args.csv is not None:
+        results.to_csv(args.csv)
+        logger.info(f"Wrote the results to {args.csv}")
+    if args.write_config is not None:
+        base_url = args.base_url.rstrip('/')
+        constants = {'urls': [f"{base_url}/{code}" for code in table.scheme_codes[columns]], \
+                     'labels': screen_labels(table, columns), \
+                     'colors': [f"C{number % 10}" for number in range(len(columns))]}
+        with open(args.write_config, 'w', encoding='utf-8') as f:
+            f.write(f"# The funds that passed the screen: {query}\n")
+            toml.dump({'constants': constants}, f)
+        logger.info(f"Wrote a configuration of the {len(columns)} funds to {args.write_config}")
+
+if __name__ == "__main__":
+    main()
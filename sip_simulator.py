@@ -0,0 +1,193 @@
+##
+##  Backtests of monthly SIPs (systematic investment plans) started in every possible month
+##
+##  An SIP invests a fixed amount in a fund on the same day of every month for a tenure of some
+##  months, and is valued on that day of the month after its last installment. This simulates,
+##  for every fund and every start month in the NAV history at once, the units accumulated, the
+##  final value and the XIRR, and then summarizes each fund's distribution of outcomes.
+##
+##  With P the NAVs on the installment days (one row per month, one column per fund), the units
+##  bought by the installments of months s to s + T - 1 are the amount times a difference of two
+##  rows of the running sums of 1 / P, so the units of every start month of every fund come from
+##  one cumulative sum. The XIRRs are then solved together by xirr.xirr.
+##
+##  Usage:
+##
+##      python sip_simulator.py -c config.toml [--amount 10000] [--years 10] [--day 1]
+##          [--csv SUMMARY_FILE] [--grid-csv GRID_FILE] [--store STORE_DIR | --cache-dir DIR [--offline]]
+##
+
+import argparse
+import logging
+import sys
+import time
+import warnings
+
+import numpy
+import pandas
+
+from nav_data import read_fund_config, add_source_arguments, load_daily_navs
+from xirr import xirr, years_between
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AMOUNT = 10000.0       # Rupees per installment
+DEFAULT_TENURE_YEARS = 10
+DEFAULT_DAY = 1                # The day of the month of the installments
+QUANTILES = (0.0, 0.25, 0.5, 0.75, 1.0)
+
+def installment_rows(dates, day=DEFAULT_DAY):
+    """
+    Returns the installment dates (the given day of every month within `dates`) and their rows
+    in a calendar-daily matrix whose rows are `dates`.
+    """
+    if not 1 <= day <= 28:
+        raise ValueError("The installment day must be from 1 to 28, so that every month has it.")
+    months = numpy.arange(dates[0].astype('datetime64[M]'), dates[-1].astype('datetime64[M]') + 1)
+    days = months.astype('datetime64[D]') + (day - 1)
+    days = days[(days >= dates[0]) & (days <= dates[-1])]
+    return days, (days - dates[0]).astype(numpy.int64)
+
+class SipGrid:
+    """The outcomes of SIPs of every fund started in every possible month."""
+    def __init__(self, start_dates, amount, tenure_months, units, values, rates, converged):
+        self.start_dates = start_dates        # datetime64[D], one per start month
+        self.amount = amount
+        self.tenure_months = tenure_months
+        self.invested = amount * tenure_months
+        self.units = units                    # Shaped (start months, funds); NaN where a fund
+        self.values = values                  # had no NAV yet at the first installment
+        self.rates = rates                    # XIRRs, as fractions
+        self.converged = converged
+
+    def summary(self, labels):
+        """
+        Summarizes each fund's distribution of outcomes over the start months.
+
+        Returns:
+        pd.DataFrame: One row per fund: the number of start months, the quantiles of the
+        final value and of the XIRR, and the share of SIPs that ended below the amount invested.
+        """
+        starts = numpy.count_nonzero(~numpy.isnan(self.values), axis=0)
+        # A fund without a single complete SIP gives all-NaN columns, which NumPy warns about
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            value_quantiles = numpy.nanquantile(self.values, QUANTILES, axis=0)
+            rate_quantiles = numpy.nanquantile(self.rates, QUANTILES, axis=0)
+        losses = numpy.count_nonzero(self.values < self.invested, axis=0)
+        names = ['min', 'p25', 'median', 'p75', 'max']
+        columns = {'starts': starts}
+        columns.update({f"value_{name}": values for name, values in zip(names, value_quantiles)})
+        columns.update({f"xirr_{name}": rates for name, rates in zip(names, rate_quantiles)})
+        columns['loss_share'] = numpy.divide(losses, starts, out=numpy.full(len(starts), numpy.nan), \
+                                             where=starts > 0)
+        return pandas.DataFrame(columns, index=pandas.Index(labels, name='fund'))
+
+    def to_frame(self, labels):
+        """Returns the whole grid in long form: one row per fund and start month with an SIP."""
+        n_starts, n_funds = self.values.shape
+        frame = pandas.DataFrame({
+            'fund': numpy.tile(numpy.asarray(labels, dtype=object), n_starts),
+            'start_date': numpy.repeat(self.start_dates, n_funds),
+            'units': self.units.ravel(),
+            'invested': self.invested,
+            'value': self.values.ravel(),
+            'xirr': self.rates.ravel(),
+            'converged': self.converged.ravel(),
+        })
+        return frame[~numpy.isnan(frame['value'].to_numpy())]
+# End class SipGrid
+
+def simulate_sips(dates, daily_navs, amount=DEFAULT_AMOUNT, tenure_months=DEFAULT_TENURE_YEARS * 12, \
+                  day=DEFAULT_DAY):
+    """
+    Simulates SIPs of every fund started in every month that leaves room for the whole tenure.
+
+    Parameters:
+    dates (datetime64[D] array): The dates of the rows of `daily_navs`, one per calendar day.
+    daily_navs (2-D numpy array): Forward-filled NAVs, one column per fund, as kept by
+    FundDataManager; each installment buys at the NAV in force on its day.
+    amount (float): The amount of each installment.
+    tenure_months (int): The number of installments.
+    day (int): The day of the month of the installments and of the valuation.
+
+    Returns:
+    SipGrid: The outcomes.
+    """
+    installment_dates, rows = installment_rows(dates, day)
+    n_starts = len(rows) - tenure_months
+    if n_starts <= 0:
+        raise ValueError(f"The NAV history is shorter than an SIP of {tenure_months} months.")
+    navs = daily_navs[rows]
+    # A fund's NAVs only ever start, never stop, after forward filling, so an SIP is complete
+    # exactly when the fund had a NAV on its first installment
+    complete = ~numpy.isnan(navs[:n_starts])
+
+    unit_sums = numpy.zeros((len(rows) + 1, navs.shape[1]))
+    numpy.cumsum(numpy.nan_to_num(1.0 / navs), axis=0, out=unit_sums[1:])
+    units = amount * (unit_sums[tenure_months:tenure_months + n_starts] - unit_sums[:n_starts])
+    values = units * navs[tenure_months:tenure_months + n_starts]
+    units[~complete] = numpy.nan
+    values[~complete] = numpy.nan
+
+    # Each SIP's flows: an installment every month, then the final value, all at once
+    flow_months = numpy.arange(n_starts)[:, None] + numpy.arange(tenure_months + 1)
+    times = years_between(installment_dates[flow_months], installment_dates[:n_starts, None])
+    flows = numpy.empty(values.shape + (tenure_months + 1,))
+    flows[..., :tenure_months] = -amount
+    flows[..., tenure_months] = values
+    flows[~complete] = 0.0
+    rates, converged = xirr(flows, times[:, None, :])
+    return SipGrid(installment_dates[:n_starts], amount, tenure_months, units, values, rates, converged)
+
+def format_summary(summary):
+    """Formats a summary for the terminal, with values in rupees and XIRRs in percent."""
+    formatters = {}
+    for column in summary.columns:
+        if column.startswith('value_'):
+            formatters[column] = lambda value: f"{value:,.0f}"
+        elif column.startswith('xirr_') or column == 'loss_share':
+            formatters[column] = lambda value: f"{value * 100:.1f}%"
+    return summary.to_string(formatters=formatters, na_rep='-')
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    logging.getLogger('nav_fetcher').setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Backtest monthly SIPs in a configuration's funds.")
+    parser.add_argument('-c', '--config', type=str, default='config.toml', \
+                        help='Path to the TOML configuration file')
+    parser.add_argument('--amount', type=float, default=DEFAULT_AMOUNT, help='The monthly installment')
+    parser.add_argument('--years', type=int, default=DEFAULT_TENURE_YEARS, help='The tenure in years')
+    parser.add_argument('--day', type=int, default=DEFAULT_DAY, \
+                        help='The day of the month (1 to 28) of the installments')
+    parser.add_argument('--csv', type=str, default=None, help='Also write the summary to this CSV file')
+    parser.add_argument('--grid-csv', type=str, default=None, \
+                        help='Write the outcome of every fund and start month to this CSV file')
+    add_source_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        urls, labels, _ = read_fund_config(args.config)
+        dates, daily_navs, labels = load_daily_navs(urls, labels, args)
+        started = time.perf_counter()
+        grid = simulate_sips(dates, daily_navs, args.amount, args.years * 12, args.day)
+    except (OSError, KeyError, ValueError) as e:
+        logger.critical(e)
+        sys.exit(1)
+    logger.info(f"Simulated {grid.values.size} SIPs ({len(labels)} funds x {len(grid.start_dates)} " \
+                f"start months) in {time.perf_counter() - started:.2f} s; " \
+                f"{numpy.count_nonzero(~grid.converged & ~numpy.isnan(grid.values))} XIRR(s) did not converge")
+
+    summary = grid.summary(labels)
+    print(f"SIPs of {args.amount:,.0f} a month for {args.years} years ({grid.invested:,.0f} invested):")
+    print(format_summary(summary))
+    if args.csv is not None:
+        summary.to_csv(args.csv)
+        logger.info(f"Wrote the summary to {args.csv}")
+    if args.grid_csv is not None:
+        grid.to_frame(labels).to_csv(args.grid_csv, index=False)
+        logger.info(f"Wrote the outcome of every SIP to {args.grid_csv}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+##
+##  Shared fixtures of the tests: a local stand-in for mfapi.in
+##
+##  A StandInServer is an http.server on 127.0.0.1 that answers each path with a queue of
+##  canned responses (status, body, delay, headers), repeating the last one, and counts the
+##  requests it gets, keeps their headers and the most it ever had in flight at once.
+##
+
+import json
+import os
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def mfapi_payload(code, first=date(2024, 1, 1), days=30, nav=10.0, name=None):
+    """Returns an mfapi.in-shaped response body with a NAV on each weekday, newest first."""
+    rows = []
+    for offset in range(days):
+        day = first + timedelta(days=offset)
+        if day.weekday() < 5:
+            rows.append({'date': day.strftime('%d-%m-%Y'), 'nav': f"{nav + offset * 0.01:.5f}"})
+    rows.reverse()
+    meta = {'scheme_code': int(code), 'scheme_name': name or f"Fund {code}", 'fund_house': 'Stand-in'}
+    return json.dumps({'meta': meta, 'data': rows, 'status': 'SUCCESS'}).encode()
+
+class StandInServer:
+    def __init__(self):
+        self.routes = {}           # Path: list of (status, body, delay, headers), the last one repeated
+        self.hits = {}             # Path: number of requests
+        self.request_headers = {}  # Path: the headers of each request, in turn
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server.lock:
+                    server.hits[self.path] = server.hits.get(self.path, 0) + 1
+                    server.request_headers.setdefault(self.path, []).append(dict(self.headers))
+                    responses = server.routes.get(self.path, [(404, b'', 0.0, {})])
+                    status, body, delay, headers = responses.pop(0) if len(responses) > 1 else responses[0]
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    time.sleep(delay)
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass   # The client gave up, e.g. after a timeout
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def route(self, path, *responses):
+        """
+        Answers `path` with the responses in turn, each (status, body), (status, body, delay) or
+        (status, body, delay, response headers).
+        """
+        self.routes[path] = [tuple(response) + (0.0, {})[len(response) - 2:] for response in responses]
+        return f"{self.url}{path}"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+# End class StandInServer
+
+@pytest.fixture
+def stand_in():
+    server = StandInServer()
+    yield server
+    server.close()
@@ -0,0 +1,81 @@
+import os
+
+import numpy
+import pytest
+
+from amfi_update import parse_bulk_navs, update_store, update_cache
+from nav_cache import NavCache
+from nav_store import NavStore
+
+BULK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'NAVAll.txt')
+FILE_DATE = numpy.datetime64('2024-01-12')   # A Friday, the date of the bulk file's NAVs
+
+# The newest stored NAV of each scheme: 100001 has every business day up to the file's date,
+# 100002 misses Thursday 11-Jan, 100003 has no NAV in the file ('N.A.') and 100004 is current
+NEWEST = {'100001': '2024-01-11', '100002': '2024-01-10', '100003': '2024-01-11', '100004': '2024-01-12'}
+
+def history(code):
+    dates = numpy.arange(numpy.datetime64('2024-01-01'), numpy.datetime64(NEWEST[code]) + 1)
+    dates = dates[numpy.is_busday(dates)]
+    return dates, 10.0 + numpy.arange(len(dates)) * 0.1
+
+def read_bulk_file():
+    with open(BULK_FILE, 'r', encoding='utf-8') as f:
+        return parse_bulk_navs(f)
+
+@pytest.fixture
+def store(tmp_path):
+    NavStore.build(str(tmp_path / 'store'), [(code, f"Fund {code}", *history(code)) for code in NEWEST])
+    return str(tmp_path / 'store')
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = NavCache(str(tmp_path / 'cache'))
+    for code in NEWEST:
+        dates, navs = history(code)
+        rows = [{'date': date.item().strftime('%d-%m-%Y'), 'nav': f"{nav:.4f}"} for date, nav in zip(dates, navs)]
+        cache.store(code, {'meta': {'scheme_code': int(code)}, 'data': rows[::-1]})
+    return cache
+
+def test_parse_bulk_navs_keeps_only_usable_scheme_rows():
+    bulk_navs = read_bulk_file()
+    assert sorted(bulk_navs) == ['100001', '100002', '100004', '999999']
+    assert bulk_navs['100001'] == (FILE_DATE, '25.4321', 'Stand-in Flexi Cap Fund - Direct Plan - Growth')
+
+def test_update_store_appends_and_reports_gaps(store):
+    report = update_store(NavStore(store, mode='r+'), read_bulk_file())
+    assert (report.appended, report.current, report.gaps) == (1, 1, ['100002'])
+    assert (report.absent, report.unknown) == (1, 1)
+
+    reopened = NavStore(store)
+    row = reopened.day_offset(FILE_DATE)
+    assert reopened.navs[row, reopened.columns['100001']] == 25.4321
+    # A NAV after a gap is not appended, so that the gap stays visible
+    assert numpy.isnan(reopened.navs[row, reopened.columns['100002']])
+
+def test_update_store_twice_changes_nothing_more(store):
+    update_store(NavStore(store, mode='r+'), read_bulk_file())
+    before = numpy.array(NavStore(store).navs)
+    report = update_store(NavStore(store, mode='r+'), read_bulk_file())
+    assert (report.appended, report.current, report.gaps) == (0, 2, ['100002'])
+    numpy.testing.assert_array_equal(numpy.array(NavStore(store).navs), before)
+
+def test_a_holiday_is_not_a_gap(store):
+    holidays = numpy.array(['2024-01-11'], dtype='datetime64[D]')
+    report = update_store(NavStore(store, mode='r+'), read_bulk_file(), holidays)
+    assert (report.appended, report.gaps) == (2, [])
+
+def test_update_cache_prepends_and_is_idempotent(cache):
+    report = update_cache(cache, read_bulk_file())
+    assert (report.appended, report.current, report.gaps) == (1, 1, ['100002'])
+    assert (report.absent, report.unknown) == (1, 1)
+    rows = cache.load('100001')['data']
+    assert rows[0] == {'date': '12-01-2024', 'nav': '25.4321'}
+    assert cache.load('100002')['data'][0]['date'] == '10-01-2024'
+    # The appended and the current entries need no fetch; the one with a gap does
+    assert cache.is_fresh(cache.load('100001')) and cache.is_fresh(cache.load('100004'))
+    assert not cache.is_fresh(cache.load('100002'))
+
+    report = update_cache(cache, read_bulk_file())
+    assert (report.appended, report.current, report.gaps) == (0, 2, ['100002'])
+    assert cache.load('100001')['data'] == rows
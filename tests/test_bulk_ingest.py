@@ -0,0 +1,65 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import numpy
+
+from conftest import ROOT, mfapi_payload
+from bulk_ingest import ingest, CHECKPOINT_FILE
+from nav_store import NavStore, INDEX_FILE
+
+CODES = [str(code) for code in range(120001, 120011)]
+
+def serve_universe(stand_in, delay):
+    scheme_list = json.dumps([{'schemeCode': int(code), 'schemeName': f"Fund {code}"} for code in CODES])
+    stand_in.route('/mf', (200, scheme_list.encode()))
+    for i, code in enumerate(CODES):
+        stand_in.route(f"/mf/{code}", (200, mfapi_payload(code, nav=10.0 + i), delay))
+    return f"{stand_in.url}/mf"
+
+def read_done(checkpoint_path):
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            return set(json.load(f)['done'])
+    except (FileNotFoundError, ValueError):
+        return set()
+
+def test_an_interrupted_ingest_resumes_from_its_checkpoint(stand_in, tmp_path):
+    base_url = serve_universe(stand_in, delay=0.3)
+    store_dir, cache_dir = str(tmp_path / 'store'), str(tmp_path / 'cache')
+    checkpoint_path = os.path.join(store_dir, CHECKPOINT_FILE)
+
+    # Two schemes per batch, one at a time: a checkpoint about every 0.6 s
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'bulk_ingest.py'), store_dir, \
+                                '--base-url', base_url, '--cache-dir', cache_dir, '--max-workers', '1', \
+                                '--batch-size', '2'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while len(read_done(checkpoint_path)) < 4 and time.monotonic() < deadline and process.poll() is None:
+        time.sleep(0.05)
+    process.send_signal(signal.SIGKILL)
+    process.wait()
+
+    done = read_done(checkpoint_path)
+    assert 4 <= len(done) < len(CODES)
+    assert not os.path.exists(os.path.join(store_dir, INDEX_FILE)) or \
+           len(NavStore(store_dir).scheme_codes) < len(CODES)
+    hits_before = {code: stand_in.hits.get(f"/mf/{code}", 0) for code in CODES}
+
+    store = ingest(store_dir, base_url=base_url, cache_directory=cache_dir, max_workers=4, batch_size=2)
+
+    # The schemes finished before the kill are not downloaded again; the others are
+    for code in CODES:
+        fetched_again = stand_in.hits.get(f"/mf/{code}", 0) - hits_before[code]
+        assert fetched_again == (0 if code in done else 1), code
+    assert read_done(checkpoint_path) == set(CODES)
+
+    # The final store holds every scheme, with the NAVs that were served
+    reopened = NavStore(store_dir)
+    assert sorted(reopened.scheme_codes) == CODES == sorted(store.scheme_codes)
+    for i, code in enumerate(CODES):
+        _, navs = reopened.slice([code])
+        first_nav = navs[~numpy.isnan(navs[:, 0]), 0][0]
+        assert abs(first_nav - (10.0 + i)) < 1e-9
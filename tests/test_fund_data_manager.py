@@ -0,0 +1,51 @@
+import logging
+
+import numpy
+import pytest
+
+from plot_mutual_funds import FundDataManager, initialize_loggers
+
+@pytest.fixture(params=[None, 'float64'])
+def fdm(request):
+    """A fresh FundDataManager, keeping its funds in DataFrames or in a CompactNavs."""
+    initialize_loggers()
+    FundDataManager._instance = None
+    fdm = FundDataManager()
+    if request.param is not None:
+        fdm.use_compact_storage(request.param)
+    yield fdm
+    FundDataManager._instance = None
+
+def aligned_navs(fdm, label):
+    """The NAVs of a fund on the dates it has, as {date: NAV}."""
+    if fdm.is_compact():
+        _, dates, navs = next(fund for fund in fdm.compact.funds() if fund[0] == label)
+    else:
+        series = fdm.all_fund_data[label].dropna()
+        dates, navs = series.index.values, series.values
+    return {str(numpy.datetime64(date, 'D')): float(nav) for date, nav in zip(dates, navs)}
+
+def test_repeated_dates_keep_the_last_nav(fdm, caplog):
+    dates = numpy.array(['2024-01-03', '2024-01-01', '2024-01-03', '2024-01-02', '2024-01-01'], \
+                        dtype='datetime64[D]')
+    fdm.add_fund('A', dates, [13.0, 11.0, 13.5, 12.0, 11.5])
+    fdm.add_fund('B', dates[1:4:2], [21.0, 22.0])
+    with caplog.at_level(logging.WARNING):
+        fdm.align_fund_data()
+    assert aligned_navs(fdm, 'A') == {'2024-01-01': 11.5, '2024-01-02': 12.0, '2024-01-03': 13.5}
+    assert aligned_navs(fdm, 'B') == {'2024-01-01': 21.0, '2024-01-02': 22.0}
+    assert [record.getMessage() for record in caplog.records] == \
+           ["A: 2 repeated date(s); keeping the last NAV given for each"]
+
+def test_a_label_can_only_be_added_once(fdm):
+    dates = numpy.array(['2024-01-01', '2024-01-02'], dtype='datetime64[D]')
+    fdm.add_funds([('A', dates, [1.0, 2.0]), ('B', dates, [3.0, 4.0])])
+    with pytest.raises(ValueError, match="'A' has already been added"):
+        fdm.add_fund('A', dates, [5.0, 6.0])
+    fdm.align_fund_data()
+    # Also once the funds are aligned
+    with pytest.raises(ValueError, match="'B' has already been added"):
+        fdm.add_funds([('C', dates, [7.0, 8.0]), ('B', dates, [9.0, 10.0])])
+    fdm.align_fund_data()
+    assert aligned_navs(fdm, 'A') == {'2024-01-01': 1.0, '2024-01-02': 2.0}
+    assert aligned_navs(fdm, 'C') == {'2024-01-01': 7.0, '2024-01-02': 8.0}
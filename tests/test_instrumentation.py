@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from instrumentation import Histogram, Instrumentation, BUCKET_BOUNDS
+
+def test_quantiles_are_interpolated_within_their_buckets():
+    histogram = Histogram()
+    assert histogram.quantile(0.5) is None
+    # Three observations in the bucket that ends at BUCKET_BOUNDS[20] and one in the bucket of [30]
+    low, high = BUCKET_BOUNDS[19], BUCKET_BOUNDS[20]
+    for seconds in (low * 1.001, (low + high) / 2, high * 0.999, BUCKET_BOUNDS[30] * 0.999):
+        histogram.observe(seconds)
+    # The median is two thirds of the way through the first bucket
+    assert histogram.quantile(0.5) == pytest.approx(low + (high - low) * 2 / 3)
+    # The 99th percentile is at 0.96 of an observation into the last bucket
+    low, high = BUCKET_BOUNDS[29], BUCKET_BOUNDS[30]
+    assert histogram.quantile(0.99) == pytest.approx(low + (high - low) * 0.96)
+    # The estimates never leave the observed range
+    assert histogram.quantile(0.0) == BUCKET_BOUNDS[19] * 1.001
+    assert histogram.quantile(1.0) == BUCKET_BOUNDS[30] * 0.999
+
+def test_latencies_beyond_the_buckets_go_to_the_overflow_bucket():
+    histogram = Histogram()
+    histogram.observe(BUCKET_BOUNDS[-1] * 2)
+    assert histogram.counts[-1] == 1
+    assert histogram.quantile(0.5) == BUCKET_BOUNDS[-1] * 2
+    assert histogram.to_dict()['buckets'] == [[None, 1]]
+
+def test_prometheus_output():
+    instruments = Instrumentation('timings.prom', started=10.0)
+    instruments.record_span('figure', 11.0, 11.5)
+    instruments.wrap('on_key', lambda event: None)
+    for seconds in (BUCKET_BOUNDS[3], BUCKET_BOUNDS[5] * 0.99):
+        instruments.handlers['on_key'].observe(seconds)
+    lines = instruments.to_prometheus().splitlines()
+
+    assert 'plot_stage_seconds{stage="figure"} 0.5' in lines
+    buckets = [line for line in lines if line.startswith('plot_handler_seconds_bucket{handler="on_key"')]
+    assert len(buckets) == len(BUCKET_BOUNDS) + 1
+    # An observation on a bound is counted in that bound's bucket, and the counts are cumulative
+    assert buckets[2].endswith(' 0') and buckets[3].endswith(' 1') and buckets[4].endswith(' 1')
+    assert buckets[5] == f'plot_handler_seconds_bucket{{handler="on_key",le="{BUCKET_BOUNDS[5]:.6g}"}} 2'
+    assert buckets[-1] == 'plot_handler_seconds_bucket{handler="on_key",le="+Inf"} 2'
+    assert f'plot_handler_seconds_sum{{handler="on_key"}} {BUCKET_BOUNDS[3] + BUCKET_BOUNDS[5] * 0.99!r}' \
+           in lines
+    assert 'plot_handler_seconds_count{handler="on_key"} 2' in lines
+    assert 'plot_handler_frame_seconds_count{handler="on_key"} 0' in lines
+    assert 'plot_draw_seconds_count 0' in lines
+    assert lines.count('# TYPE plot_handler_seconds histogram') == 1
+
+def test_dump_writes_json_or_prometheus(tmp_path):
+    instruments = Instrumentation(str(tmp_path / 'timings.json'), started=10.0)
+    instruments.record_span('first_draw', 10.0, 12.0)
+    with open(instruments.dump(), encoding='utf-8') as f:
+        assert json.load(f)['spans'] == [{'name': 'first_draw', 'start': 0.0, 'seconds': 2.0}]
+    with open(instruments.dump(str(tmp_path / 'timings.prom')), encoding='utf-8') as f:
+        assert 'plot_stage_seconds{stage="first_draw"} 2.0\n' in f.read()
+    assert Instrumentation().dump(str(tmp_path / 'off.json')) is None
@@ -0,0 +1,65 @@
+import json
+import logging
+
+from conftest import mfapi_payload
+from nav_cache import NavCache
+from nav_fetcher import NavFetcher
+
+def fetch(cache, urls):
+    with NavFetcher(timeout=5, retries=0) as fetcher:
+        return cache.fetch_all(urls, [f"fund {i}" for i in range(len(urls))], fetcher)
+
+def test_not_modified_reuses_the_entry_as_a_hit(stand_in, tmp_path):
+    body = mfapi_payload(101)
+    url = stand_in.route('/mf/101', (200, body, 0.0, {'ETag': '"v1"'}), (304, b'', 0.0, {'ETag': '"v1"'}))
+    # With a max age of 0 every entry has to be revalidated
+    cache = NavCache(str(tmp_path), max_age=0)
+    [payload] = fetch(cache, [url])
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cache.load('101')['etag'] == '"v1"'
+
+    cache = NavCache(str(tmp_path), max_age=0)
+    [revalidated] = fetch(cache, [url])
+    assert stand_in.request_headers['/mf/101'][1]['If-None-Match'] == '"v1"'
+    assert (cache.hits, cache.misses, cache.bytes_saved) == (1, 0, len(body))
+    assert revalidated['data'] == payload['data'] == json.loads(body)['data']
+    # The revalidation makes the entry fresh again
+    assert NavCache(str(tmp_path)).is_fresh(cache.load('101'))
+
+def test_a_changed_history_merges_only_the_newer_rows(stand_in, tmp_path):
+    url = stand_in.route('/mf/102', (200, mfapi_payload(102, days=10), 0.0, {'ETag': '"v1"'}), \
+                         (200, mfapi_payload(102, days=17, nav=50.0), 0.0, {'ETag': '"v2"'}))
+    fetch(NavCache(str(tmp_path), max_age=0), [url])
+    cached_rows = NavCache(str(tmp_path)).load('102')['data']
+
+    cache = NavCache(str(tmp_path), max_age=0)
+    [payload] = fetch(cache, [url])
+    # 11 to 17 January has five weekdays; the server's older rows do not replace the cached ones
+    assert [row['date'] for row in payload['data'][:5]] == \
+           ['17-01-2024', '16-01-2024', '15-01-2024', '12-01-2024', '11-01-2024']
+    assert payload['data'][0]['nav'] == '50.16000'
+    assert payload['data'][5:] == cached_rows
+    assert cache.load('102') == payload and payload['etag'] == '"v2"'
+    assert (cache.hits, cache.misses) == (0, 1)
+
+def test_offline_without_an_entry_is_a_miss(stand_in, tmp_path, caplog):
+    url = stand_in.route('/mf/103', (200, mfapi_payload(103)))
+    cache = NavCache(str(tmp_path), offline=True)
+    with caplog.at_level(logging.WARNING, logger='nav_cache'):
+        assert fetch(cache, [url]) == [None]
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert stand_in.hits == {}
+    assert "Offline, and no cached data for fund 0" in caplog.text
+
+def test_an_unreadable_entry_is_fetched_again(stand_in, tmp_path, caplog):
+    url = stand_in.route('/mf/104', (200, mfapi_payload(104), 0.0, {'ETag': '"v1"'}))
+    cache = NavCache(str(tmp_path))
+    with open(cache.path_for('104'), 'w', encoding='utf-8') as f:
+        f.write('{"meta": {"scheme_code": 104}, "data": [')   # Cut short
+    with caplog.at_level(logging.WARNING, logger='nav_cache'):
+        [payload] = fetch(cache, [url])
+    assert "Ignoring unreadable cache entry for scheme 104" in caplog.text
+    # The request was not conditional, and the entry was replaced
+    assert 'If-None-Match' not in stand_in.request_headers['/mf/104'][0]
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cache.load('104') == payload and len(payload['data']) > 0
@@ -0,0 +1,71 @@
+import logging
+import time
+
+from conftest import mfapi_payload
+from nav_fetcher import NavFetcher
+from nav_parser import parse_nav_payload
+
+def test_fetches_run_concurrently(stand_in):
+    urls = [stand_in.route(f"/mf/{code}", (200, mfapi_payload(code), 0.5)) for code in range(100, 108)]
+    started = time.perf_counter()
+    with NavFetcher(max_workers=8, timeout=5, retries=0) as fetcher:
+        results = fetcher.fetch_all(urls)
+    elapsed = time.perf_counter() - started
+    assert all(result.ok for result in results)
+    assert stand_in.max_in_flight == 8
+    # Near the slowest response, not the sum of the eight (4 s)
+    assert elapsed < 1.5
+    meta, dates, navs = parse_nav_payload(results[3].content)
+    assert meta['scheme_code'] == 103 and len(dates) == len(navs) > 0
+
+def test_results_keep_the_order_of_the_urls(stand_in):
+    urls = [stand_in.route(f"/mf/{code}", (200, mfapi_payload(code), 0.05 * (8 - code))) for code in range(8)]
+    with NavFetcher(max_workers=8, timeout=5, retries=0) as fetcher:
+        results = fetcher.fetch_all(urls, labels=[f"fund {code}" for code in range(8)])
+    assert [result.label for result in results] == [f"fund {code}" for code in range(8)]
+    assert [result.json()['meta']['scheme_code'] for result in results] == list(range(8))
+
+def test_429_and_503_are_retried_with_backoff(stand_in):
+    url = stand_in.route('/mf/1', (429, b''), (503, b''), (200, mfapi_payload(1)))
+    with NavFetcher(timeout=5, retries=3, backoff=0.1) as fetcher:
+        result = fetcher.fetch_one(url)
+    assert result.ok
+    assert result.attempts == 3
+    assert stand_in.hits['/mf/1'] == 3
+    # Waits of 0.1 s and then 0.2 s before the two retries
+    assert result.elapsed >= 0.3
+
+def test_retries_give_up_with_the_last_error(stand_in):
+    url = stand_in.route('/mf/1', (503, b''))
+    with NavFetcher(timeout=5, retries=2, backoff=0.01) as fetcher:
+        result = fetcher.fetch_one(url)
+    assert not result.ok
+    assert result.status_code == 503 and result.error == 'HTTP 503'
+    assert result.attempts == 3 and stand_in.hits['/mf/1'] == 3
+
+def test_client_errors_are_not_retried(stand_in):
+    url = stand_in.route('/mf/1', (404, b''))
+    with NavFetcher(timeout=5, retries=3, backoff=0.01) as fetcher:
+        result = fetcher.fetch_one(url)
+    assert result.error == 'HTTP 404' and result.attempts == 1
+
+def test_timeouts_are_honoured(stand_in):
+    url = stand_in.route('/mf/1', (200, mfapi_payload(1), 3.0))
+    started = time.perf_counter()
+    with NavFetcher(timeout=0.3, retries=1, backoff=0.05) as fetcher:
+        result = fetcher.fetch_one(url)
+    assert not result.ok
+    assert result.status_code is None and 'Timeout' in result.error
+    assert result.attempts == 2
+    assert time.perf_counter() - started < 2.0
+
+def test_success_and_failure_are_reported_per_fund(stand_in, caplog):
+    urls = [stand_in.route('/mf/1', (200, mfapi_payload(1))), stand_in.route('/mf/2', (500, b'')), \
+            stand_in.route('/mf/3', (200, mfapi_payload(3)))]
+    with caplog.at_level(logging.INFO, logger='nav_fetcher'):
+        with NavFetcher(timeout=5, retries=1, backoff=0.01) as fetcher:
+            results = fetcher.fetch_all(urls, labels=['one', 'two', 'three'])
+    assert [result.ok for result in results] == [True, False, True]
+    assert results[1].error == 'HTTP 500' and results[1].attempts == 2
+    assert "Failed to fetch two" in caplog.text
+    assert "Fetched 2 of 3 funds" in caplog.text
@@ -0,0 +1,45 @@
+import numpy
+import pytest
+
+from nav_parser import parse_nav_rows, parse_nav_payload, NavParseError
+
+def rows(*pairs):
+    return [{'date': date, 'nav': nav} for date, nav in pairs]
+
+def test_rows_are_parsed_and_sorted_by_date():
+    dates, navs = parse_nav_rows(rows(('14-06-2024', '21.14409'), ('29-02-2024', '20.5'), ('02-01-2023', '18')))
+    numpy.testing.assert_array_equal(dates, numpy.array(['2023-01-02', '2024-02-29', '2024-06-14'], \
+                                                        dtype='datetime64[D]'))
+    numpy.testing.assert_array_equal(navs, [18.0, 20.5, 21.14409])
+
+def test_an_empty_history_is_parsed():
+    _, dates, navs = parse_nav_payload(b'{"meta": {}, "data": []}')
+    assert len(dates) == len(navs) == 0
+
+@pytest.mark.parametrize('bad_rows, row', [
+    # A short row and a long one that together have the width of two dates
+    (rows(('01-01-202', '1'), ('401-01-2024', '2')), 0),
+    (rows(('01-01-2024', '1'), ('1-01-2024', '2')), 1),
+    (rows(('01-01-2024', '1'), (20240101, '2')), 1),
+    (rows(('01-01-2024', '1'), ('01-0a-2024', '2')), 1),
+    (rows(('01-01-2024', '1'), ('01/01/2024', '2')), 1),
+    (rows(('01-01-2024', '1'), ('30-02-2024', '2')), 1),
+    (rows(('01-01-2024', '1'), ('00-01-2024', '2')), 1),
+    (rows(('01-01-2024', '1'), ('01-13-2024', '2')), 1),
+])
+def test_malformed_dates_are_rejected(bad_rows, row):
+    with pytest.raises(NavParseError, match=f"Malformed date in row {row}"):
+        parse_nav_rows(bad_rows)
+
+@pytest.mark.parametrize('nav', ['0', '0.00000', '-1.5', 'N.A.', 'nan', 'inf', ''])
+def test_navs_that_are_not_positive_numbers_are_rejected(nav):
+    with pytest.raises(NavParseError, match="Malformed NAV in row 1"):
+        parse_nav_rows(rows(('01-01-2024', '1'), ('02-01-2024', nav)))
+
+def test_duplicate_dates_are_rejected():
+    with pytest.raises(NavParseError, match="Rows 0 and 2 have the same date"):
+        parse_nav_rows(rows(('03-01-2024', '1'), ('02-01-2024', '2'), ('03-01-2024', '3')))
+
+def test_a_row_without_a_nav_is_rejected():
+    with pytest.raises(NavParseError, match="Row 1 lacks a date or a NAV"):
+        parse_nav_rows([{'date': '01-01-2024', 'nav': '1'}, {'date': '02-01-2024'}])
@@ -0,0 +1,155 @@
+import argparse
+import asyncio
+import http.client
+import json
+import threading
+
+import numpy
+import pytest
+
+import plot_mutual_funds
+from nav_parser import parse_nav_payload
+from nav_server import NavServer, ResponseCache, load_funds
+from nav_store import NavStore
+
+CODES = ['100001', '100002']
+
+def history(code):
+    """A NAV on every weekday of the first quarter of 2024; the second fund starts in February."""
+    dates = numpy.arange(numpy.datetime64('2024-01-01'), numpy.datetime64('2024-04-01'))
+    dates = dates[numpy.is_busday(dates)]
+    if code == '100002':
+        dates = dates[dates >= numpy.datetime64('2024-02-01')]
+    return dates, (10.0 if code == '100001' else 20.0) + numpy.arange(len(dates)) * 0.01
+
+class RunningServer:
+    """Runs a NavServer on a free port in a thread with its own event loop."""
+    def __init__(self, server):
+        self.server = server
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            bound = self.loop.create_future()
+            self.task = self.loop.create_task(server.serve('127.0.0.1', 0, bound))
+            self.port = self.loop.run_until_complete(bound)
+            started.set()
+            try:
+                self.loop.run_until_complete(self.task)
+            except asyncio.CancelledError:
+                pass
+            # Let the connections that are still open see the server go away
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait(10)
+
+    def get(self, path, etag=None):
+        """Returns (status, headers, decoded JSON body or None)."""
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        connection.request('GET', path, headers={} if etag is None else {'If-None-Match': etag})
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+        return response.status, dict(response.getheaders()), json.loads(body) if body else None
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join(10)
+
+@pytest.fixture
+def served_funds(tmp_path):
+    NavStore.build(str(tmp_path / 'store'), [(code, f"Fund {code}", *history(code)) for code in CODES])
+    plot_mutual_funds.FundDataManager._instance = None
+    funds = load_funds([f"https://api.mfapi.in/mf/{code}" for code in CODES], ['A', 'B'], \
+                       argparse.Namespace(store=str(tmp_path / 'store')))
+    yield funds
+    plot_mutual_funds.FundDataManager._instance = None
+
+@pytest.fixture
+def server(served_funds):
+    running = RunningServer(NavServer(served_funds, ResponseCache(1024 * 1024)))
+    yield running
+    running.close()
+
+def test_series_are_normalized_over_the_range(server):
+    status, headers, body = server.get('/series?codes=100001,100002&start=2024-02-01&end=29-02-2024' \
+                                       '&norm=2024-02-05')
+    assert status == 200 and 'ETag' in headers
+    assert (body['start'], body['end'], body['norm_date']) == ('2024-02-01', '2024-02-29', '2024-02-05')
+    assert len(body['dates']) == 29
+    for code in CODES:
+        series = body['series'][code]
+        assert len(series) == 29 and series[body['dates'].index('2024-02-05')] == 100.0
+    # Weekends repeat Friday's NAV
+    a = body['series']['100001']
+    assert a[body['dates'].index('2024-02-03')] == a[body['dates'].index('2024-02-02')]
+
+def test_nav_is_the_last_nav_on_or_before_the_date(server):
+    dates, navs = history('100001')
+    status, _, body = server.get('/nav?code=100001&date=2024-03-02')   # A Saturday
+    assert status == 200
+    assert body == {'scheme_code': '100001', 'date': '2024-03-02', \
+                    'nav': pytest.approx(navs[dates == numpy.datetime64('2024-03-01')][0])}
+
+def test_mf_has_the_shape_of_mfapi(server):
+    status, _, body = server.get('/mf/100002')
+    assert status == 200
+    _, dates, navs = parse_nav_payload(body)
+    expected_dates, expected_navs = history('100002')
+    numpy.testing.assert_array_equal(dates, expected_dates)
+    numpy.testing.assert_allclose(navs, expected_navs)
+    assert body['data'][0]['date'] == '29-03-2024'   # Newest first
+
+def test_revalidation_of_a_resource_is_not_modified(server):
+    _, headers, _ = server.get('/meta')
+    status, revalidated, body = server.get('/meta', headers['ETag'])
+    assert (status, body, revalidated['ETag']) == (304, None, headers['ETag'])
+    # Each resource has its own tag
+    _, series_headers, _ = server.get('/series?codes=100001')
+    assert series_headers['ETag'] != headers['ETag']
+    assert server.get('/series?codes=100002', series_headers['ETag'])[0] == 200
+
+def test_errors_are_checked_before_revalidation(server):
+    _, headers, _ = server.get('/meta')
+    status, error_headers, body = server.get('/series?codes=nonexistent', headers['ETag'])
+    assert status == 404 and 'ETag' not in error_headers and 'nonexistent' in body['error']
+    assert server.get('/nav?code=100001&date=yesterday', headers['ETag'])[0] == 400
+    assert server.get('/mf/999', headers['ETag'])[0] == 404
+    assert server.get('/nowhere', headers['ETag'])[0] == 404
+
+def test_the_response_cache_evicts_the_least_recently_used(served_funds):
+    # Room for all three responses but one byte
+    room = len(served_funds.mf_body('100001')) + len(served_funds.mf_body('100002')) + \
+           len(served_funds.meta_body()) - 1
+    running = RunningServer(NavServer(served_funds, ResponseCache(room)))
+    try:
+        for path in ['/mf/100001', '/mf/100002', '/mf/100001', '/meta']:
+            assert running.get(path)[0] == 200
+        stats = running.get('/stats')[2]['cache']
+        assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 3, 1)
+        # /mf/100002 was the least recently used, and was evicted
+        assert set(running.server.cache.bodies) == {('mf', '100001'), ('meta',)}
+    finally:
+        running.close()
+
+def test_concurrent_requests_share_one_build(served_funds):
+    server = NavServer(served_funds, ResponseCache(1024 * 1024))
+    builds = []
+
+    def build():
+        builds.append(1)
+        threading.Event().wait(0.2)
+        return b'body'
+
+    async def ask_many():
+        return await asyncio.gather(*[server.cached(('slow',), build) for _ in range(5)])
+
+    assert asyncio.run(ask_many()) == [b'body'] * 5
+    assert len(builds) == 1
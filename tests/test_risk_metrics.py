@@ -0,0 +1,42 @@
+import numpy
+
+from portfolio_backtest import PortfolioSpec, backtest_portfolio
+from risk_metrics import RiskMetrics
+
+def calendar_and_business_days():
+    """Returns forward-filled calendar-daily NAVs of two funds, and the same on the weekdays only."""
+    rng = numpy.random.default_rng(0)
+    dates = numpy.arange(numpy.datetime64('2020-01-01'), numpy.datetime64('2023-12-31') + 1)
+    business = numpy.flatnonzero(numpy.is_busday(dates))
+    navs = numpy.full((len(dates), 2), numpy.nan)
+    navs[business] = 10.0 * numpy.cumprod(1.0 + rng.normal(0.0004, 0.01, (len(business), 2)), axis=0)
+    navs[:business[300], 1] = numpy.nan   # The second fund starts later
+    for row in range(1, len(dates)):
+        missing = numpy.isnan(navs[row]) & ~numpy.isnan(navs[row - 1])
+        navs[row, missing] = navs[row - 1, missing]
+    return (dates, navs), (dates[business], navs[business])
+
+def test_business_day_rows_give_the_calendar_daily_table():
+    (dates, navs), (business_dates, business_navs) = calendar_and_business_days()
+    daily = RiskMetrics(dates, navs, ['a', 'b'])
+    business = RiskMetrics(business_dates, business_navs, ['a', 'b'])
+    # A window from a Monday to a Friday, so that both start and end on the same dates
+    first, last = numpy.datetime64('2020-06-01'), numpy.datetime64('2023-06-30')
+    expected = daily.table(int((first - dates[0]).astype(int)), int((last - dates[0]).astype(int)))
+    table = business.table(int(numpy.searchsorted(business_dates, first)), \
+                           int(numpy.searchsorted(business_dates, last)))
+    numpy.testing.assert_allclose(table['annual_return'], expected['annual_return'])
+    numpy.testing.assert_allclose(table['volatility'], expected['volatility'])
+    numpy.testing.assert_allclose(table['max_drawdown'], expected['max_drawdown'])
+    assert (table['trough_date'] == expected['trough_date']).all()
+    numpy.testing.assert_array_equal(table['recovery_days'], expected['recovery_days'])
+
+def test_business_day_backtest_gives_the_calendar_daily_values():
+    (dates, navs), (business_dates, business_navs) = calendar_and_business_days()
+    spec = PortfolioSpec('p', {'a': 0.5, 'b': 0.5}, 'quarterly', None, 0.001)
+    values, rebalances, paid = backtest_portfolio(dates, navs, {'a': 0, 'b': 1}, spec)
+    business_values, business_rebalances, business_paid = \
+        backtest_portfolio(business_dates, business_navs, {'a': 0, 'b': 1}, spec)
+    numpy.testing.assert_allclose(business_values, values[numpy.is_busday(dates)])
+    numpy.testing.assert_array_equal(business_dates[business_rebalances], dates[rebalances])
+    assert abs(business_paid - paid) < 1e-12
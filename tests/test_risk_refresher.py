@@ -0,0 +1,60 @@
+import time
+
+from plot_mutual_funds import RiskRefresher
+
+class FakeTimer:
+    """A single-shot timer that fires only when the test says so."""
+    def __init__(self):
+        self.callbacks = []
+        self.interval = None
+        self.started = False
+        self.single_shot = False
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def start(self):
+        self.started = True
+
+    def fire(self):
+        self.started = False
+        for callback in self.callbacks:
+            callback()
+
+class FakeCanvas:
+    def __init__(self):
+        self.timer = FakeTimer()
+
+    def new_timer(self):
+        return self.timer
+
+def test_first_request_refreshes_at_once():
+    refreshes = []
+    refresher = RiskRefresher(FakeCanvas(), lambda: refreshes.append(1), interval=10.0)
+    refresher.request()
+    assert refreshes == [1]
+
+def test_requests_within_the_interval_give_one_refresh_at_its_end():
+    canvas = FakeCanvas()
+    refreshes = []
+    refresher = RiskRefresher(canvas, lambda: refreshes.append(1), interval=10.0)
+    refresher.request()
+    for _ in range(20):
+        refresher.request()
+    assert len(refreshes) == 1
+    assert canvas.timer.started and 9000 <= canvas.timer.interval <= 10000
+    canvas.timer.fire()
+    assert len(refreshes) == 2
+    # Nothing was requested since
+    canvas.timer.fire()
+    assert len(refreshes) == 2
+
+def test_requests_after_the_interval_refresh_at_once():
+    canvas = FakeCanvas()
+    refreshes = []
+    refresher = RiskRefresher(canvas, lambda: refreshes.append(1), interval=0.05)
+    refresher.request()
+    time.sleep(0.06)
+    refresher.request()
+    assert len(refreshes) == 2
+    assert not canvas.timer.started
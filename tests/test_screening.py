@@ -0,0 +1,108 @@
+import operator
+import os
+
+import numpy
+import pytest
+
+from nav_store import NavStore
+from screening import parse_query, open_metric_table, MetricTable, QueryError, METRICS_FILE
+
+def test_parse_query():
+    query = parse_query("rolling_3y_median > 14% and name contains 'Flexi' order by sortino desc limit 20")
+    assert query.conditions == [('rolling_3y_median', '>', 0.14)]
+    assert query.name_filters == ['flexi']
+    assert (query.order_by, query.descending, query.limit) == ('sortino', True, 20)
+
+@pytest.mark.parametrize('limit', ['1.5', '10%', '-3', '1e2', '2.'])
+def test_limit_must_be_a_whole_number(limit):
+    with pytest.raises(QueryError, match="whole number"):
+        parse_query(f"sharpe > 1 limit {limit}")
+
+def test_limit_needs_a_number():
+    with pytest.raises(QueryError, match="a number of funds"):
+        parse_query("sharpe > 1 limit")
+
+NAN = numpy.nan
+OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '=': operator.eq}
+
+def hand_built_table():
+    """Six funds with distinct metrics, two of them missing a value."""
+    return MetricTable(['1', '2', '3', '4', '5', '6'], \
+                       ['Alpha Flexi Cap', 'Beta Large Cap', 'Gamma Flexi Cap', 'Delta Mid Cap', \
+                        'Epsilon Flexi Cap', 'Zeta Small Cap'], \
+                       {'sharpe': numpy.array([1.2, NAN, 0.4, 2.0, 0.9, NAN]), \
+                        'max_drawdown': numpy.array([0.30, 0.10, 0.25, 0.40, NAN, 0.20])})
+
+def brute_force(table, query):
+    """Screens the funds one at a time, as the query reads."""
+    query = parse_query(query)
+    columns = [column for column in range(len(table.scheme_codes)) \
+               if all(OPERATORS[operator](table.metrics[metric][column], value) \
+                      for metric, operator, value in query.conditions) \
+               and all(text in table.names[column].lower() for text in query.name_filters)]
+    if query.order_by is not None:
+        values = table.metrics[query.order_by]
+        valid = [column for column in columns if not numpy.isnan(values[column])]
+        valid.sort(key=lambda column: values[column], reverse=query.descending)
+        columns = valid + [column for column in columns if numpy.isnan(values[column])]
+    return columns if query.limit is None else columns[:query.limit]
+
+@pytest.mark.parametrize('query', [
+    "sharpe > 0.9", "sharpe >= 0.9", "sharpe < 1.2", "sharpe <= 1.2", "sharpe = 0.4", "sharpe > 5",
+    "sharpe > 0.5 and max_drawdown < 35%",
+    "name contains 'flexi'",
+    "name contains 'FLEXI' and sharpe >= 0.4",
+    "max_drawdown <= 30% order by sharpe",
+    "max_drawdown <= 30% order by sharpe desc",
+    "name contains 'cap' order by max_drawdown asc limit 3",
+    "name contains 'cap' order by sharpe desc limit 4",
+    "name contains 'cap' limit 2",
+    "sharpe > 0 limit 0",
+])
+def test_screen_matches_a_brute_force_filter(query):
+    table = hand_built_table()
+    assert list(table.screen(query)) == brute_force(table, query)
+
+def test_missing_metrics_fail_conditions_and_sort_last():
+    table = hand_built_table()
+    assert list(table.matching('sharpe', '>', -1.0)) == [2, 4, 0, 3]
+    assert list(table.matching('sharpe', '<', 10.0)) == [2, 4, 0, 3]
+    for descending in ('asc', 'desc'):
+        assert set(table.screen(f"order by sharpe {descending}")[-2:]) == {1, 5}
+
+def test_unknown_metric_is_an_error():
+    with pytest.raises(QueryError, match="Unknown metric 'alpha'"):
+        hand_built_table().screen("alpha > 1")
+    with pytest.raises(QueryError, match="Unknown metric 'alpha'"):
+        hand_built_table().screen("sharpe > 1 order by alpha")
+
+def fund_history(code, growth):
+    dates = numpy.arange(numpy.datetime64('2019-01-01'), numpy.datetime64('2024-01-01'))
+    return code, f"Fund {code}", dates, 10.0 * growth ** numpy.arange(len(dates))
+
+def test_metric_table_is_cached_until_the_store_changes(tmp_path, monkeypatch):
+    directory = str(tmp_path / 'store')
+    NavStore.build(directory, [fund_history('100001', 1.0003), fund_history('100002', 1.0002)])
+    builds = []
+    build = MetricTable.build.__func__
+    monkeypatch.setattr(MetricTable, 'build', \
+                        classmethod(lambda cls, *args: builds.append(1) or build(cls, *args)))
+
+    table = open_metric_table(NavStore(directory))
+    assert os.path.exists(os.path.join(directory, METRICS_FILE)) and len(builds) == 1
+    cached = open_metric_table(NavStore(directory))
+    assert len(builds) == 1
+    numpy.testing.assert_array_equal(cached.metrics['sharpe'], table.metrics['sharpe'])
+    assert list(cached.screen("order by annual_return desc")) == [0, 1]
+
+    open_metric_table(NavStore(directory), rebuild=True)
+    assert len(builds) == 2
+    open_metric_table(NavStore(directory), hurdle=0.2)
+    assert len(builds) == 3
+
+    # Another store in the same directory has another key
+    NavStore.build(directory, [fund_history('100001', 1.0001), fund_history('100002', 1.0002), \
+                               fund_history('100003', 1.0004)])
+    table = open_metric_table(NavStore(directory))
+    assert len(builds) == 4 and list(table.scheme_codes) == ['100001', '100002', '100003']
+    assert list(table.screen("order by annual_return desc")) == [2, 1, 0]
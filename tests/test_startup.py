@@ -0,0 +1,49 @@
+import logging
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+IMPORT_BUDGET = 0.6    # Seconds for importing plot_mutual_funds, as bench_startup.py measures it
+IMPORT_RUNS = 3        # The fastest of these runs is compared with the budget
+GUI_MODULES = ('matplotlib.pyplot', 'matplotlib.widgets')
+
+def run_python(args):
+    result = subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-2000:]
+    return result
+
+def test_import_is_fast_and_leaves_out_the_gui():
+    code = "import sys, time\nstarted = time.perf_counter()\nimport plot_mutual_funds\n" \
+           "print(time.perf_counter() - started)\n" \
+           f"print(','.join(m for m in {GUI_MODULES!r} if m in sys.modules))"
+    runs = [run_python(['-c', code]).stdout.split('\n') for _ in range(IMPORT_RUNS)]
+    assert all(imported == '' for _, imported, *_ in runs)
+    assert min(float(seconds) for seconds, *_ in runs) < IMPORT_BUDGET
+
+def test_help_leaves_out_the_gui():
+    # -X importtime lists every module the script imports
+    result = run_python(['-X', 'importtime', os.path.join(ROOT, 'plot_mutual_funds.py'), '--help'])
+    assert 'usage:' in result.stdout
+    imported = {line.rsplit('|', 1)[-1].strip() for line in result.stderr.splitlines() \
+                if line.startswith('import time:')}
+    assert 'numpy' in imported
+    assert not set(GUI_MODULES) & imported
+
+def test_first_frame_is_recorded_as_a_span(monkeypatch):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    import plot_mutual_funds
+    from instrumentation import Instrumentation
+
+    monkeypatch.setattr(plot_mutual_funds, 'instruments', Instrumentation(enabled=True))
+    monkeypatch.setattr(plot_mutual_funds, 'logger', logging.getLogger('plot_mutual_funds'))
+    startup = plot_mutual_funds.StartupTimer(started=0.0)
+    canvas = FigureCanvasAgg(Figure())
+    startup.watch_first_draw(canvas)
+    canvas.draw()
+    canvas.draw()   # Only the first frame counts
+    spans = plot_mutual_funds.instruments.spans
+    assert [(name, start) for name, start, _ in spans] == [('first_draw', 0.0)]
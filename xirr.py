@@ -0,0 +1,164 @@
+##
+##  XIRR (the internal rate of return of irregularly timed cash flows) of many sets of cash
+##  flows at once
+##
+##  The XIRR of cash flows a_i at times t_i (in years after the first flow) is the annual rate
+##  r at which their present value is zero:
+##
+##      sum_i a_i (1 + r)^(-t_i) = 0
+##
+##  With x = log(1 + r) this is f(x) = sum_i a_i exp(-t_i x) = 0, and every x gives a rate above
+##  -100%. All the sets of cash flows are solved together: each iteration is a handful of array
+##  operations over the sets that have not converged yet, instead of one root-finding loop per
+##  set.
+##
+##  Each set is first bracketed: if f has opposite signs at the lowest and the highest rate
+##  allowed, a root lies between them. A Newton step is taken wherever it stays inside the
+##  bracket and is at most half as long as the step before, and the bracket is bisected
+##  everywhere else, so a bracketed set always converges, while most sets still need only a
+##  few Newton steps. Sets without a bracket get plain Newton steps and may fail to converge;
+##  every result comes with a flag that says whether it converged.
+##
+##  The flows can be given as a dense array, one set per row (padded with zero amounts), or, for
+##  sets of very different lengths such as the holdings and the whole of a ledger, as flat
+##  arrays with a set number for every flow.
+##
+
+import numpy
+
+DAYS_PER_YEAR = 365.0
+DEFAULT_GUESS = 0.1                # A 10% annual rate
+DEFAULT_TOLERANCE = 1e-10          # On log(1 + rate)
+DEFAULT_MAX_ITERATIONS = 100
+MAX_LOG_RATE = 10.0                # Keeps exp() finite; rates from -99.995% to about 2,200,000%
+
+def years_between(dates, start_dates):
+    """Returns the years from `start_dates` to `dates` (both datetime64, broadcastable)."""
+    return (dates - start_dates).astype('timedelta64[D]').astype(numpy.float64) / DAYS_PER_YEAR
+
+def solve(evaluate, solvable, guess, tolerance, max_iterations):
+    """
+    Finds a root of the present-value function of every set, in log-rate space.
+
+    Parameters:
+    evaluate (function): evaluate(x, sets) returns the present values and their derivatives
+    for the sets numbered `sets` at the log rates `x`.
+    solvable (numpy bool array): The sets that have both an outflow and an inflow.
+
+    Returns:
+    tuple: (log rates, converged)
+    """
+    n_sets = len(solvable)
+    log_rates = numpy.full(n_sets, numpy.log1p(guess))
+    converged = numpy.zeros(n_sets, dtype=bool)
+    active = numpy.flatnonzero(solvable)
+
+    lows = numpy.full(n_sets, -MAX_LOG_RATE)
+    highs = numpy.full(n_sets, MAX_LOG_RATE)
+    low_values, _ = evaluate(lows[active], active)
+    high_values, _ = evaluate(highs[active], active)
+    bracketed = numpy.zeros(n_sets, dtype=bool)
+    bracketed[active] = numpy.sign(low_values) * numpy.sign(high_values) < 0
+    low_signs = numpy.zeros(n_sets)
+    low_signs[active] = numpy.sign(low_values)
+    last_steps = highs - lows
+
+    for _ in range(max_iterations):
+        if len(active) == 0:
+            break
+        x = log_rates[active]
+        value, slope = evaluate(x, active)
+        low, high, in_bracket = lows[active], highs[active], bracketed[active]
+
+        # Narrow each bracket to the side of x on which the root lies
+        same_sign_as_low = numpy.sign(value) == low_signs[active]
+        low = numpy.where(in_bracket & same_sign_as_low, x, low)
+        high = numpy.where(in_bracket & ~same_sign_as_low, x, high)
+        lows[active], highs[active] = low, high
+
+        step = value / slope
+        newton = x - step
+        # A step smaller than the tolerance is taken even if rounding puts it past the bracket.
+        # Otherwise the bracket is bisected where Newton's method would leave it, or where it
+        # is creeping along a flat stretch (its step is not even half of the step before).
+        close = numpy.abs(step) < tolerance
+        bisect = in_bracket & ~close & (~numpy.isfinite(newton) | (newton <= low) | (newton >= high) | \
+                                        (numpy.abs(step) > 0.5 * last_steps[active]))
+        new_x = numpy.where(bisect, 0.5 * (low + high), numpy.clip(newton, -MAX_LOG_RATE, MAX_LOG_RATE))
+        log_rates[active] = new_x
+        last_steps[active] = numpy.abs(new_x - x)
+
+        done = close | (value == 0.0) | (in_bracket & (high - low < tolerance))
+        converged[active[done]] = True
+        # Unbracketed sets that have gone astray (a zero slope, or an overflow) are given up
+        active = active[~done & numpy.isfinite(new_x)]
+    return log_rates, converged
+
+def xirr(amounts, times, guess=DEFAULT_GUESS, tolerance=DEFAULT_TOLERANCE, \
+         max_iterations=DEFAULT_MAX_ITERATIONS):
+    """
+    Solves the XIRRs of many sets of cash flows, one set per row.
+
+    Parameters:
+    amounts (numpy array, shape (..., n)): The cash flows of each set along the last axis:
+    negative for money invested, positive for money received; 0 for padding.
+    times (numpy array, broadcastable to `amounts`): The time of each flow, in years after the
+    set's first flow.
+    guess (float): The annual rate from which every solution starts.
+
+    Returns:
+    tuple: (annual rates, converged), both shaped like `amounts` without its last axis. A rate
+    is NaN where its set did not converge, e.g. because its flows all have the same sign.
+    """
+    amounts = numpy.asarray(amounts, dtype=numpy.float64)
+    shape = amounts.shape[:-1]
+    n_flows = amounts.shape[-1]
+    amounts = amounts.reshape(-1, n_flows)
+    times = numpy.broadcast_to(times, shape + (n_flows,)).reshape(-1, n_flows)
+
+    def evaluate(x, sets):
+        years = times[sets]
+        discounted = amounts[sets] * numpy.exp(-years * x[:, None])
+        return discounted.sum(axis=1), -(discounted * years).sum(axis=1)
+
+    # Without both an outflow and an inflow there is no rate that balances the flows
+    solvable = (amounts < 0).any(axis=1) & (amounts > 0).any(axis=1)
+    with numpy.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        log_rates, converged = solve(evaluate, solvable, guess, tolerance, max_iterations)
+    rates = numpy.where(converged, numpy.expm1(log_rates), numpy.nan)
+    return rates.reshape(shape), converged.reshape(shape)
+
+def xirr_ragged(amounts, times, set_ids, n_sets, guess=DEFAULT_GUESS, tolerance=DEFAULT_TOLERANCE, \
+                max_iterations=DEFAULT_MAX_ITERATIONS):
+    """
+    Solves the XIRRs of many sets of cash flows of different lengths, given as flat arrays.
+
+    Parameters:
+    amounts (1-D numpy array): The cash flows of all the sets: negative for money invested,
+    positive for money received.
+    times (1-D numpy array): The time of each flow, in years after the first flow of its set.
+    set_ids (1-D numpy int array): The number (0 to n_sets - 1) of the set of each flow. A
+    flow may be repeated with different set numbers, e.g. in a holding and in the portfolio.
+    n_sets (int): The number of sets.
+
+    Returns:
+    tuple: (annual rates, converged), one per set. A rate is NaN where its set did not converge.
+    """
+    amounts = numpy.asarray(amounts, dtype=numpy.float64)
+    times = numpy.asarray(times, dtype=numpy.float64)
+    set_ids = numpy.asarray(set_ids, dtype=numpy.int64)
+    all_x = numpy.zeros(n_sets)
+
+    def evaluate(x, sets):
+        # Every flow is evaluated, at its set's latest log rate; only `sets` are returned
+        all_x[sets] = x
+        discounted = amounts * numpy.exp(-times * all_x[set_ids])
+        value = numpy.bincount(set_ids, weights=discounted, minlength=n_sets)
+        slope = -numpy.bincount(set_ids, weights=discounted * times, minlength=n_sets)
+        return value[sets], slope[sets]
+
+    solvable = (numpy.bincount(set_ids, weights=amounts < 0, minlength=n_sets) > 0) & \
+               (numpy.bincount(set_ids, weights=amounts > 0, minlength=n_sets) > 0)
+    with numpy.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        log_rates, converged = solve(evaluate, solvable, guess, tolerance, max_iterations)
+    return numpy.where(converged, numpy.expm1(log_rates), numpy.nan), converged